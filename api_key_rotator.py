@@ -1,21 +1,257 @@
 """
 API Key Rotator for OpenAI
 Handles API key management and rotation.
+
+Keys are loaded from OPENAI_API_KEYS (comma-separated), OPENAI_API_KEY and
+OPENAI_API_KEY_1, OPENAI_API_KEY_2, ... Each call is routed to the key with
+the most rate-limit headroom, as reported by OpenAI's x-ratelimit-* response
+headers, and keys that return 429 are benched with exponential cool-down.
 """
 import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Mapping, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as '20ms', '1s' or '6m0s' into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _KeyState:
+    """Rate-limit bookkeeping for one API key."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.limit_requests: Optional[int] = None
+        self.limit_tokens: Optional[int] = None
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.in_flight = 0
+        self.benched_until = 0.0
+        self.strikes = 0
+        self.rate_limited = 0
+        # (timestamp, tokens) for calls completed in the last minute
+        self.recent = deque()
+
+    def headroom(self, now: float) -> float:
+        """Fraction of the request/token budget still free, net of calls in flight."""
+        if now >= self.requests_reset_at and self.limit_requests:
+            self.remaining_requests = self.limit_requests
+        if now >= self.tokens_reset_at and self.limit_tokens:
+            self.remaining_tokens = self.limit_tokens
+
+        fractions = []
+        if self.limit_requests and self.remaining_requests is not None:
+            fractions.append((self.remaining_requests - self.in_flight) / self.limit_requests)
+        if self.limit_tokens and self.remaining_tokens is not None:
+            fractions.append(self.remaining_tokens / self.limit_tokens)
+        if not fractions:
+            # No headers seen yet: prefer keys with fewer calls in flight
+            return 1.0 - self.in_flight * 1e-3
+        return min(fractions)
+
+    def per_minute(self, now: float):
+        while self.recent and now - self.recent[0][0] > 60:
+            self.recent.popleft()
+        return len(self.recent), sum(tokens for _, tokens in self.recent)
+
+
+class APIKeyPool:
+    """Schedules OpenAI calls across several API keys by rate-limit headroom."""
+
+    def __init__(self, keys: List[str], base_cooldown: float = 1.0, max_cooldown: float = 60.0):
+        """
+        Args:
+            keys: API keys to rotate between
+            base_cooldown: Seconds a key is benched after its first 429
+            max_cooldown: Upper bound for the exponential cool-down
+        """
+        if not keys:
+            raise ValueError("OPENAI_API_KEY not found in environment variables")
+        self._states = {key: _KeyState(key) for key in keys}
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._states)
+
+    def _best_locked(self, now: float) -> _KeyState:
+        available = [s for s in self._states.values() if s.benched_until <= now]
+        if not available:
+            # Every key is cooling down: use the one that recovers first
+            return min(self._states.values(), key=lambda s: s.benched_until)
+        return max(available, key=lambda s: s.headroom(now))
+
+    def best_key(self) -> str:
+        """Return the key with the most headroom without reserving it."""
+        with self._lock:
+            return self._best_locked(time.monotonic()).key
+
+    def acquire(self) -> str:
+        """
+        Reserve the key with the most headroom for one call.
+
+        Every acquire must be followed by release() or report_rate_limited().
+        """
+        with self._lock:
+            state = self._best_locked(time.monotonic())
+            state.in_flight += 1
+            return state.key
+
+    def release(self, key: str, headers: Optional[Mapping[str, str]] = None, tokens: int = 0):
+        """
+        Finish a call made with ``key`` and record its rate-limit headers.
+
+        Args:
+            key: Key returned by acquire()
+            headers: Response headers (x-ratelimit-*), if available
+            tokens: Tokens used by the call, if known
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return
+            state.in_flight = max(0, state.in_flight - 1)
+            state.strikes = 0
+            state.recent.append((now, tokens))
+            if headers:
+                headers = {k.lower(): v for k, v in headers.items()}
+                state.limit_requests = _parse_int(headers.get("x-ratelimit-limit-requests")) or state.limit_requests
+                state.limit_tokens = _parse_int(headers.get("x-ratelimit-limit-tokens")) or state.limit_tokens
+                remaining = _parse_int(headers.get("x-ratelimit-remaining-requests"))
+                if remaining is not None:
+                    state.remaining_requests = remaining
+                    state.requests_reset_at = now + (_parse_duration(headers.get("x-ratelimit-reset-requests")) or 0)
+                remaining = _parse_int(headers.get("x-ratelimit-remaining-tokens"))
+                if remaining is not None:
+                    state.remaining_tokens = remaining
+                    state.tokens_reset_at = now + (_parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0)
+
+    def report_rate_limited(self, key: str, retry_after: Optional[float] = None):
+        """
+        Finish a call that got a 429 and bench the key.
+
+        The cool-down doubles with each consecutive 429, capped at
+        max_cooldown, and is never shorter than the server's Retry-After.
+        """
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return
+            state.in_flight = max(0, state.in_flight - 1)
+            state.strikes += 1
+            state.rate_limited += 1
+            cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (state.strikes - 1))
+            state.benched_until = time.monotonic() + max(cooldown, retry_after or 0)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-key scheduling state for monitoring (keys are masked)."""
+        now = time.monotonic()
+        with self._lock:
+            result = []
+            for state in self._states.values():
+                requests, tokens = state.per_minute(now)
+                result.append({
+                    "key": f"...{state.key[-4:]}",
+                    "headroom": round(state.headroom(now), 3),
+                    "in_flight": state.in_flight,
+                    "requests_last_minute": requests,
+                    "tokens_last_minute": tokens,
+                    "remaining_requests": state.remaining_requests,
+                    "remaining_tokens": state.remaining_tokens,
+                    "rate_limited": state.rate_limited,
+                    "benched_for": max(0.0, round(state.benched_until - now, 1)),
+                })
+            return result
+
+
+def load_api_keys() -> List[str]:
+    """Collect OpenAI API keys from the environment, without duplicates."""
+    keys = [k.strip() for k in os.getenv("OPENAI_API_KEYS", "").split(",")]
+    keys.append(os.getenv("OPENAI_API_KEY", ""))
+    index = 1
+    while os.getenv(f"OPENAI_API_KEY_{index}"):
+        keys.append(os.getenv(f"OPENAI_API_KEY_{index}"))
+        index += 1
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+_key_pool: Optional[APIKeyPool] = None
+
+
+def get_key_pool() -> APIKeyPool:
+    """Get or create the global API key pool."""
+    global _key_pool
+    if _key_pool is None:
+        _key_pool = APIKeyPool(load_api_keys())
+    return _key_pool
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an exception from the OpenAI client is a 429."""
+    return getattr(error, "status_code", None) == 429
+
+
+# Statuses the OpenAI client itself retries, besides 429
+_TRANSIENT_STATUS = frozenset((408, 409))
+_TRANSIENT_ERRORS = frozenset(("APITimeoutError", "APIConnectionError"))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether an OpenAI call failed in a way worth retrying (timeout, connection, 5xx)."""
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in _TRANSIENT_STATUS or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After header from an OpenAI error, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after")) if headers.get("retry-after") else None
+    except ValueError:
+        return None
+
+
 def get_api_key():
     """
-    Get the OpenAI API key from environment variables.
-    
+    Get the OpenAI API key with the most rate-limit headroom.
+
     Returns:
         str: The OpenAI API key
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables")
-    return api_key
+    return get_key_pool().best_key()
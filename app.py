@@ -5,8 +5,12 @@ import os
 import traceback
 from datetime import datetime, timedelta, timezone
 from bson import ObjectId
-from exam_buddy import get_exam_buddy_response, clear_session_history, get_all_sessions
+from exam_buddy import clear_session_history, get_all_sessions, persists_conversation, screen_question
+from chat_service import stream_response_async
+from guardrails import REFUSAL_MESSAGE
+from language_detect import detect_language, normalize_language
 from auth import login, get_student, logout
+from request_cache import request_scope, invalidate
 from typing import Dict, Any, Optional
 
 # Set page config
@@ -87,58 +91,24 @@ def initialize_session_state():
     if 'context' not in st.session_state:
         st.session_state.context = ""
 
-async def get_response_async(question, session_id, context, **kwargs):
+async def render_streamed_response(placeholder, stream) -> str:
     """
-    Get response from exam buddy asynchronously with conversation history.
+    Render a streamed response into a placeholder as chunks arrive.
     
     Args:
-        question: User's question
-        session_id: Session identifier
-        context: Additional context
-        **kwargs: Additional parameters including 'language'
-    """
-    try:
-        from db_utils import db_manager
+        placeholder: Streamlit placeholder (from st.empty()) to draw into
+        stream: Async iterator of response chunks
         
-        # Check if user is asking about their last question
-        if question.strip().lower() in ["what was the last thing i asked you", 
-                                      "what did i just ask", 
-                                      "repeat my last question"]:
-            history = db_manager.get_conversation(session_id)
-            if history:
-                # Find the last user message (excluding the current question)
-                for msg in reversed(history[:-1]):  # Exclude current message
-                    if msg['role'] == 'user':
-                        return f"You previously asked: \"{msg['content']}\""
-            return "I don't have a record of your previous question. How can I assist you today?"
-        
-        # Get conversation history for context
-        if session_id:
-            history = db_manager.get_conversation(session_id)
-            if history:
-                # Format the last 3 messages for context
-                recent_messages = history[-3:]  # Get last 3 messages
-                history_context = "\nPrevious conversation:\n"
-                for msg in recent_messages:
-                    role = "Student" if msg['role'] == 'user' else "Assistant"
-                    history_context += f"{role}: {msg['content']}\n"
-                # Add history to context
-                if isinstance(context, str):
-                    context = [context, history_context]
-                elif isinstance(context, list):
-                    context.append(history_context)
-                else:
-                    context = [str(context), history_context]
-                    
-    except Exception as e:
-        print(f"Error in get_response_async: {e}")
-    
-    # Get the response with the enhanced context
-    response = await get_exam_buddy_response(question, session_id, context, **kwargs)
-    
-    # Note: We don't save messages here anymore to prevent duplicates
-    # Messages are now saved in the main chat loop
+    Returns:
+        The full response text
+    """
+    response = ""
+    async for chunk in stream:
+        response += chunk
+        placeholder.markdown(response + "▌")
     
+    # Final render with the full formatting applied once
+    placeholder.markdown(format_response(response))
     return response
 
 def display_chat():
@@ -452,6 +422,7 @@ What would you like to start with?"""
                                 {"$set": {"marks": marks_data}},
                                 upsert=True
                             )
+                            invalidate("student")
                             print(f"Saved marks to database for student {student_id}")
                         except Exception as e:
                             print(f"Error saving marks to database: {e}")
@@ -555,14 +526,38 @@ def show_login():
     - Exam strategies
     - And more!""")
 
+def response_language(question: str) -> Optional[str]:
+    """
+    Language to answer in.
+    
+    An explicit sidebar choice is used as is. With "Auto", the language is
+    detected from the first question of the session and pinned, so later
+    turns neither pay for detection nor flip language on a short reply
+    like "ok". The pin is dropped when the selection or session changes.
+    """
+    selection = st.session_state.get('language')
+    if normalize_language(selection):
+        return selection
+    pinned = st.session_state.get('pinned_language')
+    if pinned and pinned[0] == st.session_state.session_id:
+        return pinned[1]
+    detected = detect_language(question)
+    # Questions without letters ("?", "2+2") say nothing; keep detecting
+    if detected.confidence:
+        st.session_state.pinned_language = (st.session_state.session_id, detected.prompt_language)
+    return detected.prompt_language
+
 def show_sidebar():
     """Show sidebar with user controls."""
     with st.sidebar:
-        st.session_state.language = st.selectbox(
+        selection = st.selectbox(
             "Language",
-            ["English", "हिंदी (Hindi)", "தமிழ் (Tamil)", "తెలుగు (Telugu)", "ಕನ್ನಡ (Kannada)", "മലയാളം (Malayalam)"],
+            ["Auto (match my question)", "English", "हिंदी (Hindi)", "தமிழ் (Tamil)", "తెలుగు (Telugu)", "ಕನ್ನಡ (Kannada)", "മലയാളം (Malayalam)"],
             index=0
         )
+        if selection != st.session_state.get('language'):
+            st.session_state.pop('pinned_language', None)
+        st.session_state.language = selection
         
         st.markdown("---")
         
@@ -598,6 +593,15 @@ def get_student_data() -> dict:
 
 def save_message(role: str, content: str):
     """Save a message to the conversation history in the database."""
+    return save_messages([(role, content)])
+
+def save_messages(messages):
+    """
+    Save several messages to the conversation history in one round trip.
+    
+    Args:
+        messages: List of (role, content) tuples, in conversation order
+    """
     if 'session_id' not in st.session_state or not st.session_state.session_id:
         return False
         
@@ -605,56 +609,24 @@ def save_message(role: str, content: str):
         from db_utils import db_manager
         from bson import ObjectId
         
-        # Create message object
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now(timezone.utc)
-        }
+        now = datetime.now(timezone.utc)
+        student_id = ObjectId(st.session_state.student_id) if st.session_state.get('student_id') else None
         
-        # Get the current session
-        session = db_manager.sessions.find_one({
-            "$or": [
-                {"session_id": st.session_state.session_id},
-                {"student_id": ObjectId(st.session_state.student_id) if st.session_state.get('student_id') else None}
-            ]
-        })
+        # Match the session by its ID or by the student's session
+        query = {"$or": [{"session_id": st.session_state.session_id}]}
+        if student_id:
+            query["$or"].append({"student_id": student_id})
         
-        if session:
-            # Get current messages
-            current_messages = session.get('conversation', [])
-            
-            # Add new message
-            current_messages.append(message)
-            
-            # Trim messages if needed (keep last 80 messages)
-            if len(current_messages) > 80:
-                current_messages = current_messages[-80:]
-            
-            # Update the session
-            db_manager.sessions.update_one(
-                {"_id": session["_id"]},
-                {
-                    "$set": {
-                        "conversation": current_messages,
-                        "last_activity": datetime.now(timezone.utc),
-                        "expires_at": datetime.now(timezone.utc) + timedelta(days=7)
-                    }
-                }
-            )
-        else:
-            # Create new session with the first message
-            session_data = {
+        # Atomic append; creates the session with these messages if missing
+        return db_manager.append_messages(
+            query,
+            [{"role": role, "content": content, "timestamp": now} for role, content in messages],
+            on_insert={
                 "session_id": st.session_state.session_id,
-                "student_id": ObjectId(st.session_state.student_id) if st.session_state.get('student_id') else None,
-                "created_at": datetime.now(timezone.utc),
-                "last_activity": datetime.now(timezone.utc),
-                "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
-                "conversation": [message]
+                "student_id": student_id,
+                "created_at": now
             }
-            db_manager.sessions.insert_one(session_data)
-            
-        return True
+        )
         
     except Exception as e:
         print(f"Error saving message: {str(e)}")
@@ -663,41 +635,19 @@ def save_message(role: str, content: str):
         return False
 
 def handle_logout():
-    """Handle user logout, summarize conversation, and store context."""
+    """Handle user logout, queue a conversation summary, and store context."""
     if 'session_id' in st.session_state and 'student_id' in st.session_state:
         try:
-            from db_utils import db_manager
-            from exam_buddy import get_llm_summary
-            
-            # Get the conversation history
-            session = db_manager.sessions.find_one({
-                "$or": [
-                    {"session_id": st.session_state.session_id},
-                    {"student_id": ObjectId(st.session_state.student_id)}
-                ]
-            })
+            from summary_worker import summary_worker
             
-            if session and 'conversation' in session and len(session['conversation']) > 0:
-                # Generate summary of the conversation
-                summary = get_llm_summary(session['conversation'])
-                
-                # Store the summary as context for future sessions
-                db_manager.sessions.update_one(
-                    {"student_id": ObjectId(st.session_state.student_id)},
-                    {
-                        "$set": {
-                            "context": summary,
-                            "last_activity": datetime.now(timezone.utc)
-                        }
-                    },
-                    upsert=True
-                )
+            # Summarize the conversation in the background; the summary is
+            # stored as context for future sessions when it is ready
+            summary_worker.enqueue(st.session_state.student_id, st.session_state.session_id)
             
-            # Update last activity
-            db_manager.sessions.update_one(
-                {"session_id": st.session_state.session_id},
-                {"$set": {"last_activity": datetime.now(timezone.utc)}}
-            )
+            # Update last activity and write it out before the session ends
+            from heartbeat import heartbeat
+            heartbeat.touch_session(st.session_state.session_id)
+            heartbeat.flush()
             
         except Exception as e:
             print(f"Error during logout: {str(e)}")
@@ -710,6 +660,12 @@ def handle_logout():
 
 def main():
     """Main function to run the Streamlit app."""
+    # Read each Mongo document at most once per rerun
+    with request_scope():
+        run_app()
+
+def run_app():
+    """Render one Streamlit rerun of the app."""
     # Initialize session state
     initialize_session_state()
     
@@ -729,7 +685,7 @@ def main():
     if not st.session_state.get('conversation_loaded') and st.session_state.session_id:
         try:
             from db_utils import db_manager
-            history = db_manager.get_conversation(st.session_state.session_id)
+            history = db_manager.get_session_conversation(st.session_state.session_id)
             if history:
                 st.session_state.messages = history
             else:
@@ -799,59 +755,86 @@ def main():
             process_user_input(prompt)
             st.rerun()  # Rerun to update the UI with the new messages
         else:
-            # Save and display user message
-            save_message("user", prompt)
+            # The Mongo history backend records the turn itself
+            chain_persists = persists_conversation()
+            
+            # Display user message; it is saved with the reply, or alone if
+            # the stream is interrupted (see the finally below)
             st.session_state.messages.append({"role": "user", "content": prompt})
             
             # Display user message in chat message container
             with st.chat_message("user"):
                 st.markdown(prompt)
             
+            # Screen the question before the student lookup, so blocked
+            # input is refused without any database reads
+            guard = screen_question(prompt)
+            
             # Get response from exam buddy
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    # Get student data using the utility function
-                    student = get_student_data()
-                    
-                    # Prepare context with student data
-                    context = [
-                        f"Student: {student.get('name', 'Student')}",
-                        f"Exam: {st.session_state.user_info.get('exam_type', 'Not specified')}",
-                        f"Subjects: {', '.join(st.session_state.user_info.get('subjects', ['Not specified']))}"
-                    ]
-                    
-                    if st.session_state.context:
-                        context.append(f"Additional Context: {st.session_state.context}")
-                    
-                    # Add student's marks if available
-                    if 'marks' in student and student['marks']:
-                        context.append("Student's Performance:")
-                        for mark in student['marks']:
-                            context.append(f"- {mark.get('subject', 'Subject')}: {mark.get('marks', 'N/A')}")
-                    
-                    try:
-                        response = asyncio.run(
-                            get_response_async(
+                if not guard.allowed:
+                    st.markdown(REFUSAL_MESSAGE)
+                    save_messages([("user", prompt), ("assistant", REFUSAL_MESSAGE)])
+                    st.session_state.messages.append({"role": "assistant", "content": REFUSAL_MESSAGE})
+                    return
+                
+                # Get student data using the utility function
+                student = get_student_data()
+                
+                # Prepare context with student data
+                context = [
+                    f"Student: {student.get('name', 'Student')}",
+                    f"Exam: {st.session_state.user_info.get('exam_type', 'Not specified')}",
+                    f"Subjects: {', '.join(st.session_state.user_info.get('subjects', ['Not specified']))}"
+                ]
+                
+                if st.session_state.context:
+                    context.append(f"Additional Context: {st.session_state.context}")
+                
+                # Add student's marks if available
+                marks = []
+                if 'marks' in student and student['marks']:
+                    marks.append("Student's Performance:")
+                    for mark in student['marks']:
+                        marks.append(f"- {mark.get('subject', 'Subject')}: {mark.get('marks', 'N/A')}")
+                
+                response = None
+                try:
+                    # Stream the response into the chat bubble as tokens arrive
+                    placeholder = st.empty()
+                    response = asyncio.run(
+                        render_streamed_response(
+                            placeholder,
+                            stream_response_async(
                                 question=prompt,
                                 session_id=st.session_state.session_id,
                                 context="\n".join(context),
-                                language=st.session_state.language
+                                marks="\n".join(marks),
+                                language=response_language(guard.text),
+                                exam_type=st.session_state.user_info.get('exam_type'),
+                                subjects=st.session_state.user_info.get('subjects', []),
+                                student_name=student.get('name', ''),
+                                guard=guard
                             )
                         )
-                        
-                        # Display the response
-                        st.markdown(format_response(response))
-                        
-                        # Save and add assistant response to chat history
-                        save_message("assistant", response)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                        
-                    except Exception as e:
-                        error_msg = f"I encountered an error while generating a response. Please try again.\nError: {str(e)}"
-                        st.error(error_msg)
-                        print(f"Error in chat loop: {str(e)}")
-                        save_message("assistant", error_msg)
-                        st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                    )
+                    
+                    st.session_state.messages.append({"role": "assistant", "content": response})
+                    
+                except Exception as e:
+                    error_msg = f"I encountered an error while generating a response. Please try again.\nError: {str(e)}"
+                    st.error(error_msg)
+                    print(f"Error in chat loop: {str(e)}")
+                    response = error_msg
+                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                
+                finally:
+                    # Save the user message and response in one round trip.
+                    # Also runs when Streamlit stops the script mid-stream
+                    # (its stop/rerun exceptions are BaseExceptions), so the
+                    # question is kept even without a reply.
+                    if not chain_persists:
+                        save_messages([("user", prompt)] + ([("assistant", response)] if response else []))
 
 if __name__ == "__main__":
     main()
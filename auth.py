@@ -1,34 +1,37 @@
 """
 Authentication and session management for Exam Buddy.
 """
-import os
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, Tuple
 from bson import ObjectId
-from pymongo import MongoClient
 from pymongo.errors import PyMongoError
+from db_connection import get_client, get_database
+from request_cache import cached, invalidate
+from heartbeat import heartbeat
+from summary_worker import summary_worker
 from exam_buddy import get_llm_summary
 
-# MongoDB connection
-MONGODB_URI = os.getenv("MONGODB_URI") or os.getenv("MONGO_URI")
-if not MONGODB_URI:
-    raise ValueError("Neither MONGODB_URI nor MONGO_URI environment variable is set")
+# MongoDB collections come from the shared, lazily connected client, so
+# importing this module does no network I/O. The old module attributes
+# (client, db, students, sessions) still resolve via __getattr__ below.
+def _students():
+    return get_database()['student_marks']
 
-client = MongoClient(MONGODB_URI)
-db = client['zenark_db']
-students = db['student_marks']
-sessions = db['exam_buddy_session']
+def _sessions():
+    return get_database()['exam_buddy_session']
 
-# Drop any existing problematic indexes
-try:
-    sessions.drop_indexes()
-except:
-    pass
+def __getattr__(name: str):
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_database()
+    if name == "students":
+        return _students()
+    if name == "sessions":
+        return _sessions()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Create TTL index for session expiration (7 days)
-sessions.create_index("expires_at", expireAfterSeconds=0)
-# Create sparse unique index on student_id to allow multiple nulls
-sessions.create_index("student_id", unique=True, sparse=True)
+# Indexes are managed by db_migrations.py, run once per deploy
 
 def summarize_previous_conversations(student_id: str) -> str:
     """
@@ -36,7 +39,7 @@ def summarize_previous_conversations(student_id: str) -> str:
     """
     try:
         # Get all previous sessions for this student
-        previous_sessions = sessions.find({
+        previous_sessions = _sessions().find({
             "student_id": ObjectId(student_id),
             "conversation": {"$exists": True, "$ne": []}
         }).sort("last_activity", -1).limit(5)  # Get last 5 sessions
@@ -78,13 +81,13 @@ def login(student_id: str, current_session_id: str = None) -> Optional[Dict]:
             return None
             
         # Check if student exists
-        student = students.find_one({"_id": ObjectId(student_id)})
+        student = _students().find_one({"_id": ObjectId(student_id)})
         if not student:
             print(f"Student not found with ID: {student_id}")
             return None
             
         # Check for existing session first
-        existing_session = sessions.find_one(
+        existing_session = _sessions().find_one(
             {"student_id": ObjectId(student_id)},
             sort=[("last_activity", -1)]  # Get the most recent session
         )
@@ -92,6 +95,12 @@ def login(student_id: str, current_session_id: str = None) -> Optional[Dict]:
         now = datetime.utcnow()
         
         if existing_session:
+            # Summarize messages added since the last summary in the background
+            conversation = existing_session.get("conversation") or []
+            message_count = max(existing_session.get("message_count", 0), len(conversation))
+            if conversation and message_count > existing_session.get("summary_watermark", 0):
+                summary_worker.enqueue(student_id, existing_session.get("session_id"))
+            
             # Update existing session
             session_data = {
                 "session_id": current_session_id or existing_session.get("session_id", str(ObjectId())),
@@ -100,10 +109,11 @@ def login(student_id: str, current_session_id: str = None) -> Optional[Dict]:
             }
             
             # Update the existing session
-            sessions.update_one(
+            _sessions().update_one(
                 {"_id": existing_session["_id"]},
                 {"$set": session_data}
             )
+            invalidate("session")
             
             # Return the updated session data
             session_data.update({
@@ -128,7 +138,8 @@ def login(student_id: str, current_session_id: str = None) -> Optional[Dict]:
             }
             
             # Insert the new session
-            result = sessions.insert_one(session_data)
+            result = _sessions().insert_one(session_data)
+            invalidate("session")
             
             # Convert ObjectId to string for JSON serialization
             session_data['_id'] = str(result.inserted_id)
@@ -157,19 +168,22 @@ def get_session(session_id: str) -> Optional[Dict]:
             print(f"Invalid session ID format: {session_id}")
             return None
             
-        # Update last activity and get session
-        session = sessions.find_one_and_update(
+        # Get session (at most once per request)
+        session = cached("session", session_id, lambda: _sessions().find_one(
             {"$or": [
                 {"_id": ObjectId(session_id)},
                 {"session_id": ObjectId(session_id)}
-            ], "expires_at": {"$gt": datetime.utcnow()}},
-            {"$set": {"last_activity": datetime.utcnow()}},
-            return_document=True
-        )
+            ], "expires_at": {"$gt": datetime.utcnow()}}
+        ))
         
         if not session:
             print(f"No active session found for ID: {session_id}")
             return None
+        
+        # Record activity; the heartbeat writes it in a batched flush
+        now = datetime.utcnow()
+        heartbeat.touch(("session", session_id), {"_id": ObjectId(session["_id"])}, now)
+        session['last_activity'] = now
             
         # Convert ObjectId to string for JSON serialization
         if '_id' in session:
@@ -206,7 +220,8 @@ def get_student(session_id: str) -> Optional[Dict]:
             print(f"Session is missing student_id: {session}")
             return None
             
-        student = students.find_one({"_id": ObjectId(session["student_id"])})
+        student = cached("student", session["student_id"],
+                         lambda: _students().find_one({"_id": ObjectId(session["student_id"])}))
         if not student:
             print(f"No student found for ID: {session['student_id']}")
             return None
@@ -238,7 +253,7 @@ def ensure_session_exists(session_id: str, student_id: Optional[str] = None) ->
     """
     try:
         # Check if session exists
-        if sessions.find_one({"$or": [
+        if _sessions().find_one({"$or": [
             {"session_id": session_id},
             {"_id": ObjectId(session_id) if ObjectId.is_valid(session_id) else None}
         ]}):
@@ -256,7 +271,8 @@ def ensure_session_exists(session_id: str, student_id: Optional[str] = None) ->
         if student_id:
             session_data["student_id"] = student_id
             
-        sessions.insert_one(session_data)
+        _sessions().insert_one(session_data)
+        invalidate("session")
         return True
         
     except Exception as e:
@@ -279,7 +295,7 @@ def logout(session_id: str) -> bool:
             return False
             
         # Just update the last_activity timestamp
-        result = sessions.update_one(
+        result = _sessions().update_one(
             {
                 "$or": [
                     {"session_id": session_id},
@@ -293,6 +309,10 @@ def logout(session_id: str) -> bool:
             }
         )
         
+        invalidate("session", session_id)
+        # Written directly above, so drop any buffered touch for it
+        heartbeat.discard_session(session_id)
+        
         if result.modified_count > 0:
             print(f"Successfully logged out from session {session_id}")
             return True
@@ -0,0 +1,97 @@
+"""
+Guardrail microbenchmark for Exam Buddy.
+
+Times the per-message cost of the old guardrails (four re.sub passes plus a
+keyword loop) against GuardrailEngine.check(), for plain questions, ones
+with links or code, and blocked ones, from a short question up to the
+1000-character limit (and one size past it, which is truncated):
+
+    python benchmarks/guardrails_bench.py [--number 2000]
+
+Also checks that both give the same filtered text and verdict on the
+benchmark inputs.
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from guardrails import GuardrailEngine  # noqa: E402
+
+SIZES = [50, 200, 500, 1000, 2000]
+
+_PLAIN = (
+    "How should I revise organic chemistry for NEET in the last month? "
+    "I keep forgetting reaction mechanisms and named reactions. "
+    "Also tips for physics numericals please. "
+)
+
+# Same question with a link and inline code, which the filter strips
+_SAMPLE = (
+    "How should I revise organic chemistry for NEET in the last month? "
+    "I keep forgetting reaction mechanisms, see www.example.com/notes and "
+    "`name reactions` list. Also tips for physics numericals please. "
+)
+
+
+def legacy_filter(text: str) -> str:
+    text = re.sub(r'http\S+|www.\S+', '', text)
+    text = re.sub(r'```.*?```', '', text, flags=re.DOTALL)
+    text = re.sub(r'`.*?`', '', text)
+    if len(text) > 1000:
+        text = text[:1000] + "... [truncated]"
+    return text.strip()
+
+
+def legacy_should_respond(text: str) -> bool:
+    inappropriate_keywords = [
+        'personal information', 'password', 'credit card', 'ssn', 'social security',
+        'illegal', 'hack', 'cheat', 'exam paper', 'leak', 'adult content',
+        'porn', 'violence', 'hate speech', 'discrimination'
+    ]
+    text_lower = text.lower()
+    return not any(keyword in text_lower for keyword in inappropriate_keywords)
+
+
+def make_input(size: int, case: str = "plain") -> str:
+    """Build a benchmark message of ``size`` characters."""
+    sample = _PLAIN if case == "plain" else _SAMPLE
+    text = (sample * (size // len(sample) + 1))[:size]
+    if case == "blocked":
+        text = text[:-len(" exam paper leak")] + " exam paper leak"
+    return text
+
+
+def per_message(func, text: str, number: int) -> float:
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=5)) / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the input guardrails.")
+    parser.add_argument("--number", type=int, default=2000, help="messages per measurement")
+    args = parser.parse_args(argv)
+
+    engine = GuardrailEngine()
+
+    def legacy(text):
+        return legacy_should_respond(legacy_filter(text))
+
+    print(f"{'chars':>6} {'case':>8} {'legacy us':>10} {'check us':>9} {'speedup':>8}")
+    for size in SIZES:
+        for case in ("plain", "markup", "blocked"):
+            text = make_input(size, case)
+            legacy_filtered = legacy_filter(text)
+            result = engine.check(text)
+            assert result.text == legacy_filtered, (size, case)
+            assert result.allowed == legacy_should_respond(legacy_filtered), (size, case)
+
+            old = per_message(legacy, text, args.number)
+            new = per_message(engine.check, text, args.number)
+            print(f"{size:>6} {case:>8} {old * 1e6:>10.2f} {new * 1e6:>9.2f} {old / new:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
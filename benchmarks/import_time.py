@@ -0,0 +1,63 @@
+"""
+Cold-start import benchmark for Exam Buddy.
+
+Imports each module in a fresh interpreter several times and reports the
+median wall time. Compare two trees (e.g. a worktree of an older commit):
+
+    git worktree add /tmp/exam_buddy_base <commit>
+    python benchmarks/import_time.py --tree /tmp/exam_buddy_base
+    python benchmarks/import_time.py
+
+MONGODB_URI defaults to a local address; nothing needs to be listening for
+the lazy tree, while eager trees pay their connection attempt here.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ["exam_buddy", "db_utils", "auth"]
+
+_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+try:
+    import {module}
+    status = "ok"
+except BaseException as e:
+    status = type(e).__name__
+print(f"{{time.perf_counter() - start:.6f}} {{status}} {{len(sys.modules)}}")
+"""
+
+
+def time_import(module: str, tree: str, env: dict):
+    """Import a module in a fresh interpreter and return (seconds, status, modules loaded)."""
+    out = subprocess.run(
+        [sys.executable, "-c", _SNIPPET.format(module=module)],
+        cwd=tree, env=env, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    seconds, status, loaded = out.split()
+    return float(seconds), status, int(loaded)
+
+
+def main():
+    default_tree = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tree", default=default_tree, help="source tree to benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI", "mongodb://127.0.0.1:27017"))
+    args = parser.parse_args()
+
+    env = dict(os.environ, MONGODB_URI=args.uri, PYTHONDONTWRITEBYTECODE="1")
+    print(f"tree: {args.tree}")
+    print(f"{'module':<12} {'median ms':>10} {'min ms':>10} {'max ms':>10} {'modules':>8}  status")
+    for module in MODULES:
+        results = [time_import(module, args.tree, env) for _ in range(args.runs)]
+        times = [r[0] * 1000 for r in results]
+        print(f"{module:<12} {statistics.median(times):>10.1f} {min(times):>10.1f} "
+              f"{max(times):>10.1f} {results[-1][2]:>8}  {results[-1][1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Load test for the Exam Buddy chat path, without calling OpenAI.
+
+Simulates concurrent students sending questions through the same path as
+the Streamlit app: chat_service.stream_response_async (guardrails, recent
+turns from Mongo) -> exam_buddy (session lookup, prompt, LLM) -> the conversation
+saved back to Mongo. The LLM is the local stand-in from fake_llm.py; tune
+it with the EXAM_BUDDY_FAKE_* variables (latency, token delay, 429 and
+timeout rates):
+
+    MONGODB_URI=mongodb://localhost:27017 python benchmarks/load_test.py --users 50 --turns 5
+
+Students and sessions are created for the run (marked load_test) and
+deleted afterwards. The response caches are off unless --caches is given,
+so every turn reaches the model. Reports throughput and time-to-first-chunk
+and total latency percentiles.
+
+What the numbers measure: the real chat path with real MongoDB round trips
+and a simulated model. Every pymongo call on that path runs on a worker
+thread (asyncio.to_thread or the history's executor), so students wait on
+each other only where the app itself would: the Mongo connection pool, the
+rate limiter and the CPU-bound stages. In the app each Streamlit session
+runs its own event loop; here all students share one, so its thread pool
+is sized to --users to not become a bottleneck the app does not have.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS = [
+    "How should I revise organic chemistry for NEET in the last month?",
+    "Give me a weekly plan for JEE Main physics",
+    "How do I remember the periodic table trends?",
+    "I keep making silly mistakes in calculus, what should I do?",
+    "How many mock tests should I take before the exam?",
+    "mujhe physics kaise padhna chahiye, bahut confusion hai",
+]
+
+ERROR_REPLY = "I'm sorry, I encountered an error"
+
+
+def configure(args):
+    """Point the app at the fake LLM before any module reads the settings."""
+    os.environ["EXAM_BUDDY_LLM_BACKEND"] = "fake"
+    # The key pool needs keys; several let 429s rotate between them
+    os.environ.setdefault("OPENAI_API_KEYS", ",".join(f"fake-key-{i}" for i in range(args.keys)))
+    if not args.caches:
+        os.environ["EXAM_BUDDY_RESPONSE_CACHE"] = "off"
+        os.environ["EXAM_BUDDY_PROMPT_CACHE"] = "off"
+
+
+def seed_students(db_manager, users: int):
+    """Create students and log them in; returns [(student_id, session_id)]."""
+    from auth import login
+    result = db_manager.students.insert_many([
+        {"name": f"Load Test {i}", "exam_type": "NEET", "load_test": True} for i in range(users)
+    ])
+    seeded = []
+    for student_id in result.inserted_ids:
+        session = login(str(student_id))
+        seeded.append((student_id, str(session["_id"])))
+    return seeded
+
+
+def cleanup(db_manager, seeded):
+    student_ids = [student_id for student_id, _ in seeded]
+    db_manager.sessions.delete_many({"student_id": {"$in": student_ids}})
+    db_manager.students.delete_many({"_id": {"$in": student_ids}, "load_test": True})
+
+
+def save_turn(db_manager, student_id, session_id, question, response):
+    """Save a turn the way app.save_messages does."""
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc)
+    db_manager.append_messages(
+        {"$or": [{"session_id": session_id}, {"student_id": student_id}]},
+        [
+            {"role": "user", "content": question, "timestamp": now},
+            {"role": "assistant", "content": response, "timestamp": now},
+        ],
+        on_insert={"session_id": session_id, "student_id": student_id, "created_at": now}
+    )
+
+
+async def student(index, student_id, session_id, args, results):
+    from chat_service import stream_response_async
+    from db_utils import db_manager
+    from exam_buddy import persists_conversation
+    from request_cache import request_scope
+
+    context = f"Student: Load Test {index}\nExam: NEET\nSubjects: Physics, Chemistry, Biology"
+    for turn in range(args.turns):
+        question = QUESTIONS[(index + turn) % len(QUESTIONS)]
+        # One Streamlit rerun per question, with its own request cache
+        with request_scope():
+            start = time.perf_counter()
+            first = None
+            parts = []
+            async for chunk in stream_response_async(
+                question, session_id, context, marks="", language=None, exam_type="NEET",
+                subjects=["Physics", "Chemistry", "Biology"], student_name=f"Load Test {index}"
+            ):
+                if first is None:
+                    first = time.perf_counter() - start
+                parts.append(chunk)
+            response = "".join(parts)
+            if not persists_conversation():
+                await asyncio.to_thread(save_turn, db_manager, student_id, session_id, question, response)
+            total = time.perf_counter() - start
+        results.append((first or total, total, response.startswith(ERROR_REPLY)))
+        if args.think:
+            await asyncio.sleep(args.think)
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return {p: (values[0] if values else 0.0) for p in (50, 90, 99)}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {50: cuts[49], 90: cuts[89], 99: cuts[98]}
+
+
+async def run(args, seeded):
+    # One worker per student for the blocking Mongo calls (see module docstring)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(args.users, 4)))
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        student(i, student_id, session_id, args, results)
+        for i, (student_id, session_id) in enumerate(seeded)
+    ))
+    return results, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the chat path against a fake LLM.")
+    parser.add_argument("--users", type=int, default=20, help="concurrent students")
+    parser.add_argument("--turns", type=int, default=5, help="questions per student")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds between a student's questions")
+    parser.add_argument("--keys", type=int, default=3, help="fake API keys in the pool")
+    parser.add_argument("--caches", action="store_true", help="keep the response caches on")
+    args = parser.parse_args(argv)
+
+    configure(args)
+    from db_utils import db_manager
+    from exam_buddy import get_exam_buddy_chain
+
+    get_exam_buddy_chain()  # build outside the timed run
+    seeded = seed_students(db_manager, args.users)
+    try:
+        results, elapsed = asyncio.run(run(args, seeded))
+    finally:
+        cleanup(db_manager, seeded)
+
+    firsts = [first for first, _, _ in results]
+    totals = [total for _, total, _ in results]
+    errors = sum(1 for _, _, failed in results if failed)
+    first_p, total_p = percentiles(firsts), percentiles(totals)
+    print(f"turns: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f} turns/s), errors: {errors}")
+    print(f"{'':>14} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    print(f"{'first chunk':>14} " + " ".join(f"{first_p[p] * 1e3:>8.1f}" for p in (50, 90, 99)))
+    print(f"{'total':>14} " + " ".join(f"{total_p[p] * 1e3:>8.1f}" for p in (50, 90, 99)))
+
+
+if __name__ == "__main__":
+    main()
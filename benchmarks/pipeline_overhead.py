@@ -0,0 +1,254 @@
+"""
+Per-request overhead benchmark for the exam buddy chat path.
+
+Runs the same turn through ExamBuddyPipeline and through the former LCEL
+chain (RunnablePassthrough, RunnableLambda stages copying dicts, wrapped in
+RunnableWithMessageHistory), both on an in-process fake chat model, and
+reports the time per request on top of the bare model call:
+
+    python benchmarks/pipeline_overhead.py [--requests 500] [--history 10]
+
+No network is involved. The response caches are disabled so every request
+renders a prompt and streams from the model, and each request gets a fresh
+in-memory history of --history messages.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_key_rotator import APIKeyPool  # noqa: E402
+from context_builder import ContextBuilder  # noqa: E402
+from guardrails import REFUSAL_MESSAGE, get_guardrails  # noqa: E402
+from language_detect import detect_language  # noqa: E402
+from pipeline import ChatTurn, ExamBuddyPipeline  # noqa: E402
+from prompts import registry as prompt_registry  # noqa: E402
+from rate_limiter import RateLimiter, estimate_tokens  # noqa: E402
+
+QUESTION = "How should I revise organic chemistry for NEET in the last month?"
+
+RESPONSE = (
+    "- Focus on named reactions and their mechanisms\n"
+    "- Make one page of reagent charts per chapter\n"
+    "- Solve 30 NCERT-level problems daily\n"
+    "- Take a full mock every Sunday and review mistakes"
+)
+
+INPUTS = {
+    "question": QUESTION,
+    "context": "Class 12 student, target NEET 2026",
+    "summary": "Student struggles with organic chemistry mechanisms.",
+    "marks": "Physics: 62\nChemistry: 48\nBiology: 81",
+    "recent_turns": [],
+    "language": None,
+    "student_key": "bench-student",
+    "exam_type": "NEET",
+}
+
+
+def make_llm():
+    """A fake chat model that streams RESPONSE word by word, forever."""
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    return GenericFakeChatModel(messages=itertools.repeat(AIMessage(content=RESPONSE)))
+
+
+def make_history_factory(size: int):
+    from langchain_community.chat_message_histories import ChatMessageHistory
+    from langchain_core.messages import AIMessage, HumanMessage
+    base = [
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=f"Earlier message {i} about chemistry revision.")
+        for i in range(size)
+    ]
+    return lambda session_id: ChatMessageHistory(messages=list(base))
+
+
+def build_legacy_chain(pipeline: ExamBuddyPipeline):
+    """The chain create_exam_buddy_chain() built before the pipeline, caches disabled."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+    from langchain_core.runnables.history import RunnableWithMessageHistory
+
+    key_pool, rate_limiter = pipeline.key_pool, pipeline.rate_limiter
+    context_builder, variant = pipeline.context_builder, pipeline.variant
+    output_parser = StrOutputParser()
+
+    def apply_guardrails(inputs):
+        guard = inputs.get("guard") or get_guardrails().check(inputs.get("question", ""))
+        if not guard.allowed:
+            return {"response": REFUSAL_MESSAGE}
+        language = inputs.get("language") or detect_language(guard.text).prompt_language
+        return {
+            **{k: v for k, v in inputs.items() if k not in ("question", "guard")},
+            "question": guard.text,
+            "language": language
+        }
+
+    def as_runnable(func):
+        async def afunc(x):
+            return func(x)
+        return RunnableLambda(func, afunc=afunc)
+
+    input_processor = {
+        "question": lambda x: x["question"],
+        "context": lambda x: x.get("context", ""),
+        "history": lambda x: x.get("history", []),
+    }
+
+    def render_prompt(x):
+        language = x["processed"].get("language") or "English"
+        budgeted = context_builder.build(
+            x["processed"]["question"],
+            system_tokens=prompt_registry.fixed_tokens(variant, language),
+            summary=x["processed"].get("summary", ""),
+            profile=x["processed"].get("context", ""),
+            marks=x["processed"].get("marks", ""),
+            history=x["processed"].get("history", []),
+            recent_turns=x["processed"].get("recent_turns"),
+        )
+        return prompt_registry.render_chat(
+            variant, language,
+            context=budgeted["context"],
+            history=budgeted["history"],
+            question=budgeted["question"],
+            tokens=sum(budgeted["usage"].values())
+        )
+
+    def quota_request(x, processed):
+        return x["processed"].get("student_key", "anonymous"), estimate_tokens(processed.to_string())
+
+    def process_with_llm(x):
+        if "response" in x["processed"]:
+            yield x["processed"]["response"]
+            return
+        processed = render_prompt(x)
+        rate_limiter.acquire_blocking(*quota_request(x, processed))
+        key = key_pool.acquire()
+        headers = None
+        for chunk in pipeline.llm_factory(key).stream(processed):
+            headers = headers or chunk.response_metadata.get("headers")
+            text = output_parser.invoke(chunk)
+            if text:
+                yield text
+        key_pool.release(key, headers)
+
+    async def aprocess_with_llm(x):
+        if "response" in x["processed"]:
+            yield x["processed"]["response"]
+            return
+        processed = render_prompt(x)
+        await rate_limiter.acquire(*quota_request(x, processed))
+        key = key_pool.acquire()
+        headers = None
+        async for chunk in pipeline.llm_factory(key).astream(processed):
+            headers = headers or chunk.response_metadata.get("headers")
+            text = output_parser.invoke(chunk)
+            if text:
+                yield text
+        key_pool.release(key, headers)
+
+    chain = RunnablePassthrough()
+    chain = chain | as_runnable(
+        lambda x: {
+            **{k: v(x) for k, v in input_processor.items()},
+            **{k: v for k, v in x.items() if k not in input_processor}
+        }
+    )
+    chain = chain | as_runnable(lambda x: {"processed": apply_guardrails(x)})
+    chain = chain | RunnableLambda(process_with_llm, afunc=aprocess_with_llm)
+    return RunnableWithMessageHistory(
+        chain,
+        pipeline.history_factory,
+        input_messages_key="question",
+        history_messages_key="history"
+    )
+
+
+def make_pipeline(history_size: int) -> ExamBuddyPipeline:
+    llm = make_llm()
+    return ExamBuddyPipeline(
+        make_history_factory(history_size),
+        llm_factory=lambda key: llm,
+        key_pool=APIKeyPool(["bench-key"]),
+        rate_limiter=RateLimiter(10 ** 9, 10 ** 12),
+        response_cache=None,
+        prompt_cache=None,
+        context_builder=ContextBuilder(),
+    )
+
+
+def baseline_prompt(pipeline: ExamBuddyPipeline):
+    """The rendered prompt of the benchmark turn, for timing the bare model."""
+    turn = ChatTurn.from_inputs(INPUTS, "bench")
+    pipeline.guard(turn)
+    pipeline.render(turn, pipeline.history_factory("bench").messages)
+    return turn.prompt
+
+
+def time_sync(call, requests: int) -> float:
+    call()
+    start = time.perf_counter()
+    for _ in range(requests):
+        call()
+    return (time.perf_counter() - start) / requests
+
+
+def time_async(call, requests: int) -> float:
+    async def run():
+        await call()
+        start = time.perf_counter()
+        for _ in range(requests):
+            await call()
+        return (time.perf_counter() - start) / requests
+    return asyncio.run(run())
+
+
+async def _drain(stream):
+    async for _ in stream:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the exam buddy chain overhead.")
+    parser.add_argument("--requests", type=int, default=500, help="requests per measurement")
+    parser.add_argument("--history", type=int, default=10, help="history messages per session")
+    args = parser.parse_args(argv)
+
+    pipeline = make_pipeline(args.history)
+    legacy = build_legacy_chain(pipeline)
+    config = {"configurable": {"session_id": "bench"}}
+    prompt = baseline_prompt(pipeline)
+    llm = pipeline.llm_factory("bench-key")
+
+    # Both must produce the same text before they are worth comparing
+    assert pipeline.invoke(INPUTS, session_id="bench") == RESPONSE
+    assert legacy.invoke(INPUTS, config=config) == RESPONSE
+
+    n = args.requests
+    rows = [
+        ("invoke", time_sync(lambda: "".join(c.content for c in llm.stream(prompt)), n),
+         time_sync(lambda: legacy.invoke(INPUTS, config=config), n),
+         time_sync(lambda: pipeline.invoke(INPUTS, session_id="bench"), n)),
+        ("ainvoke", time_async(lambda: _drain(llm.astream(prompt)), n),
+         time_async(lambda: legacy.ainvoke(INPUTS, config=config), n),
+         time_async(lambda: pipeline.ainvoke(INPUTS, session_id="bench"), n)),
+        ("astream", time_async(lambda: _drain(llm.astream(prompt)), n),
+         time_async(lambda: _drain(legacy.astream(INPUTS, config=config)), n),
+         time_async(lambda: _drain(pipeline.astream(INPUTS, session_id="bench")), n)),
+    ]
+
+    print(f"{'call':>8} {'model us':>9} {'chain us':>9} {'pipeline us':>12} {'chain ovh':>10} {'pipe ovh':>9} {'speedup':>8}")
+    for name, model, old, new in rows:
+        old_overhead, new_overhead = old - model, new - model
+        print(
+            f"{name:>8} {model * 1e6:>9.1f} {old * 1e6:>9.1f} {new * 1e6:>12.1f} "
+            f"{old_overhead * 1e6:>10.1f} {new_overhead * 1e6:>9.1f} {old_overhead / new_overhead:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
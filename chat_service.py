@@ -0,0 +1,125 @@
+"""
+Chat service for Exam Buddy.
+The non-UI half of a chat turn: guardrails, canned replies and recent
+turns from MongoDB, then the exam buddy chain. The Streamlit app and
+benchmarks/load_test.py both call it, so the load test runs the app's
+chat path without importing Streamlit.
+"""
+import asyncio
+
+from exam_buddy import (
+    get_exam_buddy_response,
+    persists_conversation,
+    record_turn,
+    screen_question,
+    stream_exam_buddy_response,
+)
+from guardrails import REFUSAL_MESSAGE
+
+
+def prepare_response_context(question, session_id):
+    """
+    Resolve canned replies and load recent conversation turns.
+    
+    Args:
+        question: User's question
+        session_id: Session identifier
+        
+    Returns:
+        Tuple of (canned_reply, recent_turns). canned_reply is None when the
+        question should go to the exam buddy; recent_turns are the last
+        stored messages, which the exam buddy fits into its prompt budget.
+    """
+    recent_turns = []
+    try:
+        from db_utils import db_manager
+        
+        # Check if user is asking about their last question
+        if question.strip().lower() in ["what was the last thing i asked you", 
+                                      "what did i just ask", 
+                                      "repeat my last question"]:
+            history = db_manager.get_session_conversation(session_id)
+            if history:
+                # Find the last user message (the current question is saved
+                # together with the reply, so it is not in the history yet)
+                for msg in reversed(history):
+                    if msg['role'] == 'user':
+                        return f"You previously asked: \"{msg['content']}\"", recent_turns
+            return "I don't have a record of your previous question. How can I assist you today?", recent_turns
+        
+        # Get recent conversation turns for context
+        if session_id:
+            history = db_manager.get_session_conversation(session_id)
+            if history:
+                recent_turns = [
+                    {"role": msg['role'], "content": msg['content']}
+                    for msg in history[-6:]
+                ]
+                    
+    except Exception as e:
+        print(f"Error in prepare_response_context: {e}")
+    
+    return None, recent_turns
+
+
+async def get_response_async(question, session_id, context, **kwargs):
+    """
+    Get response from exam buddy asynchronously with conversation history.
+    
+    Args:
+        question: User's question
+        session_id: Session identifier
+        context: Student profile and additional context
+        **kwargs: Additional parameters including 'language', 'exam_type',
+            'subjects', 'student_name', 'marks' and 'guard' (a
+            screen_question() result, if already screened)
+    """
+    # Blocked questions are refused before any database work
+    guard = kwargs.pop("guard", None) or screen_question(question)
+    if not guard.allowed:
+        return REFUSAL_MESSAGE
+    
+    # pymongo is blocking; keep the lookups off the event loop
+    canned_reply, recent_turns = await asyncio.to_thread(prepare_response_context, question, session_id)
+    if canned_reply is not None:
+        # The chain never sees this turn, so its history cannot save it
+        if persists_conversation():
+            await record_turn(session_id, question, canned_reply)
+        return canned_reply
+    
+    # Get the response with the enhanced context
+    response = await get_exam_buddy_response(
+        question, session_id, context, recent_turns=recent_turns, guard=guard, **kwargs
+    )
+    
+    # Note: We don't save messages here anymore to prevent duplicates
+    # Messages are now saved in the main chat loop
+    
+    return response
+
+
+async def stream_response_async(question, session_id, context, **kwargs):
+    """
+    Stream the exam buddy's response chunk by chunk.
+    
+    Same arguments as get_response_async. Canned replies are yielded whole.
+    """
+    # Blocked questions are refused before any database work
+    guard = kwargs.pop("guard", None) or screen_question(question)
+    if not guard.allowed:
+        yield REFUSAL_MESSAGE
+        return
+    
+    # pymongo is blocking; keep the lookups off the event loop
+    canned_reply, recent_turns = await asyncio.to_thread(prepare_response_context, question, session_id)
+    if canned_reply is not None:
+        yield canned_reply
+        # The chain never sees this turn, so its history cannot save it
+        if persists_conversation():
+            await record_turn(session_id, question, canned_reply)
+        return
+    
+    async for chunk in stream_exam_buddy_response(
+        question, session_id, context, recent_turns=recent_turns, guard=guard, **kwargs
+    ):
+        yield chunk
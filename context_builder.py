@@ -0,0 +1,245 @@
+"""
+Token-budgeted context assembly for Exam Buddy.
+Splits a fixed prompt budget between the system prompt, conversation
+summary, student profile, marks, recent turns and the question, trimming
+each part deterministically so prompt size stays flat as conversations grow.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+# Rough characters-per-token ratio when tiktoken is not installed
+_CHARS_PER_TOKEN = 4
+_ELLIPSIS = "…"
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken if available, else estimate from length."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    Trim text to at most ``max_tokens`` tokens.
+
+    Args:
+        text: Text to trim
+        max_tokens: Token budget
+        keep: "head" keeps the beginning, "tail" keeps the end
+
+    Returns:
+        The text, cut with an ellipsis if it was over budget
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        kept = tokens[:max_tokens - 1] if keep == "head" else tokens[-(max_tokens - 1):]
+        kept_text = encoding.decode(kept) if max_tokens > 1 else ""
+    else:
+        chars = (max_tokens - 1) * _CHARS_PER_TOKEN
+        kept_text = text[:chars] if keep == "head" else text[-chars:] if chars else ""
+    return kept_text + _ELLIPSIS if keep == "head" else _ELLIPSIS + kept_text
+
+
+def _message_text(message: Any) -> str:
+    if isinstance(message, dict):
+        return str(message.get("content", ""))
+    return str(getattr(message, "content", ""))
+
+
+def _message_role(message: Any) -> str:
+    if isinstance(message, dict):
+        return "Student" if message.get("role") == "user" else "Assistant"
+    return "Student" if getattr(message, "type", "") == "human" else "Assistant"
+
+
+class ContextBuilder:
+    """
+    Allocates a prompt token budget across the parts of a chat turn.
+
+    The question and system prompt are always kept (the question trimmed
+    to ``question_tokens``). Summary, profile and marks get fixed caps;
+    whatever they leave unused goes to recent turns, which are kept newest
+    first as whole messages. Given the same inputs, the output is always
+    the same.
+
+    The chat history window starts at a multiple of ``history_block``
+    messages into the conversation, so it stays put for several turns and
+    then jumps a whole block, instead of dropping a message or two every
+    turn. Until it jumps, the system message and history form the same
+    leading tokens on every call, which OpenAI's prompt caching can reuse.
+    """
+
+    # Per-message overhead of the chat format (role markers, separators)
+    MESSAGE_OVERHEAD = 4
+
+    def __init__(
+        self,
+        max_prompt_tokens: int = 3000,
+        question_tokens: int = 500,
+        summary_tokens: int = 400,
+        profile_tokens: int = 300,
+        marks_tokens: int = 300,
+        history_block: int = 10,
+    ):
+        """
+        Args:
+            max_prompt_tokens: Budget for the whole rendered prompt
+            question_tokens: Cap for the student's question
+            summary_tokens: Cap for the rolling conversation summary
+            profile_tokens: Cap for the student profile and extra context
+            marks_tokens: Cap for the student's marks
+            history_block: Messages the history window moves by at once
+                (even, so it opens on a question, and well under what the
+                budget holds); 1 disables alignment
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.question_tokens = question_tokens
+        self.summary_tokens = summary_tokens
+        self.profile_tokens = profile_tokens
+        self.marks_tokens = marks_tokens
+        self.history_block = max(1, history_block)
+
+    def build(
+        self,
+        question: str,
+        system_tokens: int = 0,
+        summary: str = "",
+        profile: str = "",
+        marks: str = "",
+        history: Optional[Sequence[Any]] = None,
+        recent_turns: Optional[Sequence[Dict[str, Any]]] = None,
+        history_offset: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Fit one turn's context into the prompt budget.
+
+        Args:
+            question: The student's question
+            system_tokens: Tokens used by the system prompt template
+            summary: Summary of earlier conversation
+            profile: Student profile and additional context
+            marks: Student's marks
+            history: Chat history messages for the prompt's history slot
+            recent_turns: Stored messages ({'role', 'content'}) used only
+                when there is no chat history, e.g. after a restart
+            history_offset: Messages of the conversation before ``history``
+                (sliced off by the store), so blocks are counted from the
+                start of the conversation
+
+        Returns:
+            Dict with 'question', 'context' (text for the system prompt),
+            'history' (messages that fit) and 'usage' (tokens per part)
+        """
+        question = truncate_to_tokens(question, self.question_tokens, keep="head")
+        summary = truncate_to_tokens(summary.strip(), self.summary_tokens, keep="head")
+        profile = truncate_to_tokens(profile.strip(), self.profile_tokens, keep="head")
+        marks = truncate_to_tokens(marks.strip(), self.marks_tokens, keep="head")
+
+        usage = {
+            "system": system_tokens,
+            "question": count_tokens(question) + self.MESSAGE_OVERHEAD,
+            "summary": count_tokens(summary),
+            "profile": count_tokens(profile),
+            "marks": count_tokens(marks),
+        }
+        remaining = self.max_prompt_tokens - sum(usage.values())
+
+        history = list(history or [])
+        kept_history = []
+        recent_text = ""
+        if history:
+            kept_history, used = self._fit_messages(
+                history, remaining, offset=history_offset, block=self.history_block
+            )
+        else:
+            lines, used = [], 0
+            for message in self._fit_messages(list(recent_turns or []), remaining)[0]:
+                lines.append(f"{_message_role(message)}: {_message_text(message)}")
+            if lines:
+                recent_text = "Previous conversation:\n" + "\n".join(lines)
+                used = count_tokens(recent_text)
+        usage["history"] = used
+
+        sections = [s for s in (summary, profile, marks, recent_text) if s]
+        return {
+            "question": question,
+            "context": "\n\n".join(sections),
+            "history": kept_history,
+            "usage": usage,
+        }
+
+    def _fit_messages(self, messages: List[Any], budget: int, offset: int = 0, block: int = 1):
+        """
+        Keep the newest whole messages that fit in ``budget`` tokens.
+
+        The start is then moved forward to the next multiple of ``block``,
+        counting ``offset`` earlier messages, unless that would leave no
+        messages at all.
+        """
+        start, used, costs = len(messages), 0, {}
+        while start:
+            cost = count_tokens(_message_text(messages[start - 1])) + self.MESSAGE_OVERHEAD
+            if used + cost > budget:
+                break
+            start -= 1
+            costs[start] = cost
+            used += cost
+        aligned = start + -(offset + start) % block
+        if aligned < len(messages):
+            start = aligned
+        # Don't open the window on an assistant reply to a dropped question
+        while 0 < start < len(messages) and _message_role(messages[start]) == "Assistant":
+            start += 1
+        return messages[start:], sum(costs[i] for i in range(start, len(messages)))
+
+
+_context_builder: Optional[ContextBuilder] = None
+
+
+def get_context_builder() -> ContextBuilder:
+    """
+    Get the process-wide context builder.
+
+    The budget comes from EXAM_BUDDY_PROMPT_TOKENS, with per-part caps from
+    EXAM_BUDDY_QUESTION_TOKENS, EXAM_BUDDY_SUMMARY_TOKENS,
+    EXAM_BUDDY_PROFILE_TOKENS and EXAM_BUDDY_MARKS_TOKENS, and the history
+    window step from EXAM_BUDDY_HISTORY_BLOCK.
+    """
+    global _context_builder
+    if _context_builder is None:
+        _context_builder = ContextBuilder(
+            max_prompt_tokens=int(os.getenv("EXAM_BUDDY_PROMPT_TOKENS", "3000")),
+            question_tokens=int(os.getenv("EXAM_BUDDY_QUESTION_TOKENS", "500")),
+            summary_tokens=int(os.getenv("EXAM_BUDDY_SUMMARY_TOKENS", "400")),
+            profile_tokens=int(os.getenv("EXAM_BUDDY_PROFILE_TOKENS", "300")),
+            marks_tokens=int(os.getenv("EXAM_BUDDY_MARKS_TOKENS", "300")),
+            history_block=int(os.getenv("EXAM_BUDDY_HISTORY_BLOCK", "10")),
+        )
+    return _context_builder
@@ -0,0 +1,174 @@
+"""
+MongoDB connection management for Exam Buddy.
+Provides one shared, lazily connected client (and connection pool) per process.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring, server_api
+
+# MONGODB_URI usually lives in .env; load it here so entry points that only
+# touch the database (e.g. `python db_migrations.py`) see it too
+load_dotenv()
+
+DATABASE_NAME = 'zenark_db'
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection-pool statistics for monitoring."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.checked_out = 0
+        self.open_connections = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.pool_clears = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checked_out": self.checked_out,
+                "open_connections": self.open_connections,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_wait_ms": self.total_wait_ms / self.checkouts if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+                "pool_clears": self.pool_clears,
+            }
+
+    def _wait_ms(self) -> float:
+        # Check-out started and finished events fire on the same thread
+        started = getattr(self._local, "checkout_started", None)
+        self._local.checkout_started = None
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        self._wait_ms()
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+_pool_stats = PoolStatsListener()
+
+
+def get_mongo_uri() -> str:
+    """Return the MongoDB URI from MONGODB_URI or MONGO_URI."""
+    uri = os.getenv("MONGODB_URI") or os.getenv("MONGO_URI")
+    if not uri:
+        raise ValueError("Neither MONGODB_URI nor MONGO_URI environment variable is set")
+    return uri
+
+
+def get_client() -> MongoClient:
+    """
+    Get the shared MongoClient, creating it on first use.
+
+    The client is created with ``connect=False``, so no connection is opened
+    until the first operation. Pool settings come from the environment:
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS and
+    MONGO_WAIT_QUEUE_TIMEOUT_MS.
+
+    Returns:
+        MongoClient: The process-wide client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    get_mongo_uri(),
+                    server_api=server_api.ServerApi('1'),
+                    connect=False,
+                    connectTimeoutMS=5000,
+                    serverSelectionTimeoutMS=5000,
+                    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+                    minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+                    maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+                    waitQueueTimeoutMS=int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+                    event_listeners=[_pool_stats]
+                )
+    return _client
+
+
+def get_database():
+    """Get the Exam Buddy database from the shared client."""
+    return get_client()[DATABASE_NAME]
+
+
+def session_filter(session_id: str) -> Dict:
+    """Match a session document by its session_id or its _id."""
+    clauses = [{"session_id": session_id}]
+    if ObjectId.is_valid(session_id):
+        clauses.append({"_id": ObjectId(session_id)})
+    return {"$or": clauses}
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Get connection-pool statistics for monitoring.
+
+    Returns:
+        Dict with checked-out and open connection counts, check-out totals
+        and failures, and average/max check-out wait time in milliseconds
+    """
+    stats = _pool_stats.snapshot()
+    stats["max_pool_size"] = _client.options.pool_options.max_pool_size if _client else None
+    return stats
+
+
+def close_client():
+    """Close the shared client. The next get_client() call opens a new one."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
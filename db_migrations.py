@@ -0,0 +1,212 @@
+"""
+Index and data migrations for Exam Buddy.
+Compares the indexes the app needs against what exists and builds only the
+missing ones, then backfills fields that older sessions lack. Run once per
+deploy as an explicit step:
+
+    python db_migrations.py [--dry-run] [--drop-conflicting]
+"""
+import argparse
+from typing import Any, Dict, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
+
+from db_connection import get_database
+
+# Options that change what an index does. Anything else (name, version,
+# background, ...) is ignored when comparing against existing indexes.
+_SIGNIFICANT_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+# Desired indexes per collection
+INDEX_SPECS: Dict[str, List[Dict[str, Any]]] = {
+    "exam_buddy_session": [
+        # TTL index for session expiration (7 days, set on each document)
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)],
+         "options": {"expireAfterSeconds": 0}},
+        {"name": "session_id_unique", "keys": [("session_id", 1)],
+         "options": {"unique": True}},
+        # Sparse so sessions without a student_id don't collide
+        {"name": "student_id_unique_sparse", "keys": [("student_id", 1)],
+         "options": {"unique": True, "sparse": True}},
+    ],
+    "summary_jobs": [
+        # At most one pending/running summary job per student
+        {"name": "summary_jobs_active_student", "keys": [("student_id", 1)],
+         "options": {"unique": True, "partialFilterExpression": {"active": True}}},
+        {"name": "summary_jobs_due", "keys": [("status", 1), ("next_attempt_at", 1)],
+         "options": {}},
+    ],
+    "student_marks": [
+        {"name": "student_marks_id_unique", "keys": [("student_id", 1)],
+         "options": {"unique": True, "sparse": True}},
+    ],
+}
+
+
+def _freeze(value):
+    """Make option values such as partialFilterExpression hashable."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _signature(keys, options: Dict[str, Any]):
+    """Normalize an index definition so equivalent indexes compare equal."""
+    return (
+        tuple((field, direction) for field, direction in keys),
+        tuple(
+            (opt, _freeze(options[opt])) for opt in _SIGNIFICANT_OPTIONS
+            # expireAfterSeconds=0 is meaningful, so compare by identity
+            if options.get(opt) is not None and options.get(opt) is not False
+        ),
+    )
+
+
+def plan_index_changes(db=None) -> List[Dict[str, Any]]:
+    """
+    Diff the desired indexes against the existing ones.
+
+    An existing index with the same keys and options satisfies a spec even
+    if its name differs, so indexes created by older code are not rebuilt.
+
+    Args:
+        db: Database to inspect (defaults to the shared Exam Buddy database)
+
+    Returns:
+        List of actions, each with 'collection', 'action' ('create' or
+        'conflict'), 'name', 'keys', 'options' and, for conflicts, 'existing'
+    """
+    db = db if db is not None else get_database()
+    actions = []
+    for coll_name, specs in INDEX_SPECS.items():
+        existing = db[coll_name].index_information()
+        existing_by_sig = {
+            _signature(info["key"], info): name
+            for name, info in existing.items()
+        }
+        existing_by_keys = {tuple(info["key"]): name for name, info in existing.items()}
+
+        for spec in specs:
+            sig = _signature(spec["keys"], spec["options"])
+            if sig in existing_by_sig:
+                continue
+            action = {
+                "collection": coll_name,
+                "action": "create",
+                "name": spec["name"],
+                "keys": spec["keys"],
+                "options": spec["options"],
+            }
+            # Same keys or same name with different options cannot coexist
+            clash = existing_by_keys.get(tuple(spec["keys"]))
+            if clash is None and spec["name"] in existing:
+                clash = spec["name"]
+            if clash is not None:
+                action["action"] = "conflict"
+                action["existing"] = clash
+            actions.append(action)
+    return actions
+
+
+def migrate_indexes(db=None, dry_run: bool = False, drop_conflicting: bool = False) -> List[Dict[str, Any]]:
+    """
+    Build missing indexes in the background. Safe to run repeatedly.
+
+    Args:
+        db: Database to migrate (defaults to the shared Exam Buddy database)
+        dry_run: Only report the planned actions
+        drop_conflicting: Drop an existing index whose options differ from
+            the spec and rebuild it. Without this, conflicts are reported
+            and left alone.
+
+    Returns:
+        List of planned actions (see plan_index_changes)
+    """
+    db = db if db is not None else get_database()
+    actions = plan_index_changes(db)
+    if dry_run:
+        return actions
+
+    for action in actions:
+        coll = db[action["collection"]]
+        try:
+            if action["action"] == "conflict":
+                if not drop_conflicting:
+                    print(f"⚠️ Index {action['existing']} on {action['collection']} conflicts with "
+                          f"{action['name']}; rerun with --drop-conflicting to replace it")
+                    continue
+                coll.drop_index(action["existing"])
+            coll.create_indexes([
+                IndexModel(action["keys"], name=action["name"], background=True, **action["options"])
+            ])
+            print(f"✅ Created index {action['name']} on {action['collection']}")
+        except PyMongoError as e:
+            print(f"❌ Error creating index {action['name']} on {action['collection']}: {e}")
+    return actions
+
+
+# Sessions whose message_count is missing or smaller than the messages they
+# still hold: written before the counter existed, or counted only since
+_STALE_MESSAGE_COUNT = {
+    "$expr": {
+        "$and": [
+            {"$isArray": "$conversation"},
+            {"$lt": [{"$ifNull": ["$message_count", 0]}, {"$size": "$conversation"}]},
+        ]
+    }
+}
+
+
+def backfill_message_counts(db=None, dry_run: bool = False) -> int:
+    """
+    Give older sessions a message_count the summary watermark can rely on.
+
+    Sessions from before the counter have none, and the first $inc then
+    starts it near zero while the conversation is already at its $slice
+    cap, so new turns never pass the watermark. Their count becomes the
+    stored messages plus whatever was counted since. That can overcount by
+    the few messages added before this ran, which only re-summarizes them,
+    never skips them. Safe to run repeatedly.
+
+    Args:
+        db: Database to migrate (defaults to the shared Exam Buddy database)
+        dry_run: Only count the sessions that need it
+
+    Returns:
+        Number of sessions that were (or would be) updated
+    """
+    db = db if db is not None else get_database()
+    sessions = db["exam_buddy_session"]
+    if dry_run:
+        return sessions.count_documents(_STALE_MESSAGE_COUNT)
+    result = sessions.update_many(_STALE_MESSAGE_COUNT, [
+        {"$set": {"message_count": {"$add": [{"$size": "$conversation"}, {"$ifNull": ["$message_count", 0]}]}}}
+    ])
+    return result.modified_count
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Create missing Exam Buddy indexes.")
+    parser.add_argument("--dry-run", action="store_true", help="only print the planned changes")
+    parser.add_argument("--drop-conflicting", action="store_true",
+                        help="replace existing indexes whose options differ from the spec")
+    args = parser.parse_args(argv)
+
+    actions = migrate_indexes(dry_run=args.dry_run, drop_conflicting=args.drop_conflicting)
+    if not actions:
+        print("✅ Database indexes are up to date")
+    elif args.dry_run:
+        for action in actions:
+            print(f"{action['action']}: {action['collection']}.{action['name']} {action['keys']} {action['options']}")
+
+    backfilled = backfill_message_counts(dry_run=args.dry_run)
+    if backfilled:
+        verb = "would backfill" if args.dry_run else "✅ Backfilled"
+        print(f"{verb} message_count on {backfilled} session(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,92 +2,47 @@
 Database utilities for Exam Buddy.
 Handles all database operations with proper connection management.
 """
-import os
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
-from pymongo import MongoClient, server_api
 from pymongo.errors import PyMongoError
+from db_connection import get_client, get_database, get_mongo_uri, get_pool_stats, session_filter
+from request_cache import cached, invalidate
+from heartbeat import heartbeat
 
 class MongoDBManager:
     """MongoDB database manager for Exam Buddy."""
     
     def __init__(self):
-        """Initialize MongoDB connection and setup collections."""
+        """
+        Set up collections on the shared client.
+        
+        No connection is opened here; the client connects on the first
+        operation. Call ping() to check connectivity explicitly.
+        """
         # Try MONGODB_URI first, fall back to MONGO_URI if not found
-        self.uri = os.getenv("MONGODB_URI") or os.getenv("MONGO_URI")
-        if not self.uri:
-            raise ValueError("Neither MONGODB_URI nor MONGO_URI environment variable is set")
-            
-        print(f"🔌 Connecting to MongoDB...")
-        print(f"   URI: {self.uri}")
+        self.uri = get_mongo_uri()
         
+        # Use the process-wide client so auth and db_utils share one pool
+        self.client = get_client()
+        
+        # Set the database
+        self.db = get_database()
+        
+        # Initialize collections
+        self.sessions = self.db['exam_buddy_session']
+        self.students = self.db['student_marks']
+        
+        # Indexes are managed by db_migrations.py, run once per deploy
+
+    def ping(self) -> bool:
+        """Check that the MongoDB server is reachable."""
         try:
-            # Connect with a 5-second timeout
-            self.client = MongoClient(
-                self.uri, 
-                server_api=server_api.ServerApi('1'),
-                connectTimeoutMS=5000,
-                serverSelectionTimeoutMS=5000
-            )
-            
-            # Test the connection
             self.client.admin.command('ping')
             print("✅ Successfully connected to MongoDB!")
-            
-            # Set the database
-            self.db = self.client['zenark_db']
-            
-            # Initialize collections
-            self.sessions = self.db['exam_buddy_session']
-            self.students = self.db['student_marks']
-            
-            # Create indexes
-            self._create_indexes()
-            
-            # Print database info
-            #self._print_db_info()
-            
+            return True
         except Exception as e:
             print(f"❌ Failed to connect to MongoDB: {e}")
-            raise
-
-    def _create_indexes(self):
-        """Create necessary indexes for optimal query performance."""
-        try:
-            # Drop all existing indexes first to avoid conflicts
-            self.sessions.drop_indexes()
-            
-            # TTL index for session expiration (7 days)
-            self.sessions.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
-            
-            # Index for faster lookups - sparse unique index on student_id
-            self.sessions.create_index(
-                "session_id", 
-                unique=True, 
-                name="session_id_unique"
-            )
-            
-            # Sparse unique index on student_id to allow multiple nulls
-            self.sessions.create_index(
-                [("student_id", 1)], 
-                unique=True, 
-                sparse=True,
-                name="student_id_unique_sparse"
-            )
-            
-            # Index for student marks
-            self.students.create_index(
-                "student_id", 
-                unique=True, 
-                sparse=True,  # Allow multiple null values
-                name="student_marks_id_unique"
-            )
-            
-            print("✅ Database indexes created/verified")
-            
-        except Exception as e:
-            print(f"❌ Error creating indexes: {e}")
-            print("⚠️ Continuing with existing indexes...")
+            return False
 
     def _print_db_info(self):
         """Print database information for debugging."""
@@ -117,15 +72,20 @@ class MongoDBManager:
         except Exception as e:
             print(f"⚠️ Could not print database info: {e}")
 
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Get connection-pool statistics for monitoring."""
+        return get_pool_stats()
+
     # Session management methods
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Get session by ID and update last activity timestamp."""
         try:
-            return self.sessions.find_one_and_update(
-                {"session_id": session_id},
-                {"$set": {"last_activity": datetime.utcnow()}},
-                return_document=True
-            )
+            session = cached("session", ("by_session_id", session_id),
+                             lambda: self.sessions.find_one({"session_id": session_id}))
+            if session:
+                # Batched by the heartbeat instead of a write per lookup
+                heartbeat.touch_session(session_id)
+            return session
         except PyMongoError as e:
             print(f"Error getting session: {e}")
             return None
@@ -134,6 +94,7 @@ class MongoDBManager:
         """Create a new session and return the session ID."""
         try:
             result = self.sessions.insert_one(session_data)
+            invalidate("session")
             return str(result.inserted_id)
         except PyMongoError as e:
             print(f"Error creating session: {e}")
@@ -146,6 +107,7 @@ class MongoDBManager:
                 {"session_id": session_id},
                 {"$set": update_data}
             )
+            invalidate("session")
             return result.modified_count > 0
         except PyMongoError as e:
             print(f"Error updating session: {e}")
@@ -155,7 +117,8 @@ class MongoDBManager:
     def get_student(self, student_id: str) -> Optional[Dict]:
         """Get student by ID."""
         try:
-            student = self.students.find_one({"student_id": student_id})
+            student = cached("student", ("by_student_id", student_id),
+                             lambda: self.students.find_one({"student_id": student_id}))
             if student and '_id' in student:
                 student['_id'] = str(student['_id'])
             return student
@@ -171,46 +134,88 @@ class MongoDBManager:
                 {"$set": update_data},
                 upsert=True
             )
+            invalidate("student")
             return result.modified_count > 0 or result.upserted_id is not None
         except PyMongoError as e:
             print(f"Error updating student: {e}")
             return False
 
     # Message management methods
-    def save_message(self, student_id: str, role: str, content: str) -> bool:
-        """Save a message to the conversation history."""
+    def append_messages(
+        self,
+        query: Dict,
+        messages: List[Dict],
+        max_messages: int = 80,
+        on_insert: Optional[Dict] = None
+    ) -> bool:
+        """
+        Atomically append messages to a session's conversation in one round trip.
+        
+        Uses $push with $each/$slice, so concurrent writers never overwrite
+        each other's messages and only the new messages go over the wire.
+        
+        Args:
+            query: Filter matching the session document
+            messages: Message dicts with 'role', 'content' and 'timestamp'
+            max_messages: Number of most recent messages to keep
+            on_insert: Fields to set if no session matches and one is created
+            
+        Returns:
+            bool: True if the session was updated or created
+        """
         try:
-            message = {
-                "role": role,
-                "content": content,
-                "timestamp": datetime.utcnow()
+            now = datetime.utcnow()
+            update = {
+                "$push": {"conversation": {"$each": messages, "$slice": -max_messages}},
+                # Total ever appended, so summaries can track a watermark
+                # even after old messages are sliced off
+                "$inc": {"message_count": len(messages)},
+                "$set": {
+                    "last_activity": now,
+                    "expires_at": now + timedelta(days=7)
+                }
             }
+            if on_insert:
+                update["$setOnInsert"] = on_insert
             
-            # Update the conversation in the session
-            result = self.sessions.update_one(
-                {"student_id": student_id},
-                {
-                    "$push": {"conversation": {"$each": [message], "$slice": -80}},  # Keep last 80 messages
-                    "$set": {
-                        "last_activity": datetime.utcnow(),
-                        "expires_at": datetime.utcnow() + timedelta(days=7)
-                    }
-                },
-                upsert=True
-            )
-            
+            result = self.sessions.update_one(query, update, upsert=True)
+            invalidate("conversation")
+            invalidate("session")
             return result.modified_count > 0 or result.upserted_id is not None
         except PyMongoError as e:
-            print(f"Error saving message: {e}")
+            print(f"Error saving messages: {e}")
             return False
 
+    def save_message(self, student_id: str, role: str, content: str) -> bool:
+        """Save a message to the conversation history."""
+        message = {
+            "role": role,
+            "content": content,
+            "timestamp": datetime.utcnow()
+        }
+        
+        # Update the conversation in the session, keeping the last 80 messages
+        return self.append_messages({"student_id": student_id}, [message])
+
     def get_conversation(self, student_id: str, limit: int = 80) -> List[Dict]:
         """Get conversation for a student."""
         try:
-            session = self.sessions.find_one(
+            session = cached("conversation", (student_id, limit), lambda: self.sessions.find_one(
                 {"student_id": student_id},
                 {"conversation": {"$slice": -limit}}  # Get last N messages
-            )
+            ))
+            return session.get("conversation", []) if session else []
+        except PyMongoError as e:
+            print(f"Error getting conversation: {e}")
+            return []
+
+    def get_session_conversation(self, session_id: str, limit: int = 80) -> List[Dict]:
+        """Get the conversation of a session, matched by its session_id or _id."""
+        try:
+            session = cached("conversation", ("session", session_id, limit), lambda: self.sessions.find_one(
+                session_filter(session_id),
+                {"conversation": {"$slice": -limit}}  # Get last N messages
+            ))
             return session.get("conversation", []) if session else []
         except PyMongoError as e:
             print(f"Error getting conversation: {e}")
@@ -225,6 +230,7 @@ class MongoDBManager:
                 {"$set": {"context": context}},
                 upsert=True
             )
+            invalidate("session")
             return result.modified_count > 0 or result.upserted_id is not None
         except PyMongoError as e:
             print(f"Error saving context: {e}")
@@ -233,10 +239,10 @@ class MongoDBManager:
     def get_context(self, student_id: str) -> str:
         """Get context for a student's session."""
         try:
-            session = self.sessions.find_one(
+            session = cached("session", ("context", student_id), lambda: self.sessions.find_one(
                 {"student_id": student_id},
                 {"context": 1}
-            )
+            ))
             return session.get("context", "") if session else ""
         except PyMongoError as e:
             print(f"Error getting context: {e}")
@@ -255,10 +261,10 @@ class MongoDBManager:
         """
         try:
             # Get the most recent session for the student
-            session = self.sessions.find_one(
+            session = cached("conversation", ("recent", student_id), lambda: self.sessions.find_one(
                 {"student_id": student_id},
                 sort=[("last_activity", -1)]  # Get most recent session first
-            )
+            ))
             
             if not session or "conversation" not in session:
                 return []
@@ -270,5 +276,20 @@ class MongoDBManager:
             print(f"Error getting recent messages: {e}")
             return []
 
-# Create a global instance
-db_manager = MongoDBManager()
\ No newline at end of file
+# Global instance, created on first access (``from db_utils import db_manager``
+# or ``db_utils.db_manager``) rather than at import time
+_db_manager: Optional[MongoDBManager] = None
+
+
+def get_db_manager() -> MongoDBManager:
+    """Get or create the global MongoDBManager."""
+    global _db_manager
+    if _db_manager is None:
+        _db_manager = MongoDBManager()
+    return _db_manager
+
+
+def __getattr__(name: str):
+    if name == "db_manager":
+        return get_db_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,16 +3,23 @@ Exam Buddy Module
 Provides specialized study coaching for Indian competitive exams (JEE, NEET, etc.)
 """
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from api_key_rotator import get_api_key
+# LangChain is imported inside the functions that need it, so importing this
+# module (and auth/app, which import it) stays cheap on cold starts and reruns
+from api_key_rotator import get_key_pool, get_retry_after, is_rate_limit_error
+from rate_limiter import estimate_tokens, get_rate_limiter
+from llm_clients import get_chat_model
+from pipeline import ERROR_RESPONSE, ExamBuddyPipeline
+# EXAM_BUDDY_SYSTEM_PROMPT is the registry's "mentor" prompt variant
+from prompts import EXAM_BUDDY_SYSTEM_PROMPT, registry as prompt_registry
+from guardrails import REFUSAL_MESSAGE, GuardrailResult, get_guardrails
+from language_detect import normalize_language
+import asyncio
 import logging
-import re
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+from typing import Optional, Dict, Any, List, AsyncIterator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain_community.chat_message_histories import ChatMessageHistory
+    from session_store import SessionHistoryStore
 
 logger = logging.getLogger("zenark.exam_buddy")
 
@@ -51,41 +58,69 @@ MOTIVATIONAL_QUOTES = [
     "The beautiful thing about learning is nobody can take it away from you. – B.B. King"
 ]
 
-EXAM_BUDDY_SYSTEM_PROMPT = """You are an experienced mentor who has successfully cracked competitive exams like JEE Main, NEET, IIT, NIT. Provide direct, actionable study guidance.
-
-STRICT RULES:
-1. RESPONSE LENGTH:
-   - ALL responses MUST be 5 lines or less
-   - ONLY exceed 5 lines for:
-     * Study schedules (daily/weekly plans)
-     * Step-by-step problem solutions
-     * When explicitly asked for more details
-   - When exceeding 5 lines, keep it as concise as possible
-
-2. CONTENT GUIDELINES:
-   - Never explain concepts - only provide direct study guidance
-   - Focus on what to study, not why to study it
-   - Use bullet points for better readability
-   - Skip all motivational content and quotes
-   - Be direct and to the point
-
-3. RESPONSE FORMAT:
-   - Topic/Chapter to focus on
-   - Key points to remember
-   - Recommended practice problems
-   - Time allocation (if applicable)
-
-Current user context: {context}
-
-Example of a good response:
-- Focus on Organic Chemistry reactions
-- Practice named reactions daily
-- Solve 10 problems from NCERT
-- Allocate 2 hours daily
-- Review mistakes next day"""
-
-# In-memory session storage (for production, use MongoDB)
-_session_store = {}
+# In-memory session storage, bounded by size, idle TTL and messages per session.
+# Created on first use by _get_session_store.
+_session_store: Optional["SessionHistoryStore"] = None
+
+
+def _get_session_store() -> "SessionHistoryStore":
+    """Get or create the session-history store."""
+    global _session_store
+    if _session_store is None:
+        from session_store import create_session_store_from_env
+        _session_store = create_session_store_from_env()
+    return _session_store
+
+
+def set_session_store(store: "SessionHistoryStore"):
+    """
+    Replace the store backing get_session_history.
+    
+    Args:
+        store: Any SessionHistoryStore implementation
+    """
+    global _session_store
+    _session_store = store
+
+
+def persists_conversation() -> bool:
+    """
+    Whether the chain's history backend already writes turns to MongoDB.
+    
+    When True, callers should not save the same messages separately.
+    """
+    from session_store import history_backend
+    return history_backend() == "mongo"
+
+
+def get_session_store_stats() -> Dict[str, Any]:
+    """Return size and eviction metrics for the session-history store."""
+    return _get_session_store().stats()
+
+
+def get_guardrail_stats() -> Dict[str, Any]:
+    """Return counts of screened and blocked student messages."""
+    return get_guardrails().stats()
+
+
+def get_prompt_stats() -> Dict[str, Any]:
+    """Return rendered token counts per prompt template."""
+    return prompt_registry.stats()
+
+
+def get_pipeline_stats() -> Dict[str, int]:
+    """Return chat turns by outcome (refused, cached or answered by the LLM)."""
+    return get_exam_buddy_chain().stats()
+
+
+def screen_question(question: str) -> "GuardrailResult":
+    """
+    Run the input guardrails on a student's question.
+    
+    Callers check this before any database or LLM work, and pass the result
+    on as ``guard=`` so the question is not screened twice.
+    """
+    return get_guardrails().screen(question)
 
 def get_conversation_summary(conversation: List[Dict[str, Any]]) -> str:
     """Generate a summary of the conversation history."""
@@ -105,13 +140,14 @@ def get_conversation_summary(conversation: List[Dict[str, Any]]) -> str:
             return ""
             
         # Create a prompt for summarization
+        conversation_text = "\n".join(formatted)
         prompt = f"""
         Please summarize the following conversation between a student and their tutor.
         Focus on key topics discussed, study areas, and any important decisions made.
         Keep the summary concise but informative (2-3 paragraphs max).
         
         Conversation:
-        {"\n".join(formatted)}
+        {conversation_text}
         
         Summary:
         """
@@ -148,7 +184,7 @@ def get_conversation_summary(conversation: List[Dict[str, Any]]) -> str:
         return ""
 
 
-def get_session_history(session_id: str) -> ChatMessageHistory:
+def get_session_history(session_id: str) -> "ChatMessageHistory":
     """
     Retrieve or create chat history for a session.
     
@@ -158,9 +194,20 @@ def get_session_history(session_id: str) -> ChatMessageHistory:
     Returns:
         ChatMessageHistory object for the session
     """
-    if session_id not in _session_store:
-        _session_store[session_id] = ChatMessageHistory()
-    return _session_store[session_id]
+    return _get_session_store().get(session_id)
+
+
+async def record_turn(session_id: str, question: str, response: str):
+    """
+    Add a turn the pipeline did not answer (e.g. a canned reply) to the session history.
+    
+    With the Mongo history backend this is what saves the turn, since
+    callers skip their own save when persists_conversation() is True.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+    await get_session_history(session_id).aadd_messages(
+        [HumanMessage(content=question), AIMessage(content=response)]
+    )
 
 
 def filter_user_input(text: str) -> str:
@@ -168,169 +215,72 @@ def filter_user_input(text: str) -> str:
     Filter and clean user input before sending to LLM.
     Removes any potentially harmful or off-topic content.
     """
-    # Remove any URLs
-    text = re.sub(r'http\S+|www.\S+', '', text)
-    
-    # Remove any special characters or code blocks that might be used for injection
-    text = re.sub(r'```.*?```', '', text, flags=re.DOTALL)
-    text = re.sub(r'`.*?`', '', text)
-    
-    # Truncate very long inputs to prevent abuse
-    max_length = 1000
-    if len(text) > max_length:
-        text = text[:max_length] + "... [truncated]"
-    
-    return text.strip()
+    return get_guardrails().filter(text)
 
 def should_respond_to_input(text: str) -> bool:
     """
     Check if the input is appropriate for the exam buddy to respond to.
     Returns True if the input is appropriate, False otherwise.
     """
-    # List of inappropriate topics
-    inappropriate_keywords = [
-        'personal information', 'password', 'credit card', 'ssn', 'social security',
-        'illegal', 'hack', 'cheat', 'exam paper', 'leak', 'adult content',
-        'porn', 'violence', 'hate speech', 'discrimination'
-    ]
-    
-    text_lower = text.lower()
-    return not any(keyword in text_lower for keyword in inappropriate_keywords)
+    return get_guardrails().is_allowed(text)
 
-def create_exam_buddy_chain():
+def create_exam_buddy_chain() -> "ExamBuddyPipeline":
     """
-    Create the exam buddy conversational chain with memory and guardrails.
+    Create the exam buddy pipeline with memory and guardrails.
     
     Returns:
-        RunnableWithMessageHistory chain with guardrails
+        ExamBuddyPipeline reading and saving the session histories
     """
-    # Initialize LLM with API key rotation
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7, openai_api_key=get_api_key())
-    
-    # Enhanced system prompt with guardrails
-    system_prompt = """You are a friendly and knowledgeable study coach specialized in helping Indian teenage students prepare for competitive exams like JEE Main, NEET, IIT, NIT, etc.
-
-Your expertise includes:
-- Effective study techniques and time management
-- Memory enhancement tricks for formulas, equations, and periodic tables
-- Subject-specific strategies for Chemistry, Mathematics, Physics, and Biology
-- Exam preparation psychology and stress management
-- Indian education system specific advice
-
-IMPORTANT RULES:
-1. You must ONLY respond to questions related to exam preparation, study techniques, and academic guidance.
-2. If asked about inappropriate topics, politely decline and guide the conversation back to exam preparation.
-3. Never provide direct answers to exam questions or engage in academic dishonesty.
-4. Always respond in the same language as the user's question, unless they specifically ask for another language.
-5. If the user switches languages, respond in the same language they used in their last message.
-6. If you're unsure about an answer, say so rather than providing incorrect information.
-
-Current user context: {context}
-
-User's preferred language: {language}"""
-    
-    # Create prompt template with history and language support
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        MessagesPlaceholder(variable_name="history"),
-        ("human", "{question}")
-    ])
-    
-    # Create chain with output parsing
-    output_parser = StrOutputParser()
-    
-    # Add guardrail checks
-    def apply_guardrails(inputs: Dict[str, Any]) -> Dict[str, Any]:
-        """Apply guardrails to the input."""
-        question = inputs.get("question", "")
-        
-        # Filter the input
-        filtered_question = filter_user_input(question)
-        
-        # Check if we should respond to this input
-        if not should_respond_to_input(filtered_question):
-            return {
-                "response": "I'm sorry, but I can only assist with exam preparation and study-related questions. Is there something about your studies I can help you with?"
-            }
-            
-        # Detect language (simple check for now, could be enhanced)
-        language = "English"  # default
-        if any(char >= '\u0900' and char <= '\u097F' for char in question):
-            language = "Hindi"
-        elif any(char >= '\u0B80' and char <= '\u0BFF' for char in question):
-            language = "Tamil"
-            
-        return {
-            "question": filtered_question,
-            "language": language,
-            **{k: v for k, v in inputs.items() if k != "question"}
-        }
-    
-    try:
-        from langchain_core.runnables import RunnableLambda, RunnablePassthrough
-        from langchain_core.runnables.config import RunnableConfig
-    except ImportError:
-        # Fallback for older versions
-        from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-        from langchain.schema.runnable.config import RunnableConfig
-
-    # Create the processing chain using RunnableLambda for better compatibility
-    input_processor = {
-        "question": lambda x: x["question"],
-        "context": lambda x: x.get("context", ""),
-        "history": lambda x: x.get("history", []),
-    }
-    
-    # Create the processing steps
-    chain = RunnablePassthrough()
-    
-    # Add the input processing step
-    chain = chain | RunnableLambda(
-        lambda x: {
-            **{k: v(x) for k, v in input_processor.items()},
-            **{k: v for k, v in x.items() if k not in input_processor}
-        }
-    )
-    
-    # Add the guardrails step
-    chain = chain | RunnableLambda(
-        lambda x: {"processed": apply_guardrails(x)}
-    )
-    
-    # Add the LLM processing step
-    def process_with_llm(x):
-        # Process the input through the LLM
-        processed = prompt.invoke({
-            "question": x["processed"]["question"],
-            "context": x["processed"].get("context", ""),
-            "history": x["processed"].get("history", []),
-            "language": x["processed"].get("language", "English")
-        })
-        
-        # Get the LLM response
-        llm_response = llm.invoke(processed)
-        
-        # Parse the output
-        response = output_parser.invoke(llm_response)
-        
-        return {"response": response, **x}
-    
-    chain = chain | RunnableLambda(process_with_llm)
-    
-    # Final response formatting
-    chain = chain | RunnableLambda(
-        lambda x: x.get("response", "I'm not sure how to respond to that.")
-    )
-    
-    # Wrap with message history
-    conversational_chain = RunnableWithMessageHistory(
-        chain,
-        get_session_history,
-        input_messages_key="question",
-        history_messages_key="history"
+    return ExamBuddyPipeline(get_session_history)
+
+
+def generate_summary(conversation_history: list, previous_summary: str = "") -> str:
+    """
+    Summarize a conversation with the LLM, raising on failure.
+
+    Used by the background summary worker, which retries failed jobs.
+    Interactive callers should use get_llm_summary().
+
+    Args:
+        conversation_history: List of conversation messages with 'role' and 'content' keys
+        previous_summary: Summary of earlier messages to fold the new ones into
+
+    Returns:
+        str: Generated summary
+    """
+    if not conversation_history:
+        return previous_summary or "No previous conversation history."
+
+    # Prepare the conversation text for summarization
+    conversation_text = "\n".join(
+        f"{msg.get('role', 'user').capitalize()}: {msg.get('content', '')}"
+        for msg in conversation_history
     )
+
+    # Create a prompt for summarization
+    if previous_summary:
+        prompt = prompt_registry.render_text(
+            "summary_update", summary=previous_summary, conversation=conversation_text
+        )
+    else:
+        prompt = prompt_registry.render_text("summary", conversation=conversation_text)
     
-    return conversational_chain
+    # Get the summary from the LLM, on the key with the most headroom
+    get_rate_limiter().acquire_blocking("summaries", estimate_tokens(prompt))
+    key_pool = get_key_pool()
+    key = key_pool.acquire()
+    llm = get_chat_model("gpt-3.5-turbo", 0.3, key, include_response_headers=True)
+
+    try:
+        summary = llm.invoke(prompt)
+    except Exception as e:
+        if is_rate_limit_error(e):
+            key_pool.report_rate_limited(key, get_retry_after(e))
+        else:
+            key_pool.release(key)
+        raise
+    key_pool.release(key, summary.response_metadata.get("headers"))
+    return summary.content.strip()
 
 
 def get_llm_summary(conversation_history: list) -> str:
@@ -344,34 +294,7 @@ def get_llm_summary(conversation_history: list) -> str:
         str: Generated summary
     """
     try:
-        if not conversation_history:
-            return "No previous conversation history."
-            
-        # Prepare the conversation text for summarization
-        conversation_text = "\n".join(
-            f"{msg.get('role', 'user').capitalize()}: {msg.get('content', '')}"
-            for msg in conversation_history
-        )
-        
-        # Create a prompt for summarization
-        prompt = f"""Please summarize the following conversation history for context in future interactions.
-Focus on key points, decisions, and important information. Keep it concise (3-5 sentences).
-
-Conversation History:
-{conversation_text}
-
-Summary:"""
-        
-        # Get the summary from the LLM
-        llm = ChatOpenAI(
-            temperature=0.3,
-            model_name="gpt-3.5-turbo",
-            openai_api_key=get_api_key()
-        )
-        
-        summary = llm.invoke(prompt)
-        return summary.content.strip()
-        
+        return generate_summary(conversation_history)
     except Exception as e:
         print(f"Error generating summary: {str(e)}")
         import traceback
@@ -382,14 +305,74 @@ Summary:"""
 _exam_buddy_chain = None
 
 
-def get_exam_buddy_chain():
-    """Get or create the global exam buddy chain instance."""
+def get_exam_buddy_chain() -> "ExamBuddyPipeline":
+    """Get or create the global exam buddy pipeline."""
     global _exam_buddy_chain
     if _exam_buddy_chain is None:
         _exam_buddy_chain = create_exam_buddy_chain()
     return _exam_buddy_chain
 
 
+async def _prepare_chain_input(
+    question: str,
+    session_id: str,
+    context: str,
+    exam_type: Optional[str] = None,
+    marks: str = "",
+    recent_turns: Optional[List[Dict]] = None,
+    language: Optional[str] = None,
+    subjects: Optional[List[str]] = None,
+    student_name: str = ""
+):
+    """
+    Build the chain input for a question and look up the current session.
+    
+    Args:
+        question: User's question about exam preparation
+        session_id: Session identifier for conversation history
+        context: Additional context about the user (profile)
+        exam_type: Exam the student is preparing for (partitions the response cache)
+        marks: The student's marks, one subject per line
+        recent_turns: Recent stored messages, used when the chain has no history
+        language: Selected response language (e.g. "Tamil" or "தமிழ் (Tamil)");
+            detected from the question when None or "Auto"
+        subjects: The student's subjects (scope the shared response cache)
+        student_name: Keeps answers that name the student out of that cache
+        
+    Returns:
+        Tuple of (input_data, session) where session may be None
+    """
+    # Get the current session to include context. pymongo is blocking,
+    # so run the lookup in a worker thread instead of stalling the loop.
+    from auth import get_session
+    session = await asyncio.to_thread(get_session, session_id)
+    # Summary of earlier sessions; the chain fits it into the prompt budget
+    # together with the profile, marks and recent turns
+    session_context = session.get('context', '') if session else ''
+    
+    # Prepare the input
+    input_data = {
+        "question": question,
+        "context": context if isinstance(context, str) else "\n".join(map(str, context)),
+        "summary": session_context or "",
+        "marks": marks,
+        "recent_turns": recent_turns or [],
+        "language": normalize_language(language),
+        # Rate-limiter fairness is per student, falling back to the session
+        "student_key": (session or {}).get('student_id') or session_id,
+        "exam_type": exam_type,
+        "subjects": subjects or [],
+        "student_name": student_name
+    }
+    return input_data, session
+
+
+def _touch_session(session_id: str):
+    """Record activity on the session after a completed turn (batched by the heartbeat)."""
+    from heartbeat import heartbeat
+    heartbeat.touch_session(session_id)
+
+
 async def get_exam_buddy_response(
     question: str,
     session_id: str = "default",
@@ -403,55 +386,106 @@ async def get_exam_buddy_response(
         question: User's question about exam preparation
         session_id: Session identifier for conversation history
         context: Additional context about the user
-        **kwargs: Additional parameters including 'language' for response language
+        **kwargs: Additional parameters including 'language' for response language,
+            'exam_type', 'subjects' and 'student_name' for the response cache,
+            'marks', 'recent_turns' and 'guard' (a screen_question() result,
+            if already screened)
         
     Returns:
         Exam buddy's response as a string
     """
     try:
+        # Refuse blocked input before touching the session, history or LLM
+        guard = kwargs.get("guard") or screen_question(question)
+        if not guard.allowed:
+            return REFUSAL_MESSAGE
+        
         # Get the exam buddy chain
         chain = get_exam_buddy_chain()
         
-        # Get the session history
-        history = get_session_history(session_id)
-        
-        # Get the current session to include context
-        from auth import get_session
-        session = get_session(session_id)
-        session_context = session.get('context', '') if session else ''
-        
-        # Combine with any additional context
-        full_context = f"{session_context}\n\n{context}".strip()
-        
-        # Prepare the input
-        input_data = {
-            "question": question,
-            "context": full_context
-        }
+        input_data, session = await _prepare_chain_input(
+            question, session_id, context,
+            exam_type=kwargs.get("exam_type"),
+            marks=kwargs.get("marks", ""),
+            recent_turns=kwargs.get("recent_turns"),
+            language=kwargs.get("language"),
+            subjects=kwargs.get("subjects"),
+            student_name=kwargs.get("student_name", "")
+        )
+        input_data["guard"] = guard
         
         # Get the response
-        response = chain.invoke(
-            input_data,
-            config={"configurable": {"session_id": session_id}}
-        )
+        response = await chain.ainvoke(input_data, session_id=session_id)
         
         # Update the session with the latest context
         if session:
-            from db_utils import db_manager
-            db_manager.sessions.update_one(
-                {"session_id": session_id},
-                {"$set": {"last_activity": datetime.utcnow()}}
-            )
+            _touch_session(session_id)
         
         return response
         
     except Exception as e:
         logger.error(f"Error in get_exam_buddy_response: {str(e)}")
-        return "I'm sorry, I encountered an error while processing your request. Please try again later."
-        return (
-            "I'm having some technical difficulties right now. "
-            "Please try asking your question again in a moment."
+        return ERROR_RESPONSE
+
+
+async def stream_exam_buddy_response(
+    question: str,
+    session_id: str = "default",
+    context: str = "",
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    Stream a response from the exam buddy as the model produces it.
+    
+    Same pipeline as get_exam_buddy_response, but yields text chunks as they
+    arrive from the model. The session history records the full response
+    once the stream completes.
+    
+    Args:
+        question: User's question about exam preparation
+        session_id: Session identifier for conversation history
+        context: Additional context about the user
+        **kwargs: Additional parameters including 'language' for response language,
+            'exam_type', 'subjects' and 'student_name' for the response cache,
+            'marks', 'recent_turns' and 'guard' (a screen_question() result,
+            if already screened)
+        
+    Yields:
+        Chunks of the exam buddy's response
+    """
+    emitted = False
+    try:
+        # Refuse blocked input before touching the session, history or LLM
+        guard = kwargs.get("guard") or screen_question(question)
+        if not guard.allowed:
+            yield REFUSAL_MESSAGE
+            return
+        
+        chain = get_exam_buddy_chain()
+        
+        input_data, session = await _prepare_chain_input(
+            question, session_id, context,
+            exam_type=kwargs.get("exam_type"),
+            marks=kwargs.get("marks", ""),
+            recent_turns=kwargs.get("recent_turns"),
+            language=kwargs.get("language"),
+            subjects=kwargs.get("subjects"),
+            student_name=kwargs.get("student_name", "")
         )
+        input_data["guard"] = guard
+        
+        async for chunk in chain.astream(input_data, session_id=session_id):
+            if chunk:
+                emitted = True
+                yield chunk
+        
+        if session:
+            _touch_session(session_id)
+        
+    except Exception as e:
+        logger.error(f"Error in stream_exam_buddy_response: {str(e)}")
+        if not emitted:
+            yield ERROR_RESPONSE
 
 
 def clear_session_history(session_id: str):
@@ -461,8 +495,7 @@ def clear_session_history(session_id: str):
     Args:
         session_id: Session identifier to clear
     """
-    if session_id in _session_store:
-        del _session_store[session_id]
+    if _get_session_store().delete(session_id):
         logger.info(f"Cleared session history for {session_id}")
 
 
@@ -473,4 +506,4 @@ def get_all_sessions():
     Returns:
         List of session IDs
     """
-    return list(_session_store.keys())
+    return _get_session_store().session_ids()
@@ -0,0 +1,170 @@
+"""
+Local stand-in for the OpenAI chat model, for load tests.
+Selected with EXAM_BUDDY_LLM_BACKEND=fake (see llm_clients.get_chat_model).
+It answers every prompt with canned study advice, streamed token by token
+after a configurable first-token latency, and can fail a share of calls
+with 429s or timeouts. Nothing leaves the process.
+
+Settings (environment):
+    EXAM_BUDDY_FAKE_LATENCY          seconds before the first token (0.3)
+    EXAM_BUDDY_FAKE_TOKEN_DELAY      seconds between tokens (0.02)
+    EXAM_BUDDY_FAKE_TOKENS           tokens per response (60)
+    EXAM_BUDDY_FAKE_RATE_LIMIT_RATE  share of calls answered with a 429 (0)
+    EXAM_BUDDY_FAKE_RETRY_AFTER      retry-after sent with a 429, seconds (1)
+    EXAM_BUDDY_FAKE_TIMEOUT_RATE     share of calls that time out (0)
+    EXAM_BUDDY_FAKE_TIMEOUT          seconds a timed-out call hangs first (10)
+    EXAM_BUDDY_FAKE_SEED             seed for the failure draws (unseeded)
+"""
+import asyncio
+import itertools
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_ADVICE = (
+    "- Focus on NCERT chapters with the highest weightage first\n"
+    "- Revise formulas and named reactions every morning\n"
+    "- Solve 25 timed problems daily and log every mistake\n"
+    "- Take one full mock test each weekend and review it the next day\n"
+).split(" ")
+
+_random = random.Random(os.getenv("EXAM_BUDDY_FAKE_SEED"))
+
+
+class FakeRateLimitError(Exception):
+    """A simulated OpenAI 429, shaped like openai.RateLimitError."""
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("Rate limit reached (simulated)")
+        self.response = type("FakeResponse", (), {"headers": {"retry-after": str(retry_after)}})()
+
+
+class FakeTimeoutError(TimeoutError):
+    """A simulated request timeout."""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that streams canned advice with simulated delays and errors.
+
+    Sync calls sleep and async calls await, so the async path keeps the
+    event loop free while a call is "in flight", as ChatOpenAI does.
+    """
+    model_name: str = "fake"
+    latency: float = 0.3
+    token_delay: float = 0.02
+    response_tokens: int = 60
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    timeout_rate: float = 0.0
+    timeout: float = 10.0
+
+    @classmethod
+    def from_env(cls, model_name: str = "fake") -> "FakeChatModel":
+        """Create a fake model configured from the EXAM_BUDDY_FAKE_* variables."""
+        return cls(
+            model_name=model_name,
+            latency=float(os.getenv("EXAM_BUDDY_FAKE_LATENCY", "0.3")),
+            token_delay=float(os.getenv("EXAM_BUDDY_FAKE_TOKEN_DELAY", "0.02")),
+            response_tokens=int(os.getenv("EXAM_BUDDY_FAKE_TOKENS", "60")),
+            rate_limit_rate=float(os.getenv("EXAM_BUDDY_FAKE_RATE_LIMIT_RATE", "0")),
+            retry_after=float(os.getenv("EXAM_BUDDY_FAKE_RETRY_AFTER", "1")),
+            timeout_rate=float(os.getenv("EXAM_BUDDY_FAKE_TIMEOUT_RATE", "0")),
+            timeout=float(os.getenv("EXAM_BUDDY_FAKE_TIMEOUT", "10")),
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "exam-buddy-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "latency": self.latency, "token_delay": self.token_delay}
+
+    def _outcome(self) -> Optional[str]:
+        # Draw the fate of one call: None, "rate_limit" or "timeout"
+        draw = _random.random()
+        if draw < self.rate_limit_rate:
+            return "rate_limit"
+        if draw < self.rate_limit_rate + self.timeout_rate:
+            return "timeout"
+        return None
+
+    def _tokens(self) -> List[str]:
+        words = list(itertools.islice(itertools.cycle(_ADVICE), self.response_tokens))
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def _chunk(self, text: str, first: bool) -> ChatGenerationChunk:
+        metadata = {"model_name": self.model_name} if first else {}
+        return ChatGenerationChunk(message=AIMessageChunk(content=text, response_metadata=metadata))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        outcome = self._outcome()
+        if outcome == "timeout":
+            time.sleep(self.timeout)
+            raise FakeTimeoutError("Request timed out (simulated)")
+        time.sleep(self.latency)
+        if outcome == "rate_limit":
+            raise FakeRateLimitError(self.retry_after)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_delay)
+            chunk = self._chunk(token, first=not i)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        outcome = self._outcome()
+        if outcome == "timeout":
+            await asyncio.sleep(self.timeout)
+            raise FakeTimeoutError("Request timed out (simulated)")
+        await asyncio.sleep(self.latency)
+        if outcome == "rate_limit":
+            raise FakeRateLimitError(self.retry_after)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            chunk = self._chunk(token, first=not i)
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parts = [chunk.text async for chunk in self._astream(messages, stop, run_manager, **kwargs)]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(parts)))])
@@ -0,0 +1,157 @@
+"""
+Input guardrails for Exam Buddy.
+All patterns are compiled once at import. URLs and code are stripped by
+the same passes, in the same order, as the original filter (each skipped
+when the message lacks its marker), and blocked topics are reported as
+structured results.
+"""
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+# Longest input passed on to the LLM
+MAX_INPUT_LENGTH = 1000
+
+# Topics the exam buddy refuses to discuss
+BLOCKED_KEYWORDS = (
+    'personal information', 'password', 'credit card', 'ssn', 'social security',
+    'illegal', 'hack', 'cheat', 'exam paper', 'leak', 'adult content',
+    'porn', 'violence', 'hate speech', 'discrimination'
+)
+
+REFUSAL_MESSAGE = (
+    "I'm sorry, but I can only assist with exam preparation and study-related questions. "
+    "Is there something about your studies I can help you with?"
+)
+
+# Removal passes, applied in order to the output of the previous one. The
+# order matters (a URL can swallow a backtick, a code block can hold a
+# URL), so they are not merged into one alternation. Each pass comes with
+# the substrings it cannot match without, checked first with
+# str.__contains__ so most messages skip the regexes entirely.
+_REMOVALS = (
+    (re.compile(r"http\S+|www.\S+"), ("http", "www")),
+    (re.compile(r"```.*?```", re.DOTALL), ("```",)),
+    (re.compile(r"`.*?`"), ("`",)),
+)
+
+
+@dataclass
+class GuardrailResult:
+    """Outcome of checking one message."""
+    text: str
+    allowed: bool
+    blocked_terms: List[str] = field(default_factory=list)
+    removed: int = 0
+    truncated: bool = False
+
+    @property
+    def reason(self) -> Optional[str]:
+        """Why the message was refused, or None if it was allowed."""
+        if self.allowed:
+            return None
+        return "blocked topic: " + ", ".join(self.blocked_terms)
+
+
+class GuardrailEngine:
+    """
+    Filters user input and flags blocked topics with precompiled patterns.
+
+    Blocked phrases are found with C-level substring search over the text,
+    lowercased once. benchmarks/guardrails_bench.py shows this beats a
+    single alternation regex (or a trie-shaped one) for this keyword list
+    at every size up to the 1000-character limit.
+    """
+
+    def __init__(self, blocked_keywords: Sequence[str] = BLOCKED_KEYWORDS, max_length: int = MAX_INPUT_LENGTH):
+        """
+        Args:
+            blocked_keywords: Phrases that make a message off-limits,
+                matched case-insensitively anywhere in the text
+            max_length: Characters kept before the input is truncated
+        """
+        self.max_length = max_length
+        self._keywords = tuple(dict.fromkeys(k.lower() for k in blocked_keywords))
+        self._lock = threading.Lock()
+        self._screened = 0
+        self._blocked = 0
+        self._blocked_terms: Counter = Counter()
+
+    def filter(self, text: str) -> str:
+        """Strip URLs and code, and truncate very long input."""
+        return self._filter(text)[0]
+
+    def _filter(self, text: str):
+        removed = 0
+        for pattern, markers in _REMOVALS:
+            if any(marker in text for marker in markers):
+                text, count = pattern.subn("", text)
+                removed += count
+        truncated = len(text) > self.max_length
+        if truncated:
+            text = text[:self.max_length] + "... [truncated]"
+        return text.strip(), removed, truncated
+
+    def is_allowed(self, text: str) -> bool:
+        """Whether text contains no blocked phrase (stops at the first match)."""
+        lowered = text.lower()
+        return not any(keyword in lowered for keyword in self._keywords)
+
+    def find_blocked(self, text: str) -> List[str]:
+        """Return the blocked phrases in text, in order of first appearance."""
+        lowered = text.lower()
+        found = [(lowered.find(keyword), keyword) for keyword in self._keywords if keyword in lowered]
+        return [keyword for _, keyword in sorted(found)]
+
+    def check(self, text: str) -> GuardrailResult:
+        """
+        Filter a message and decide whether the exam buddy should answer it.
+
+        Args:
+            text: Raw user input
+
+        Returns:
+            GuardrailResult with the filtered text and what was matched
+        """
+        filtered, removed, truncated = self._filter(text)
+        blocked_terms = self.find_blocked(filtered)
+        return GuardrailResult(
+            text=filtered,
+            allowed=not blocked_terms,
+            blocked_terms=blocked_terms,
+            removed=removed,
+            truncated=truncated,
+        )
+
+    def screen(self, text: str) -> GuardrailResult:
+        """check() a message from a student and count it in stats()."""
+        result = self.check(text)
+        with self._lock:
+            self._screened += 1
+            if not result.allowed:
+                self._blocked += 1
+                self._blocked_terms.update(result.blocked_terms)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Screened and blocked message counts, for monitoring."""
+        with self._lock:
+            return {
+                "screened": self._screened,
+                "blocked": self._blocked,
+                "block_rate": self._blocked / self._screened if self._screened else 0.0,
+                "blocked_terms": dict(self._blocked_terms.most_common()),
+            }
+
+
+_guardrails: Optional[GuardrailEngine] = None
+
+
+def get_guardrails() -> GuardrailEngine:
+    """Get the process-wide guardrail engine."""
+    global _guardrails
+    if _guardrails is None:
+        _guardrails = GuardrailEngine()
+    return _guardrails
@@ -0,0 +1,144 @@
+"""
+Session activity heartbeat for Exam Buddy.
+Buffers last_activity updates in memory and writes them to MongoDB in one
+bulk_write every few seconds instead of one update per touch.
+"""
+import atexit
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Hashable, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from db_connection import get_database, session_filter
+
+
+class ActivityHeartbeat:
+    """
+    Coalesces last_activity writes on the sessions collection.
+
+    Each touch only records the latest timestamp per session in memory. A
+    background thread flushes all pending touches with a single unordered
+    bulk_write every ``flush_interval`` seconds, using $max so a late flush
+    never moves last_activity backwards.
+    """
+
+    def __init__(self, flush_interval: float = 30.0, collection=None):
+        """
+        Args:
+            flush_interval: Seconds between flushes
+            collection: Sessions collection (defaults to exam_buddy_session)
+        """
+        self.flush_interval = flush_interval
+        self._collection = collection
+        self._pending: Dict[Hashable, tuple] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._touches = 0
+        self._flushes = 0
+        self._writes = 0
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_database()['exam_buddy_session']
+        return self._collection
+
+    def touch(self, key: Hashable, query: Dict, at: Optional[datetime] = None):
+        """
+        Record activity for the document matching ``query``.
+
+        Args:
+            key: Identity of the document, used to coalesce touches
+            query: Filter matching the document
+            at: Activity time (defaults to now, UTC)
+        """
+        at = at or datetime.utcnow()
+        with self._lock:
+            self._touches += 1
+            previous = self._pending.get(key)
+            if previous is None or previous[1] < at:
+                self._pending[key] = (query, at)
+        self._ensure_started()
+
+    def touch_session(self, session_id: str, at: Optional[datetime] = None):
+        """Record activity on a session by its session_id or _id."""
+        if session_id:
+            self.touch(("session", session_id), session_filter(session_id), at)
+
+    def discard_session(self, session_id: str):
+        """Drop a pending touch, e.g. after last_activity was written directly."""
+        with self._lock:
+            self._pending.pop(("session", session_id), None)
+
+    def flush(self) -> int:
+        """
+        Write all pending touches in one bulk_write.
+
+        Returns:
+            int: Number of documents matched
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            result = self.collection.bulk_write(
+                [UpdateOne(query, {"$max": {"last_activity": at}}) for query, at in pending.values()],
+                ordered=False
+            )
+            self._flushes += 1
+            self._writes += len(pending)
+            return result.matched_count
+        except PyMongoError as e:
+            print(f"Error flushing activity heartbeat: {e}")
+            # Put the touches back unless newer ones arrived meanwhile
+            with self._lock:
+                for key, value in pending.items():
+                    current = self._pending.get(key)
+                    if current is None or current[1] < value[1]:
+                        self._pending[key] = value
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        """Touches recorded versus documents written, for monitoring."""
+        with self._lock:
+            return {
+                "touches": self._touches,
+                "pending": len(self._pending),
+                "flushes": self._flushes,
+                "writes": self._writes,
+            }
+
+    def stop(self):
+        """Stop the flush thread and write anything still pending."""
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._wakeup.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="exam-buddy-heartbeat", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.flush_interval):
+            self.flush()
+
+
+# Global heartbeat shared by auth, db_utils, exam_buddy and app
+heartbeat = ActivityHeartbeat(
+    flush_interval=float(os.getenv("EXAM_BUDDY_HEARTBEAT_INTERVAL", "30"))
+)
+atexit.register(heartbeat.stop)
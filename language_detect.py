@@ -0,0 +1,159 @@
+"""
+Language detection for Exam Buddy.
+Classifies a question as English, Hindi, Tamil, Telugu, Kannada or
+Malayalam (the sidebar languages) from a histogram of Unicode scripts,
+plus word heuristics for Hindi typed in Latin script ("mujhe physics kaise
+padhna hai").
+
+The histogram is built from precomputed byte tables over the UTF-8 text:
+one bytes.translate pass counts Latin letters, and each Indic block is
+counted by its UTF-8 lead bytes with bytes.count. Both run in C, and pure
+ASCII text skips the Indic counts entirely.
+"""
+import re
+import string
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# Script blocks per language, as (first, last) code points
+SCRIPT_RANGES = {
+    "Hindi": (0x0900, 0x097F),      # Devanagari
+    "Tamil": (0x0B80, 0x0BFF),
+    "Telugu": (0x0C00, 0x0C7F),
+    "Kannada": (0x0C80, 0x0CFF),
+    "Malayalam": (0x0D00, 0x0D7F),
+}
+
+# Languages the exam buddy answers in (the sidebar choices)
+SUPPORTED_LANGUAGES = ("English", *SCRIPT_RANGES)
+
+# Appended to the language name for text typed in Latin script
+LATIN_SCRIPT_SUFFIX = " (in Latin script)"
+
+# Every character in a block is encoded as 3 bytes starting with one of
+# these 2-byte prefixes (e.g. Devanagari is E0 A4 xx or E0 A5 xx)
+_SCRIPT_PREFIXES = {
+    language: tuple(sorted({chr(code).encode("utf-8")[:2] for code in range(first, last + 1)}))
+    for language, (first, last) in SCRIPT_RANGES.items()
+}
+
+# Deleting every other byte leaves only the ASCII letters
+_NON_LATIN_BYTES = bytes(sorted(set(range(256)) - set(string.ascii_letters.encode("ascii"))))
+
+_WORD = re.compile(r"[a-z]+")
+
+# Common Hindi words in Latin spelling that are not also English words
+_ROMANIZED_HINDI = frozenset("""
+hai hain hoon hu kya kaise kaisa kaisi kyun kyon kab kahan kaun kitna kitni kuch sab
+mujhe mujhko mera meri mere hum humein tum tumhe aap aapka apna apni nahi nahin haan
+kar karo karna karke karta karti raha rahi rahe tha thi hota hoti hoga hogi
+ke ki ka ko se mein aur bhi liye yeh woh padh padhai padhna padhu yaad samajh samjha
+samjhao chahiye sakta sakti lekin kyunki bahut thoda acha accha achha bana banana abhi aaj
+""".split())
+
+# Romanized Hindi needs at least this many hits and this share of words
+_ROMANIZED_MIN_HITS = 2
+_ROMANIZED_MIN_SHARE = 0.25
+# Only the start of the text is checked for Romanized Hindi words
+_ROMANIZED_SAMPLE_CHARS = 300
+
+
+@dataclass
+class DetectionResult:
+    """Detected language with per-language scores (shares of letters)."""
+    language: str
+    confidence: float
+    scores: Dict[str, float] = field(default_factory=dict)
+    romanized: bool = False
+
+    @property
+    def prompt_language(self) -> str:
+        """Language name to put in the prompt, e.g. 'Hindi (in Latin script)'."""
+        return self.language + LATIN_SCRIPT_SUFFIX if self.romanized else self.language
+
+
+def normalize_language(selection: Optional[str]) -> Optional[str]:
+    """
+    Map a language selection to a supported language name.
+
+    Accepts plain names ("Tamil"), sidebar labels ("தமிழ் (Tamil)") and
+    detected prompt languages ("Hindi (in Latin script)"), which are kept
+    as they are.
+
+    Returns:
+        The language name, or None for "Auto", empty or unknown selections
+        (the language is then detected from the question)
+    """
+    if not selection:
+        return None
+    name = selection.strip()
+    if name.endswith(LATIN_SCRIPT_SUFFIX):
+        language = normalize_language(name[:-len(LATIN_SCRIPT_SUFFIX)])
+        return language + LATIN_SCRIPT_SUFFIX if language else None
+    if name.endswith(")") and "(" in name:
+        name = name[name.rindex("(") + 1:-1].strip()
+    for language in SUPPORTED_LANGUAGES:
+        if name.lower() == language.lower():
+            return language
+    return None
+
+
+def script_histogram(text: str) -> Counter:
+    """Count letters per language script."""
+    data = text.encode("utf-8")
+    histogram = Counter()
+    latin = len(data.translate(None, _NON_LATIN_BYTES))
+    if latin:
+        histogram["English"] = latin
+    if not text.isascii():
+        for language, prefixes in _SCRIPT_PREFIXES.items():
+            count = sum(data.count(prefix) for prefix in prefixes)
+            if count:
+                histogram[language] = count
+    return histogram
+
+
+def detect_language(text: str, default: str = "English") -> DetectionResult:
+    """
+    Detect the language of a question.
+
+    The language whose script has the most letters wins, with its share of
+    all letters as the confidence. Mostly-Latin text is checked for
+    Romanized Hindi before falling back to English.
+
+    Args:
+        text: The question
+        default: Language returned when the text has no letters
+
+    Returns:
+        DetectionResult
+    """
+    histogram = script_histogram(text)
+    total = sum(histogram.values())
+    if not total:
+        return DetectionResult(language=default, confidence=0.0)
+
+    scores = {language: count / total for language, count in histogram.most_common()}
+    language = next(iter(scores))
+
+    if language == "English":
+        words = _WORD.findall(text[:_ROMANIZED_SAMPLE_CHARS].lower())
+        hits = sum(1 for word in words if word in _ROMANIZED_HINDI)
+        share = hits / len(words) if words else 0.0
+        if hits >= _ROMANIZED_MIN_HITS and share >= _ROMANIZED_MIN_SHARE:
+            # Hinglish mixes in English subject words, so a quarter of the
+            # words being Hindi already counts as an even split
+            hindi = min(1.0, share / (2 * _ROMANIZED_MIN_SHARE))
+            latin = scores.pop("English")
+            scores["Hindi"] = scores.get("Hindi", 0.0) + latin * hindi
+            scores["English"] = latin * (1 - hindi)
+            scores = dict(sorted(scores.items(), key=lambda item: -item[1]))
+            return DetectionResult(
+                language="Hindi",
+                confidence=scores["Hindi"],
+                scores=scores,
+                romanized=True,
+            )
+
+    return DetectionResult(language=language, confidence=scores[language], scores=scores)
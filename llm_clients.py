@@ -0,0 +1,105 @@
+"""
+Chat model registry for Exam Buddy.
+Reuses ChatOpenAI clients, and the HTTP connection pool underneath them,
+instead of constructing a new client (and TLS session) per call.
+
+EXAM_BUDDY_LLM_BACKEND=fake swaps every client for the local stand-in in
+fake_llm.py, so the chat path can be load-tested without calling OpenAI.
+"""
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+_models: Dict[Tuple, Any] = {}
+_lock = threading.Lock()
+_http_client = None
+_created = 0
+_reused = 0
+
+
+def get_backend() -> str:
+    """Chat model backend from EXAM_BUDDY_LLM_BACKEND ('openai' or 'fake')."""
+    return os.getenv("EXAM_BUDDY_LLM_BACKEND", "openai").strip().lower()
+
+
+def _shared_http_client():
+    """
+    One keep-alive httpx.Client for every synchronous OpenAI call.
+
+    Pool limits come from OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS and OPENAI_KEEPALIVE_EXPIRY (seconds).
+    Async calls use langchain_openai's own process-wide pooled client.
+    """
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")),
+                keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30")),
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+    return _http_client
+
+
+def get_chat_model(model: str, temperature: float, api_key: str, **options):
+    """
+    Get a cached ChatOpenAI client, creating it on first use.
+
+    Clients are keyed by model, temperature, API key and any extra options,
+    so calls with the same settings share one client and its connections.
+    With the fake backend, a FakeChatModel is returned instead and the
+    options are ignored.
+
+    Args:
+        model: OpenAI model name
+        temperature: Sampling temperature
+        api_key: OpenAI API key
+        **options: Extra ChatOpenAI arguments (max_retries, ...)
+
+    Returns:
+        ChatOpenAI: The shared client for these settings
+    """
+    global _created, _reused
+    backend = get_backend()
+    registry_key = (backend, model, temperature, api_key, tuple(sorted(options.items())))
+    with _lock:
+        client = _models.get(registry_key)
+        if client is not None:
+            _reused += 1
+            return client
+        if backend == "fake":
+            from fake_llm import FakeChatModel
+            client = FakeChatModel.from_env(model)
+            _models[registry_key] = client
+            _created += 1
+            return client
+        from langchain_openai import ChatOpenAI
+        client = ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            openai_api_key=api_key,
+            http_client=_shared_http_client(),
+            **options
+        )
+        _models[registry_key] = client
+        _created += 1
+        return client
+
+
+def get_registry_stats() -> Dict[str, int]:
+    """Number of clients held, created and reused, for monitoring."""
+    with _lock:
+        return {"clients": len(_models), "created": _created, "reused": _reused}
+
+
+def clear_chat_models():
+    """Drop all cached clients and close the shared HTTP connection pool."""
+    global _http_client
+    with _lock:
+        _models.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
@@ -0,0 +1,230 @@
+"""
+MongoDB-backed chat history for Exam Buddy.
+Reads and appends to the ``conversation`` array of the exam_buddy_session
+document so every worker sees the same history.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from bson import ObjectId
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from pymongo.errors import PyMongoError
+
+from db_connection import session_filter
+
+
+def message_to_document(message: BaseMessage) -> Dict:
+    """Convert a LangChain message to the stored conversation format."""
+    if message.type == "human":
+        role = "user"
+    elif message.type == "system":
+        role = "system"
+    else:
+        role = "assistant"
+    return {
+        "role": role,
+        "content": message.content,
+        "timestamp": datetime.utcnow()
+    }
+
+
+def document_to_message(doc: Dict) -> BaseMessage:
+    """Convert a stored conversation entry to a LangChain message."""
+    role = doc.get("role")
+    content = doc.get("content", "")
+    if role == "user":
+        return HumanMessage(content=content)
+    if role == "system":
+        return SystemMessage(content=content)
+    return AIMessage(content=content)
+
+
+class MongoChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history stored in the session document's ``conversation`` array.
+
+    Reads are served from a local cache that is refreshed from MongoDB at
+    most every ``cache_ttl`` seconds. Appends are buffered and written with a
+    single ``$push``/``$each``/``$slice`` once ``flush_size`` messages are
+    pending or ``flush_interval`` seconds have passed, whichever comes first;
+    a timer writes a partial buffer even if no further message arrives. The
+    write recreates the session document if it no longer exists.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        collection=None,
+        max_messages: int = 80,
+        flush_size: int = 2,
+        flush_interval: float = 5.0,
+        cache_ttl: float = 30.0,
+        student_id=None,
+    ):
+        """
+        Args:
+            session_id: Session identifier (session_id field or document _id)
+            collection: Sessions collection. Defaults to db_manager.sessions.
+            max_messages: Messages kept in the stored conversation
+            flush_size: Pending messages that trigger a write
+            flush_interval: Seconds after which pending messages are written
+            cache_ttl: Seconds a cached read is trusted before refetching
+            student_id: Stored on the session document if a write creates it
+        """
+        self.session_id = session_id
+        self._collection = collection
+        self.max_messages = max_messages
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.student_id = student_id
+        self._cache: Optional[List[BaseMessage]] = None
+        self._first_index = 0
+        self._loaded_at = 0.0
+        self._pending: List[Dict] = []
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            from db_utils import db_manager
+            self._collection = db_manager.sessions
+        return self._collection
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Return the conversation, refetching only when the cache is stale."""
+        with self._lock:
+            if self._cache is None or time.monotonic() - self._loaded_at > self.cache_ttl:
+                # Write our own pending messages first so the refetch sees them
+                self.flush()
+                self._cache = self._load()
+                self._loaded_at = time.monotonic()
+            return list(self._cache)
+
+    @property
+    def first_index(self) -> int:
+        """Position in the whole conversation of the first message in ``messages``."""
+        return self._first_index
+
+    def _load(self) -> List[BaseMessage]:
+        try:
+            session = self.collection.find_one(
+                session_filter(self.session_id),
+                {"conversation": {"$slice": -self.max_messages}, "message_count": 1}
+            )
+        except PyMongoError as e:
+            print(f"Error loading conversation history: {e}")
+            return list(self._cache or [])
+        if not session:
+            self._first_index = 0
+            return []
+        conversation = session.get("conversation", [])
+        # Messages sliced off the front; sessions without a count hold them all
+        self._first_index = max(0, session.get("message_count", 0) - len(conversation))
+        return [document_to_message(doc) for doc in conversation]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Append messages locally and buffer them for the next write."""
+        with self._lock:
+            if self._cache is not None:
+                self._cache.extend(messages)
+                if len(self._cache) > self.max_messages:
+                    self._first_index += len(self._cache) - self.max_messages
+                    del self._cache[:-self.max_messages]
+            self._pending.extend(message_to_document(m) for m in messages)
+            if len(self._pending) >= self.flush_size or self.flush_interval <= 0:
+                self.flush()
+            else:
+                self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """Start the timer that writes the buffer after ``flush_interval``."""
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_insert(self, now: datetime) -> Dict:
+        """Fields for a session document created by a write."""
+        fields = {"session_id": self.session_id, "created_at": now}
+        if ObjectId.is_valid(self.session_id):
+            # The app looks sessions up by str(_id)
+            fields["_id"] = ObjectId(self.session_id)
+        if self.student_id is not None:
+            fields["student_id"] = self.student_id
+        return fields
+
+    def flush(self) -> bool:
+        """
+        Write buffered messages to MongoDB in one round trip.
+
+        Returns:
+            bool: True if nothing was pending or the messages were stored
+        """
+        with self._lock:
+            self._cancel_flush()
+            if not self._pending:
+                return True
+            pending, self._pending = self._pending, []
+            now = datetime.utcnow()
+            try:
+                result = self.collection.update_one(
+                    session_filter(self.session_id),
+                    {
+                        "$push": {"conversation": {"$each": pending, "$slice": -self.max_messages}},
+                        "$inc": {"message_count": len(pending)},
+                        "$set": {
+                            "last_activity": now,
+                            "expires_at": now + timedelta(days=7)
+                        },
+                        "$setOnInsert": self._on_insert(now)
+                    },
+                    upsert=True
+                )
+                return result.matched_count > 0 or result.upserted_id is not None
+            except PyMongoError as e:
+                print(f"Error flushing conversation history: {e}")
+                # Keep the messages and retry them on the next flush
+                self._pending = pending + self._pending
+                self._schedule_flush()
+                return False
+
+    def clear(self) -> None:
+        """Drop the conversation and the summary built from it."""
+        with self._lock:
+            self._cancel_flush()
+            self._pending = []
+            self._cache = []
+            self._first_index = 0
+            self._loaded_at = time.monotonic()
+            try:
+                # The chat reads the summary from "context"; the watermark
+                # and count must restart with the empty conversation
+                self.collection.update_one(
+                    session_filter(self.session_id),
+                    {
+                        "$set": {
+                            "conversation": [],
+                            "context": "",
+                            "message_count": 0,
+                            "summary_watermark": 0
+                        },
+                        "$unset": {"summary": ""}
+                    }
+                )
+            except PyMongoError as e:
+                print(f"Error clearing conversation history: {e}")
+
+    def close(self) -> None:
+        """Flush pending writes. Called when the session store evicts us."""
+        self.flush()
@@ -0,0 +1,432 @@
+"""
+Chat pipeline for Exam Buddy.
+One object runs a turn through its stages in order:
+
+    guard -> history -> response cache -> context + render -> prompt cache
+          -> LLM (streamed, rate limited, key rotated) -> persist
+
+Each stage reads and writes fields of a single ChatTurn, instead of a chain
+of RunnableLambdas that rebuild and nest dictionaries on every call.
+"""
+import asyncio
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from api_key_rotator import get_key_pool, get_retry_after, is_rate_limit_error, is_transient_error
+from context_builder import get_context_builder
+from guardrails import REFUSAL_MESSAGE, GuardrailResult, get_guardrails
+from language_detect import SUPPORTED_LANGUAGES, detect_language
+from llm_clients import get_chat_model
+from prompt_cache import get_prompt_cache
+from prompts import get_chat_variant, registry as prompt_registry, warm
+from rate_limiter import estimate_tokens, get_rate_limiter
+from response_cache import context_scope, get_response_cache, mentions_any
+
+FALLBACK_RESPONSE = "I'm not sure how to respond to that."
+
+# Shown (by exam_buddy) and recorded when the model call fails
+ERROR_RESPONSE = "I'm sorry, I encountered an error while processing your request. Please try again later."
+
+# Calls made for a timeout, connection error or 5xx, as the OpenAI client's
+# own max_retries=2 would
+TRANSIENT_ATTEMPTS = 3
+
+# Marks constructor arguments left to the process-wide default
+_DEFAULT: Any = object()
+
+# The value in each "- Physics: 45" line of the marks text
+_MARK_VALUE = re.compile(r":\s*(\d[\d.]*)")
+
+
+@dataclass
+class ChatTurn:
+    """One student message and everything the pipeline derives from it."""
+    question: str
+    session_id: str
+    context: str = ""
+    summary: str = ""
+    marks: str = ""
+    recent_turns: List[Dict[str, Any]] = field(default_factory=list)
+    language: Optional[str] = None
+    exam_type: Optional[str] = None
+    subjects: List[str] = field(default_factory=list)
+    student_name: str = ""
+    student_key: str = "anonymous"
+    guard: Optional[GuardrailResult] = None
+    # Filled in by the stages
+    refusal: Optional[str] = None
+    history: Any = None
+    prompt: Any = None
+    prompt_key: Optional[str] = None
+    # Response cache scope, or None when the cache is off
+    cache_scope: Optional[str] = None
+
+    @classmethod
+    def from_inputs(cls, inputs: Dict[str, Any], session_id: str) -> "ChatTurn":
+        """Build a turn from the input dict prepared by exam_buddy."""
+        return cls(
+            question=inputs["question"],
+            session_id=session_id,
+            context=inputs.get("context") or "",
+            summary=inputs.get("summary") or "",
+            marks=inputs.get("marks") or "",
+            recent_turns=inputs.get("recent_turns") or [],
+            language=inputs.get("language"),
+            exam_type=inputs.get("exam_type"),
+            subjects=list(inputs.get("subjects") or []),
+            student_name=inputs.get("student_name") or "",
+            student_key=inputs.get("student_key") or "anonymous",
+            guard=inputs.get("guard"),
+        )
+
+
+def _chunk_text(chunk: Any) -> str:
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class ExamBuddyPipeline:
+    """
+    The exam buddy chat path as a single object.
+
+    Same behaviour as the former LCEL chain wrapped in
+    RunnableWithMessageHistory: guardrails, semantic and exact response
+    caches, token-budgeted context, fair rate limiting, API key rotation
+    with retry on 429, and the turn saved to the session history. Refused
+    questions never load history or reach the model.
+    """
+
+    def __init__(
+        self,
+        history_factory: Callable[[str], Any],
+        model: str = "gpt-4o-mini",
+        temperature: float = 0.7,
+        variant: Optional[str] = None,
+        llm_factory: Optional[Callable[[str], Any]] = None,
+        key_pool: Any = _DEFAULT,
+        rate_limiter: Any = _DEFAULT,
+        response_cache: Any = _DEFAULT,
+        prompt_cache: Any = _DEFAULT,
+        context_builder: Any = _DEFAULT,
+    ):
+        """
+        Args:
+            history_factory: Returns the chat history for a session ID
+            model: OpenAI model name
+            temperature: Sampling temperature
+            variant: Prompt variant (defaults to EXAM_BUDDY_PROMPT_VARIANT)
+            llm_factory: Returns a chat model for an API key (defaults to
+                the shared client registry)
+            key_pool, rate_limiter, response_cache, prompt_cache,
+            context_builder: Override the process-wide instances; pass None
+                for a cache to disable it
+        """
+        self.history_factory = history_factory
+        self.model = model
+        self.temperature = temperature
+        self.variant = variant or get_chat_variant()
+        self.key_pool = get_key_pool() if key_pool is _DEFAULT else key_pool
+        self.rate_limiter = get_rate_limiter() if rate_limiter is _DEFAULT else rate_limiter
+        self.response_cache = get_response_cache() if response_cache is _DEFAULT else response_cache
+        self.prompt_cache = get_prompt_cache() if prompt_cache is _DEFAULT else prompt_cache
+        self.context_builder = get_context_builder() if context_builder is _DEFAULT else context_builder
+        self.llm_factory = llm_factory or self._default_llm
+        # With one key the client retries everything itself; with several,
+        # the pipeline retries on the next key (see _retry_delay)
+        self._attempts = max(self.key_pool.size, TRANSIENT_ATTEMPTS) if self.key_pool.size > 1 else 1
+        self._lock = threading.Lock()
+        self._counts = {"turns": 0, "refused": 0, "response_cache": 0, "prompt_cache": 0, "llm": 0}
+        self._usage = {"prompt_tokens": 0, "cached_prompt_tokens": 0}
+        warm(list(SUPPORTED_LANGUAGES), self.variant)
+
+    def _default_llm(self, key: str):
+        # Client retries are disabled with several keys, so a 429 moves the
+        # call to another key instead of retrying on the same one
+        return get_chat_model(
+            self.model,
+            self.temperature,
+            key,
+            max_retries=0 if self.key_pool.size > 1 else 2,
+            include_response_headers=True,
+            # Token usage in the last chunk, with the prompt-cache hits
+            stream_usage=True
+        )
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self._counts["turns"] += 1
+            self._counts[outcome] += 1
+
+    def _record_usage(self, usage: Optional[Dict[str, Any]]):
+        if not usage:
+            return
+        cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+        with self._lock:
+            self._usage["prompt_tokens"] += usage.get("input_tokens", 0)
+            self._usage["cached_prompt_tokens"] += cached
+
+    def stats(self) -> Dict[str, int]:
+        """Turns by outcome and prompt tokens sent and served from OpenAI's cache, for monitoring."""
+        with self._lock:
+            return {**self._counts, **self._usage}
+
+    # -- stages -----------------------------------------------------------
+
+    def guard(self, turn: ChatTurn) -> bool:
+        """Filter the question and settle its language. False if refused."""
+        guard = turn.guard or get_guardrails().check(turn.question)
+        if not guard.allowed:
+            turn.refusal = REFUSAL_MESSAGE
+            return False
+        turn.guard = guard
+        # The selected language wins; detect only when none was given
+        turn.language = turn.language or detect_language(guard.text).prompt_language
+        return True
+
+    def cached_response(self, turn: ChatTurn) -> Optional[str]:
+        """
+        Answer from the semantic cache.
+
+        The key holds only non-personal fields (exam, subjects, language),
+        so students with the same exam and subjects share answers, at any
+        point in a conversation. Follow-up questions are never served (see
+        response_cache.is_cacheable), and answers that name the student or
+        repeat their marks are never stored (see remember).
+        """
+        if self.response_cache is None:
+            return None
+        turn.cache_scope = context_scope(*turn.subjects)
+        return self.response_cache.get(turn.guard.text, turn.exam_type, turn.language, turn.cache_scope)
+
+    @staticmethod
+    def _personal_terms(turn: ChatTurn) -> List[str]:
+        names = [part for part in turn.student_name.split() if len(part) > 2]
+        return names + _MARK_VALUE.findall(turn.marks)
+
+    def render(self, turn: ChatTurn, messages: List[Any]):
+        """Fit context into the token budget and render the prompt."""
+        budgeted = self.context_builder.build(
+            turn.guard.text,
+            system_tokens=prompt_registry.fixed_tokens(self.variant, turn.language),
+            summary=turn.summary,
+            profile=turn.context,
+            marks=turn.marks,
+            history=messages,
+            recent_turns=turn.recent_turns,
+            history_offset=getattr(turn.history, "first_index", 0),
+        )
+        turn.prompt = prompt_registry.render_chat(
+            self.variant,
+            turn.language,
+            context=budgeted["context"],
+            history=budgeted["history"],
+            question=budgeted["question"],
+            tokens=sum(budgeted["usage"].values())
+        )
+        if self.prompt_cache is not None:
+            turn.prompt_key = self.prompt_cache.make_key(
+                self.model, {"temperature": self.temperature}, turn.prompt.to_messages()
+            )
+
+    def _quota(self, turn: ChatTurn):
+        return turn.student_key, estimate_tokens(turn.prompt.to_string())
+
+    def _retry_delay(self, error: Exception, key: str, emitted: bool, attempt: int) -> Optional[float]:
+        """
+        Book-keep a failed call and decide whether to retry it on the next key.
+
+        A 429 is retried at once on another key. A timeout, connection error
+        or 5xx is retried after a short backoff, up to TRANSIENT_ATTEMPTS
+        calls. Nothing is retried once text has reached the caller.
+
+        Returns:
+            Seconds to wait before retrying, or None to give up
+        """
+        if is_rate_limit_error(error):
+            self.key_pool.report_rate_limited(key, get_retry_after(error))
+            return 0.0 if not emitted and attempt + 1 < self.key_pool.size else None
+        self.key_pool.release(key)
+        if emitted or not is_transient_error(error) or attempt + 1 >= min(self._attempts, TRANSIENT_ATTEMPTS):
+            return None
+        return min(0.5 * 2 ** attempt, 8.0)
+
+    def _question(self, turn: ChatTurn):
+        from langchain_core.messages import HumanMessage
+        return [HumanMessage(content=turn.question)]
+
+    def _answer(self, response: str):
+        from langchain_core.messages import AIMessage
+        return [AIMessage(content=response)]
+
+    def _messages(self, turn: ChatTurn, response: str):
+        return self._question(turn) + self._answer(response)
+
+    def remember(self, turn: ChatTurn, response: str):
+        """Store a model response in both caches (the shared one only if impersonal)."""
+        if turn.cache_scope is not None and not mentions_any(response, self._personal_terms(turn)):
+            self.response_cache.put(turn.guard.text, response, turn.exam_type, turn.language, turn.cache_scope)
+        if turn.prompt_key:
+            self.prompt_cache.put(turn.prompt_key, response)
+
+    # -- sync path --------------------------------------------------------
+
+    def _generate(self, turn: ChatTurn) -> Iterator[str]:
+        if not self.guard(turn):
+            self._count("refused")
+            yield turn.refusal
+            return
+        turn.history = self.history_factory(turn.session_id)
+        messages = turn.history.messages
+
+        cached = self.cached_response(turn)
+        if cached:
+            self._count("response_cache")
+            yield cached
+            turn.history.add_messages(self._messages(turn, cached))
+            return
+
+        self.render(turn, messages)
+        if turn.prompt_key:
+            cached = self.prompt_cache.get(turn.prompt_key)
+            if cached:
+                self._count("prompt_cache")
+                yield cached
+                turn.history.add_messages(self._messages(turn, cached))
+                return
+
+        # Saved before the call, so an interrupted stream keeps the question
+        turn.history.add_messages(self._question(turn))
+        self.rate_limiter.acquire_blocking(*self._quota(turn))
+        self._count("llm")
+        parts = []
+        for attempt in range(self._attempts):
+            key = self.key_pool.acquire()
+            headers = usage = None
+            try:
+                for chunk in self.llm_factory(key).stream(turn.prompt):
+                    headers = headers or chunk.response_metadata.get("headers")
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    text = _chunk_text(chunk)
+                    if text:
+                        parts.append(text)
+                        yield text
+            except Exception as e:
+                delay = self._retry_delay(e, key, bool(parts), attempt)
+                if delay is None:
+                    # Record what the student saw: the partial answer or the error reply
+                    turn.history.add_messages(self._answer("".join(parts) or ERROR_RESPONSE))
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # The consumer stopped early (GeneratorExit)
+                self.key_pool.release(key, headers)
+                raise
+            self.key_pool.release(key, headers)
+            self._record_usage(usage)
+            break
+
+        response = "".join(parts)
+        if not parts:
+            response = FALLBACK_RESPONSE
+            yield response
+        else:
+            self.remember(turn, response)
+        turn.history.add_messages(self._answer(response))
+
+    def stream(self, inputs: Dict[str, Any], config: Optional[Dict] = None, *, session_id: Optional[str] = None) -> Iterator[str]:
+        """Yield the response to one turn in chunks."""
+        yield from self._generate(ChatTurn.from_inputs(inputs, _session_id(config, session_id)))
+
+    def invoke(self, inputs: Dict[str, Any], config: Optional[Dict] = None, *, session_id: Optional[str] = None) -> str:
+        """Return the full response to one turn."""
+        return "".join(self.stream(inputs, config, session_id=session_id))
+
+    # -- async path -------------------------------------------------------
+
+    async def _agenerate(self, turn: ChatTurn) -> AsyncIterator[str]:
+        if not self.guard(turn):
+            self._count("refused")
+            yield turn.refusal
+            return
+        turn.history = self.history_factory(turn.session_id)
+        messages = await turn.history.aget_messages()
+
+        cached = self.cached_response(turn)
+        if cached:
+            self._count("response_cache")
+            yield cached
+            await turn.history.aadd_messages(self._messages(turn, cached))
+            return
+
+        self.render(turn, messages)
+        if turn.prompt_key:
+            # SQLite is blocking; keep it off the event loop
+            cached = await asyncio.to_thread(self.prompt_cache.get, turn.prompt_key)
+            if cached:
+                self._count("prompt_cache")
+                yield cached
+                await turn.history.aadd_messages(self._messages(turn, cached))
+                return
+
+        # Saved before the call, so an interrupted stream keeps the question
+        await turn.history.aadd_messages(self._question(turn))
+        await self.rate_limiter.acquire(*self._quota(turn))
+        self._count("llm")
+        parts = []
+        for attempt in range(self._attempts):
+            key = self.key_pool.acquire()
+            headers = usage = None
+            try:
+                async for chunk in self.llm_factory(key).astream(turn.prompt):
+                    headers = headers or chunk.response_metadata.get("headers")
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    text = _chunk_text(chunk)
+                    if text:
+                        parts.append(text)
+                        yield text
+            except Exception as e:
+                delay = self._retry_delay(e, key, bool(parts), attempt)
+                if delay is None:
+                    # Record what the student saw: the partial answer or the error reply
+                    await turn.history.aadd_messages(self._answer("".join(parts) or ERROR_RESPONSE))
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # The consumer stopped early (GeneratorExit or cancellation)
+                self.key_pool.release(key, headers)
+                raise
+            self.key_pool.release(key, headers)
+            self._record_usage(usage)
+            break
+
+        response = "".join(parts)
+        if not parts:
+            response = FALLBACK_RESPONSE
+            yield response
+        else:
+            await asyncio.to_thread(self.remember, turn, response)
+        await turn.history.aadd_messages(self._answer(response))
+
+    async def astream(self, inputs: Dict[str, Any], config: Optional[Dict] = None, *, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield the response to one turn in chunks, without blocking the loop."""
+        async for text in self._agenerate(ChatTurn.from_inputs(inputs, _session_id(config, session_id))):
+            yield text
+
+    async def ainvoke(self, inputs: Dict[str, Any], config: Optional[Dict] = None, *, session_id: Optional[str] = None) -> str:
+        """Return the full response to one turn, without blocking the loop."""
+        parts = [text async for text in self.astream(inputs, config, session_id=session_id)]
+        return "".join(parts)
+
+
+def _session_id(config: Optional[Dict], session_id: Optional[str]) -> str:
+    # Accepts the LCEL-style config={"configurable": {"session_id": ...}}
+    if session_id is not None:
+        return session_id
+    return ((config or {}).get("configurable") or {}).get("session_id", "default")
@@ -0,0 +1,178 @@
+"""
+Exact-match prompt cache for Exam Buddy.
+Stores LLM responses in SQLite keyed by a hash of the fully rendered prompt
+(model, sampling parameters and every message), so reruns and retries of the
+same turn skip the OpenAI call, even across restarts.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+
+class PromptCache:
+    """
+    SQLite-backed, size-limited cache of responses by rendered prompt.
+
+    When the cache grows past ``max_entries`` or ``max_bytes`` of stored
+    responses, the least recently used entries are deleted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        max_bytes: int = 50 * 1024 * 1024,
+        bypass_sampled: bool = False,
+    ):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a process-local cache)
+            max_entries: Maximum number of cached responses
+            max_bytes: Maximum total size of cached responses
+            bypass_sampled: Skip the cache for calls with temperature > 0, so
+                repeated prompts still get fresh samples
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass_sampled = bypass_sampled
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+
+        directory = os.path.dirname(path)
+        if directory and path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                " key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS prompt_cache_last_used ON prompt_cache (last_used)"
+            )
+            self._conn.commit()
+
+    def make_key(self, model: str, params: Dict[str, Any], messages: Iterable[Any]) -> Optional[str]:
+        """
+        Hash a rendered prompt deterministically.
+
+        Args:
+            model: Model name
+            params: Sampling parameters (temperature, ...)
+            messages: Rendered LangChain messages
+
+        Returns:
+            Hex digest, or None if the call should bypass the cache
+        """
+        if self.bypass_sampled and params.get("temperature", 0) > 0:
+            with self._lock:
+                self._bypassed += 1
+            return None
+        payload = json.dumps(
+            {
+                "model": model,
+                "params": params,
+                "messages": [[m.type, m.content] for m in messages],
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM prompt_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE prompt_cache SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self._hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Store a response and trim the cache to its limits."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, response, size, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM prompt_cache"
+            ).fetchone()
+            while count > self.max_entries or total > self.max_bytes:
+                oldest = self._conn.execute(
+                    "SELECT key, size FROM prompt_cache ORDER BY last_used LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                self._conn.execute("DELETE FROM prompt_cache WHERE key = ?", (oldest[0],))
+                count -= 1
+                total -= oldest[1]
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and size metrics for monitoring."""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM prompt_cache"
+            ).fetchone()
+            lookups = self._hits + self._misses
+            return {
+                "entries": count,
+                "bytes": total,
+                "hits": self._hits,
+                "misses": self._misses,
+                "bypassed": self._bypassed,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_prompt_cache: Optional[PromptCache] = None
+
+
+def get_prompt_cache() -> Optional[PromptCache]:
+    """
+    Get the process-wide prompt cache, or None if disabled.
+
+    Configured by EXAM_BUDDY_PROMPT_CACHE (on/off),
+    EXAM_BUDDY_PROMPT_CACHE_PATH, EXAM_BUDDY_PROMPT_CACHE_MAX_ENTRIES,
+    EXAM_BUDDY_PROMPT_CACHE_MAX_MB and EXAM_BUDDY_PROMPT_CACHE_BYPASS_SAMPLED.
+    """
+    global _prompt_cache
+    if os.getenv("EXAM_BUDDY_PROMPT_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    if _prompt_cache is None:
+        _prompt_cache = PromptCache(
+            path=os.getenv("EXAM_BUDDY_PROMPT_CACHE_PATH", os.path.join(".exam_buddy_cache", "prompt_cache.sqlite3")),
+            max_entries=int(os.getenv("EXAM_BUDDY_PROMPT_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(float(os.getenv("EXAM_BUDDY_PROMPT_CACHE_MAX_MB", "50")) * 1024 * 1024),
+            bypass_sampled=os.getenv("EXAM_BUDDY_PROMPT_CACHE_BYPASS_SAMPLED", "off").lower() in ("1", "on", "true", "yes"),
+        )
+    return _prompt_cache
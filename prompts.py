@@ -0,0 +1,246 @@
+"""
+Prompt registry for Exam Buddy.
+Chat prompts are compiled once per process and variant/language, with
+their static instructions first, as a literal system message that is never
+re-formatted. Per-turn context goes in a separate message after the
+history. Every render records its token count per template.
+
+OpenAI's prompt caching reuses identical leading tokens once there are at
+least 1024 of them. The system message alone is about 300, so caching
+starts once the history after it is long enough. The history window only
+moves in whole blocks (see ContextBuilder), so the system message and
+history stay the same from turn to turn until the window jumps. The
+context message changes every turn, which is why it goes after the
+history. Cached prompt tokens are counted in the pipeline's stats().
+"""
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from context_builder import count_tokens
+
+COACH_SYSTEM_PROMPT = """You are a friendly and knowledgeable study coach specialized in helping Indian teenage students prepare for competitive exams like JEE Main, NEET, IIT, NIT, etc.
+
+Your expertise includes:
+- Effective study techniques and time management
+- Memory enhancement tricks for formulas, equations, and periodic tables
+- Subject-specific strategies for Chemistry, Mathematics, Physics, and Biology
+- Exam preparation psychology and stress management
+- Indian education system specific advice
+
+IMPORTANT RULES:
+1. You must ONLY respond to questions related to exam preparation, study techniques, and academic guidance.
+2. If asked about inappropriate topics, politely decline and guide the conversation back to exam preparation.
+3. Never provide direct answers to exam questions or engage in academic dishonesty.
+4. Always respond in the same language as the user's question, unless they specifically ask for another language.
+5. If the user switches languages, respond in the same language they used in their last message.
+6. If you're unsure about an answer, say so rather than providing incorrect information."""
+
+EXAM_BUDDY_SYSTEM_PROMPT = """You are an experienced mentor who has successfully cracked competitive exams like JEE Main, NEET, IIT, NIT. Provide direct, actionable study guidance.
+
+STRICT RULES:
+1. RESPONSE LENGTH:
+   - ALL responses MUST be 5 lines or less
+   - ONLY exceed 5 lines for:
+     * Study schedules (daily/weekly plans)
+     * Step-by-step problem solutions
+     * When explicitly asked for more details
+   - When exceeding 5 lines, keep it as concise as possible
+
+2. CONTENT GUIDELINES:
+   - Never explain concepts - only provide direct study guidance
+   - Focus on what to study, not why to study it
+   - Use bullet points for better readability
+   - Skip all motivational content and quotes
+   - Be direct and to the point
+
+3. RESPONSE FORMAT:
+   - Topic/Chapter to focus on
+   - Key points to remember
+   - Recommended practice problems
+   - Time allocation (if applicable)
+
+Example of a good response:
+- Focus on Organic Chemistry reactions
+- Practice named reactions daily
+- Solve 10 problems from NCERT
+- Allocate 2 hours daily
+- Review mistakes next day"""
+
+# Appended to the static prefix of every chat variant
+LANGUAGE_LINE = "\n\nUser's preferred language: {language}"
+
+# Per-turn message placed after the history, so it never changes the system message
+CONTEXT_MESSAGE = "Current user context: {context}"
+
+SUMMARY_PROMPT = """Please summarize the following conversation history for context in future interactions.
+Focus on key points, decisions, and important information. Keep it concise (3-5 sentences).
+
+Conversation History:
+{conversation}
+
+Summary:"""
+
+SUMMARY_UPDATE_PROMPT = """Please update the summary of an earlier conversation with the new messages below, for context in future interactions.
+Keep key points, decisions, and important information from both. Keep it concise (3-5 sentences).
+
+Summary So Far:
+{summary}
+
+New Messages:
+{conversation}
+
+Updated Summary:"""
+
+
+class _TemplateStats:
+    __slots__ = ("renders", "tokens", "max_tokens")
+
+    def __init__(self):
+        self.renders = 0
+        self.tokens = 0
+        self.max_tokens = 0
+
+
+class PromptRegistry:
+    """
+    Named prompts, compiled once and reused for every call.
+
+    Chat prompts are registered by their static system text and compiled
+    per language on first use. Text prompts (for summaries) are plain
+    str.format templates.
+    """
+
+    def __init__(self):
+        self._chat: Dict[str, str] = {}
+        self._text: Dict[str, str] = {}
+        self._compiled: Dict[Tuple[str, str], Any] = {}
+        self._prefix_tokens: Dict[Tuple[str, str], int] = {}
+        self._stats: Dict[str, _TemplateStats] = {}
+        self._lock = threading.Lock()
+
+    def register_chat(self, name: str, static_prompt: str):
+        """Register a chat prompt by its static system instructions."""
+        with self._lock:
+            self._chat[name] = static_prompt
+            for key in [k for k in self._compiled if k[0] == name]:
+                del self._compiled[key]
+                del self._prefix_tokens[key]
+
+    def register_text(self, name: str, template: str):
+        """Register a plain text prompt (str.format placeholders)."""
+        with self._lock:
+            self._text[name] = template
+
+    def static_prefix(self, name: str, language: str) -> str:
+        """The literal system message a chat prompt starts with."""
+        return self._chat[name] + LANGUAGE_LINE.format(language=language)
+
+    def get_chat(self, name: str, language: str):
+        """
+        Get the compiled chat template for a variant and language.
+
+        The template takes 'history', 'context' and 'question'.
+        """
+        key = (name, language)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            return compiled
+        from langchain_core.messages import SystemMessage
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+        prefix = self.static_prefix(name, language)
+        compiled = ChatPromptTemplate.from_messages([
+            # A message object, not a template, so it is never re-formatted
+            SystemMessage(content=prefix),
+            MessagesPlaceholder(variable_name="history"),
+            ("system", CONTEXT_MESSAGE),
+            ("human", "{question}")
+        ])
+        with self._lock:
+            self._compiled[key] = compiled
+            self._prefix_tokens[key] = count_tokens(prefix) + count_tokens(CONTEXT_MESSAGE)
+        return compiled
+
+    def fixed_tokens(self, name: str, language: str) -> int:
+        """Tokens a chat prompt uses before any context, history or question."""
+        self.get_chat(name, language)
+        return self._prefix_tokens[(name, language)]
+
+    def render_chat(
+        self,
+        name: str,
+        language: str,
+        context: str,
+        history: Sequence[Any],
+        question: str,
+        tokens: Optional[int] = None,
+    ):
+        """
+        Render a chat prompt and record its size.
+
+        Args:
+            name: Registered variant
+            language: Response language
+            context: Per-turn context text
+            history: Chat history messages
+            question: The student's question
+            tokens: Rendered token count if the caller already knows it
+
+        Returns:
+            The rendered ChatPromptValue
+        """
+        rendered = self.get_chat(name, language).invoke(
+            {"context": context, "history": list(history), "question": question}
+        )
+        if tokens is None:
+            tokens = self.fixed_tokens(name, language) + count_tokens(context) + count_tokens(question) \
+                + sum(count_tokens(str(m.content)) for m in history)
+        self.record(name, tokens)
+        return rendered
+
+    def render_text(self, name: str, **values: Any) -> str:
+        """Render a text prompt and record its size."""
+        text = self._text[name].format(**values)
+        self.record(name, count_tokens(text))
+        return text
+
+    def record(self, name: str, tokens: int):
+        with self._lock:
+            stats = self._stats.setdefault(name, _TemplateStats())
+            stats.renders += 1
+            stats.tokens += tokens
+            stats.max_tokens = max(stats.max_tokens, tokens)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Rendered token counts per template, for monitoring."""
+        with self._lock:
+            return {
+                name: {
+                    "renders": s.renders,
+                    "avg_tokens": s.tokens / s.renders if s.renders else 0.0,
+                    "max_tokens": s.max_tokens,
+                    "prefix_tokens": {
+                        language: tokens for (n, language), tokens in self._prefix_tokens.items() if n == name
+                    },
+                }
+                for name, s in self._stats.items()
+            }
+
+
+registry = PromptRegistry()
+registry.register_chat("coach", COACH_SYSTEM_PROMPT)
+registry.register_chat("mentor", EXAM_BUDDY_SYSTEM_PROMPT)
+registry.register_text("summary", SUMMARY_PROMPT)
+registry.register_text("summary_update", SUMMARY_UPDATE_PROMPT)
+
+
+def get_chat_variant() -> str:
+    """Chat prompt variant from EXAM_BUDDY_PROMPT_VARIANT ('coach' or 'mentor')."""
+    return os.getenv("EXAM_BUDDY_PROMPT_VARIANT", "coach")
+
+
+def warm(languages: List[str], variant: Optional[str] = None):
+    """Compile a variant's templates for the given languages ahead of use."""
+    for language in languages:
+        registry.get_chat(variant or get_chat_variant(), language)
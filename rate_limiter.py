@@ -0,0 +1,202 @@
+"""
+Client-side rate limiter for OpenAI calls.
+Token buckets for requests/min and tokens/min, with waiting calls served
+round-robin per student so one busy student cannot starve the rest.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Rough characters-per-token ratio for English/Indic prompts
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str, completion_tokens: int = 400) -> int:
+    """
+    Estimate the tokens a call will consume from its prompt size.
+
+    Args:
+        text: Rendered prompt text
+        completion_tokens: Expected response length to reserve
+
+    Returns:
+        int: Estimated prompt plus completion tokens
+    """
+    return len(text) // _CHARS_PER_TOKEN + 1 + completion_tokens
+
+
+class _Waiter:
+    __slots__ = ("tokens", "wake", "granted")
+
+    def __init__(self, tokens: int, wake: Callable[[], None]):
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and tokens per minute.
+
+    Both buckets start full and refill continuously. Waiting calls are
+    queued per key (student) and granted round-robin across keys, so the
+    quota is shared fairly and never exceeded. Usable from any thread and
+    any event loop.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        """
+        Args:
+            requests_per_minute: Request quota
+            tokens_per_minute: Token quota (prompt + completion)
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._granted = 0
+        self._total_wait = 0.0
+
+    def _refill_locked(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _dispatch_locked(self) -> float:
+        """
+        Grant queued calls while the buckets allow, one key at a time.
+
+        Returns:
+            float: Seconds until the next queued call could be granted
+        """
+        self._refill_locked(time.monotonic())
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            if self._requests < 1 or self._tokens < waiter.tokens:
+                missing_requests = max(0.0, 1 - self._requests) * 60 / self.requests_per_minute
+                missing_tokens = max(0.0, waiter.tokens - self._tokens) * 60 / self.tokens_per_minute
+                return max(missing_requests, missing_tokens, 0.01)
+            self._requests -= 1
+            self._tokens -= waiter.tokens
+            queue.popleft()
+            waiter.granted = True
+            waiter.wake()
+            self._granted += 1
+            # Next turn goes to the next key in line
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+        return 0.0
+
+    def _enqueue(self, key: Hashable, tokens: int, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(min(tokens, self.tokens_per_minute), wake)
+        with self._lock:
+            self._queues.setdefault(key, deque()).append(waiter)
+        return waiter
+
+    def _abandon(self, key: Hashable, waiter: _Waiter):
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[key]
+
+    async def acquire(self, key: Hashable, tokens: int):
+        """
+        Wait until a call for ``key`` using ``tokens`` fits in the quota.
+
+        Args:
+            key: Fairness key, e.g. the student or session ID
+            tokens: Estimated tokens for the call (see estimate_tokens)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        started = time.monotonic()
+        waiter = self._enqueue(key, tokens, wake)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch_locked()
+                if waiter.granted:
+                    break
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if not waiter.granted:
+                self._abandon(key, waiter)
+            raise
+        self._record_wait(started)
+
+    def acquire_blocking(self, key: Hashable, tokens: int):
+        """Blocking variant of acquire() for synchronous callers."""
+        event = threading.Event()
+        started = time.monotonic()
+        waiter = self._enqueue(key, tokens, event.set)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch_locked()
+                if waiter.granted:
+                    break
+                event.wait(delay)
+        except BaseException:
+            if not waiter.granted:
+                self._abandon(key, waiter)
+            raise
+        self._record_wait(started)
+
+    def _record_wait(self, started: float):
+        with self._lock:
+            self._total_wait += time.monotonic() - started
+
+    def queue_depth(self) -> int:
+        """Number of calls currently waiting for quota."""
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, bucket levels and wait times for monitoring."""
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            return {
+                "queue_depth": sum(len(queue) for queue in self._queues.values()),
+                "waiting_keys": len(self._queues),
+                "requests_available": int(self._requests),
+                "tokens_available": int(self._tokens),
+                "granted": self._granted,
+                "avg_wait_seconds": self._total_wait / self._granted if self._granted else 0.0,
+            }
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the process-wide limiter for OpenAI calls.
+
+    Quotas come from OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(
+            requests_per_minute=int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500")),
+            tokens_per_minute=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000")),
+        )
+    return _rate_limiter
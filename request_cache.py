@@ -0,0 +1,79 @@
+"""
+Request-scoped cache for Exam Buddy.
+An identity map that lets each document be read at most once per Streamlit
+rerun. Outside a request scope every lookup goes straight to the loader.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+_MISSING = object()
+
+
+class RequestCache:
+    """Per-request identity map of loaded documents, grouped by kind."""
+
+    def __init__(self):
+        self._entries: Dict[tuple, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, kind: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for (kind, key), loading it on first use."""
+        value = self._entries.get((kind, key), _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = loader()
+        self._entries[(kind, key)] = value
+        return value
+
+    def invalidate(self, kind: str, key: Optional[Hashable] = None):
+        """Drop one entry, or every entry of a kind when key is None."""
+        if key is not None:
+            self._entries.pop((kind, key), None)
+            return
+        for entry in [e for e in self._entries if e[0] == kind]:
+            del self._entries[entry]
+
+
+# asyncio.run and asyncio.to_thread copy the current context, so work started
+# from the Streamlit script thread sees the same cache
+_current: ContextVar[Optional[RequestCache]] = ContextVar("exam_buddy_request_cache", default=None)
+
+
+@contextmanager
+def request_scope() -> Iterator[RequestCache]:
+    """Cache lookups made inside the block; the cache is dropped on exit."""
+    cache = RequestCache()
+    token = _current.set(cache)
+    try:
+        yield cache
+    finally:
+        _current.reset(token)
+
+
+def cached(kind: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+    """
+    Load a value through the current request cache.
+
+    Args:
+        kind: Document kind, used for invalidation (e.g. 'session')
+        key: Identifier within the kind
+        loader: Callable that reads the value from the database
+
+    Returns:
+        The cached or freshly loaded value
+    """
+    cache = _current.get()
+    if cache is None:
+        return loader()
+    return cache.get_or_load(kind, key, loader)
+
+
+def invalidate(kind: str, key: Optional[Hashable] = None):
+    """Drop cached values after a write (no-op outside a request scope)."""
+    cache = _current.get()
+    if cache is not None:
+        cache.invalidate(kind, key)
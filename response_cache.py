@@ -0,0 +1,306 @@
+"""
+Semantic response cache for Exam Buddy.
+Answers near-identical study questions ("how to prepare organic chemistry
+for NEET") from memory instead of a new LLM call.
+
+Questions are normalized and embedded locally as sparse bag-of-words vectors
+(unigrams + bigrams). An inverted index over the words finds candidate
+entries within the same exam type, language and subject scope, and the
+closest one is returned if its cosine similarity clears the threshold.
+
+Only self-contained questions are cached. Follow-ups that lean on earlier
+turns ("explain that again", "what next") and questions with too few
+content words are never stored or served, since their answers depend on
+the conversation rather than on the question. The cache is keyed by
+non-personal fields only, so the same question from two students with the
+same exam, subjects and language is one entry; callers keep answers that
+name a student or repeat their marks out of it (see mentions_any).
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Set, Tuple
+
+_WORD = re.compile(r"\w+")
+
+# Words that carry no study-topic meaning (English and common Hinglish filler)
+_STOPWORDS = frozenset("""
+a an the to for of in on at and or is are was be do does did i me my we you your it this that
+how what which should can could would please tell give help about with from by as so some any
+hai kya kaise mujhe main hum ke ki ka ko se aur bhi
+""".split())
+
+# Words that point back at the conversation; a question containing any of
+# them cannot be answered without it
+_FOLLOW_UP_WORDS = frozenset("""
+that this it its those these them they he she his her their above previous earlier
+again same next more else also continue further elaborate yes no ok okay
+iske uske yeh woh phir dobara
+""".split())
+
+# Content words a question needs before its answer is shared
+MIN_CONTENT_WORDS = 3
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, NFKC-normalize, drop punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(_WORD.findall(text))
+
+
+def is_cacheable(normalized: str, min_content_words: int = MIN_CONTENT_WORDS) -> bool:
+    """Whether a normalized question stands on its own (no follow-up words, enough content)."""
+    words = normalized.split()
+    if any(word in _FOLLOW_UP_WORDS for word in words):
+        return False
+    return sum(1 for word in words if word not in _STOPWORDS) >= min_content_words
+
+
+def context_scope(*parts: Optional[str]) -> str:
+    """
+    Fingerprint of the non-personal context an answer depends on, such as
+    the student's subjects. Order and case do not matter.
+
+    Never pass a name, marks or summary: those would give every student
+    their own scope and the cache would never hit across students.
+    """
+    normalized = sorted({normalize_question(part) for part in parts if part and part.strip()})
+    if not normalized:
+        return ""
+    digest = hashlib.sha256("\x1f".join(normalized).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def mentions_any(text: str, terms) -> bool:
+    """Whether any term (e.g. a student's name or a mark) appears in text as whole words."""
+    words = f" {normalize_question(text)} "
+    return any(f" {term} " in words for term in map(normalize_question, terms) if term)
+
+
+def embed(normalized: str) -> Dict[str, float]:
+    """
+    Embed a normalized question as an L2-normalized sparse vector.
+
+    Features are content words plus adjacent word pairs, so reordered or
+    padded phrasings stay close while a changed topic word moves far away.
+    """
+    words = [w for w in normalized.split() if w not in _STOPWORDS]
+    features: Dict[str, float] = defaultdict(float)
+    for word in words:
+        features[word] += 1.0
+    for first, second in zip(words, words[1:]):
+        features[f"{first} {second}"] += 0.5
+    norm = math.sqrt(sum(v * v for v in features.values()))
+    return {k: v / norm for k, v in features.items()} if norm else {}
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class _Entry:
+    __slots__ = ("partition", "normalized", "vector", "response", "created_at")
+
+    def __init__(self, partition, normalized, vector, response, created_at):
+        self.partition = partition
+        self.normalized = normalized
+        self.vector = vector
+        self.response = response
+        self.created_at = created_at
+
+
+class SemanticResponseCache:
+    """
+    LRU + TTL cache of responses, looked up by question similarity.
+
+    Entries are partitioned by (exam type, language, scope), so a NEET
+    answer is never served to a JEE student, in the wrong language or for
+    other subjects.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        ttl: float = 86400,
+        threshold: float = 0.85,
+        min_content_words: int = MIN_CONTENT_WORDS,
+    ):
+        """
+        Args:
+            max_entries: Entries kept before least recently used ones are evicted
+            ttl: Seconds an entry stays valid
+            threshold: Minimum cosine similarity for a semantic hit
+            min_content_words: Content words a question needs to be cached
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_content_words = min_content_words
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[Tuple, int] = {}
+        self._index: Dict[Tuple, Set[int]] = defaultdict(set)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._hits_exact = 0
+        self._hits_semantic = 0
+        self._misses = 0
+        self._uncacheable = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    def _partition(exam_type: Optional[str], language: Optional[str], scope: str) -> Tuple[str, str, str]:
+        return ((exam_type or "").strip().lower(), (language or "English").strip().lower(), scope)
+
+    def get(
+        self,
+        question: str,
+        exam_type: Optional[str] = None,
+        language: Optional[str] = None,
+        scope: str = "",
+    ) -> Optional[str]:
+        """
+        Return a cached response for a similar question, if any.
+
+        Args:
+            question: The student's question
+            exam_type: Exam the student is preparing for
+            language: Response language
+            scope: context_scope() of the student's subjects
+
+        Returns:
+            The cached response, or None on a miss (always for follow-ups)
+        """
+        normalized = normalize_question(question)
+        if not is_cacheable(normalized, self.min_content_words):
+            with self._lock:
+                self._uncacheable += 1
+            return None
+        partition = self._partition(exam_type, language, scope)
+        now = time.monotonic()
+        with self._lock:
+            entry_id = self._exact.get((partition, normalized))
+            if entry_id is not None and self._fresh_locked(entry_id, now):
+                self._entries.move_to_end(entry_id)
+                self._hits_exact += 1
+                return self._entries[entry_id].response
+
+            vector = embed(normalized)
+            candidates = set()
+            for feature in vector:
+                if " " not in feature:
+                    candidates |= self._index.get((partition, feature), set())
+
+            best_id, best_score = None, self.threshold
+            for candidate in candidates:
+                if not self._fresh_locked(candidate, now):
+                    continue
+                score = _cosine(vector, self._entries[candidate].vector)
+                if score >= best_score:
+                    best_id, best_score = candidate, score
+
+            if best_id is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self._hits_semantic += 1
+            return self._entries[best_id].response
+
+    def put(
+        self,
+        question: str,
+        response: str,
+        exam_type: Optional[str] = None,
+        language: Optional[str] = None,
+        scope: str = "",
+    ):
+        """Store a response for a question (ignored for follow-ups)."""
+        normalized = normalize_question(question)
+        if not is_cacheable(normalized, self.min_content_words):
+            return
+        partition = self._partition(exam_type, language, scope)
+        vector = embed(normalized)
+        if not vector:
+            return
+        with self._lock:
+            existing = self._exact.get((partition, normalized))
+            if existing is not None:
+                self._remove_locked(existing)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(partition, normalized, vector, response, time.monotonic())
+            self._exact[(partition, normalized)] = entry_id
+            for feature in vector:
+                if " " not in feature:
+                    self._index[(partition, feature)].add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _fresh_locked(self, entry_id: int, now: float) -> bool:
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return False
+        if self.ttl and now - entry.created_at > self.ttl:
+            self._remove_locked(entry_id)
+            self._expirations += 1
+            return False
+        return True
+
+    def _remove_locked(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._exact.pop((entry.partition, entry.normalized), None)
+        for feature in entry.vector:
+            if " " not in feature:
+                ids = self._index.get((entry.partition, feature))
+                if ids is not None:
+                    ids.discard(entry_id)
+                    if not ids:
+                        del self._index[(entry.partition, feature)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate and size metrics for monitoring."""
+        with self._lock:
+            hits = self._hits_exact + self._hits_semantic
+            lookups = hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "lookups": lookups,
+                "hits_exact": self._hits_exact,
+                "hits_semantic": self._hits_semantic,
+                "misses": self._misses,
+                "uncacheable": self._uncacheable,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+_response_cache: Optional[SemanticResponseCache] = None
+
+
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    """
+    Get the process-wide response cache, or None if disabled.
+
+    Configured by EXAM_BUDDY_RESPONSE_CACHE (on/off),
+    EXAM_BUDDY_RESPONSE_CACHE_SIZE, EXAM_BUDDY_RESPONSE_CACHE_TTL (seconds)
+    and EXAM_BUDDY_RESPONSE_CACHE_THRESHOLD (cosine similarity).
+    """
+    global _response_cache
+    if os.getenv("EXAM_BUDDY_RESPONSE_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    if _response_cache is None:
+        _response_cache = SemanticResponseCache(
+            max_entries=int(os.getenv("EXAM_BUDDY_RESPONSE_CACHE_SIZE", "5000")),
+            ttl=float(os.getenv("EXAM_BUDDY_RESPONSE_CACHE_TTL", "86400")),
+            threshold=float(os.getenv("EXAM_BUDDY_RESPONSE_CACHE_THRESHOLD", "0.85")),
+        )
+    return _response_cache
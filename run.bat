@@ -2,6 +2,10 @@
 echo Installing required packages...
 pip install -r requirements.txt
 
+echo.
+echo Applying database indexes...
+python db_migrations.py
+
 echo.
 echo Starting Exam Buddy...
 streamlit run app.py
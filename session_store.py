@@ -0,0 +1,198 @@
+"""
+Session History Store for Exam Buddy
+Keeps per-session chat histories in memory with bounded size and idle expiry.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.messages import BaseMessage
+
+
+class BoundedChatMessageHistory(ChatMessageHistory):
+    """ChatMessageHistory that keeps only the most recent ``max_messages``."""
+
+    max_messages: int = 0
+
+    def add_message(self, message: BaseMessage) -> None:
+        super().add_message(message)
+        if self.max_messages and len(self.messages) > self.max_messages:
+            del self.messages[:-self.max_messages]
+
+
+class SessionHistoryStore(ABC):
+    """
+    Interface for session-history stores used by exam_buddy.
+
+    Subclasses decide where histories live and when they are dropped.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str):
+        """Return the history for a session, creating it if needed."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """Drop a session's history. Returns True if it existed."""
+
+    @abstractmethod
+    def session_ids(self) -> List[str]:
+        """Return the IDs of all sessions currently held."""
+
+    def stats(self) -> Dict[str, Any]:
+        """Return store metrics for monitoring."""
+        return {}
+
+
+class BoundedSessionStore(SessionHistoryStore):
+    """
+    In-memory LRU store with an idle TTL and a per-session message cap.
+
+    Histories are evicted when the store holds more than ``max_sessions``
+    (least recently used first) or when a session has been idle longer than
+    ``idle_ttl`` seconds. Safe to share between Streamlit script threads.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_ttl: float = 3600,
+        max_messages: int = 80,
+        history_factory: Optional[Callable[[str], Any]] = None,
+    ):
+        """
+        Args:
+            max_sessions: Maximum number of histories kept (0 = unbounded)
+            idle_ttl: Seconds of inactivity before a history expires (0 = never)
+            max_messages: Messages kept per history (0 = unbounded)
+            history_factory: Callable taking a session ID and returning a new
+                history. Defaults to a BoundedChatMessageHistory.
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self._history_factory = history_factory or self._default_history
+        self._histories: "OrderedDict[str, Any]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evicted_lru = 0
+        self._evicted_ttl = 0
+
+    def _default_history(self, session_id: str) -> BoundedChatMessageHistory:
+        return BoundedChatMessageHistory(max_messages=self.max_messages)
+
+    def get(self, session_id: str):
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            evicted.extend(self._expire_locked(now))
+            history = self._histories.get(session_id)
+            if history is None:
+                self._misses += 1
+                history = self._history_factory(session_id)
+                self._histories[session_id] = history
+            else:
+                self._hits += 1
+                self._histories.move_to_end(session_id)
+            self._last_access[session_id] = now
+            while self.max_sessions and len(self._histories) > self.max_sessions:
+                evicted.append(self._pop_locked(next(iter(self._histories))))
+                self._evicted_lru += 1
+        self._on_evict(evicted)
+        return history
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._histories:
+                return False
+            history = self._pop_locked(session_id)
+        self._on_evict([history])
+        return True
+
+    def session_ids(self) -> List[str]:
+        with self._lock:
+            evicted = self._expire_locked(time.monotonic())
+            ids = list(self._histories.keys())
+        self._on_evict(evicted)
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._histories),
+                "max_sessions": self.max_sessions,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evicted_lru": self._evicted_lru,
+                "evicted_ttl": self._evicted_ttl,
+            }
+
+    def _pop_locked(self, session_id: str):
+        self._last_access.pop(session_id, None)
+        return self._histories.pop(session_id)
+
+    def _expire_locked(self, now: float) -> list:
+        """Drop idle histories. Oldest-accessed entries sit at the front."""
+        if not self.idle_ttl:
+            return []
+        expired = []
+        for session_id in list(self._histories.keys()):
+            if now - self._last_access[session_id] <= self.idle_ttl:
+                break
+            expired.append(self._pop_locked(session_id))
+            self._evicted_ttl += 1
+        return expired
+
+    def _on_evict(self, histories: list) -> None:
+        """Hook called outside the lock with histories that were dropped."""
+        for history in histories:
+            close = getattr(history, "close", None)
+            if callable(close):
+                close()
+
+
+def history_backend() -> str:
+    """
+    Return the configured history backend.
+
+    "memory" keeps histories in-process; "mongo" reads and writes the
+    conversation array of the session document.
+    """
+    return os.getenv("EXAM_BUDDY_HISTORY_BACKEND", "memory").lower()
+
+
+def create_session_store_from_env() -> BoundedSessionStore:
+    """
+    Build the default store from environment variables.
+
+    EXAM_BUDDY_MAX_SESSIONS, EXAM_BUDDY_SESSION_TTL (seconds) and
+    EXAM_BUDDY_MAX_MESSAGES override the defaults. With
+    EXAM_BUDDY_HISTORY_BACKEND=mongo the store holds MongoChatMessageHistory
+    objects, so it acts as a local cache in front of MongoDB.
+    """
+    max_messages = int(os.getenv("EXAM_BUDDY_MAX_MESSAGES", "80"))
+    history_factory = None
+    if history_backend() == "mongo":
+        from mongo_history import MongoChatMessageHistory
+
+        def history_factory(session_id: str):
+            return MongoChatMessageHistory(
+                session_id,
+                max_messages=max_messages,
+                flush_size=int(os.getenv("EXAM_BUDDY_HISTORY_FLUSH_SIZE", "2")),
+                flush_interval=float(os.getenv("EXAM_BUDDY_HISTORY_FLUSH_INTERVAL", "5")),
+                cache_ttl=float(os.getenv("EXAM_BUDDY_HISTORY_CACHE_TTL", "30")),
+            )
+
+    return BoundedSessionStore(
+        max_sessions=int(os.getenv("EXAM_BUDDY_MAX_SESSIONS", "1000")),
+        idle_ttl=float(os.getenv("EXAM_BUDDY_SESSION_TTL", "3600")),
+        max_messages=max_messages,
+        history_factory=history_factory,
+    )
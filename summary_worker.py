@@ -0,0 +1,379 @@
+"""
+Background conversation summaries for Exam Buddy.
+Logout and login enqueue a summary job instead of waiting on the LLM. Jobs
+are persisted in the summary_jobs collection and run on a small thread
+pool, with retries, exponential backoff and at most one active job per
+student.
+"""
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from db_connection import get_database
+from db_migrations import INDEX_SPECS
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+# The partial unique index that keeps one active job per student
+ACTIVE_JOB_INDEX = next(spec for spec in INDEX_SPECS["summary_jobs"] if spec["name"] == "summary_jobs_active_student")
+
+
+# Bounds on the new messages folded into the summary per LLM call
+SUMMARY_CHUNK_MESSAGES = int(os.getenv("EXAM_BUDDY_SUMMARY_CHUNK_MESSAGES", "20"))
+SUMMARY_CHUNK_CHARS = int(os.getenv("EXAM_BUDDY_SUMMARY_CHUNK_CHARS", "8000"))
+SUMMARY_MESSAGE_CHARS = 2000
+
+
+def _chunks(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split messages into chunks bounded by count and total characters."""
+    chunks, current, size = [], [], 0
+    for message in messages:
+        content = str(message.get("content", ""))[:SUMMARY_MESSAGE_CHARS]
+        if current and (len(current) >= SUMMARY_CHUNK_MESSAGES or size + len(content) > SUMMARY_CHUNK_CHARS):
+            chunks.append(current)
+            current, size = [], 0
+        current.append({"role": message.get("role", "user"), "content": content})
+        size += len(content)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def update_rolling_summary(sessions, query: Dict[str, Any]) -> Optional[str]:
+    """
+    Fold messages added since the last summary into the stored summary.
+
+    The session keeps ``summary`` and ``summary_watermark``, the number of
+    messages (counted by ``message_count``) already folded in. Only newer
+    messages are sent to the LLM, a bounded chunk at a time, so the cost of
+    a summary does not grow with the length of the conversation. Progress is
+    saved after every chunk.
+
+    Args:
+        sessions: Sessions collection
+        query: Filter matching the session document
+
+    Returns:
+        The current summary, or None if the session has no conversation
+    """
+    from exam_buddy import generate_summary
+
+    session = sessions.find_one(
+        query, {"conversation": 1, "message_count": 1, "summary": 1, "summary_watermark": 1}
+    )
+    if not session or not session.get("conversation"):
+        return None
+
+    conversation = session["conversation"]
+    # Sessions written before message_count existed count what they hold
+    total = max(session.get("message_count", 0), len(conversation))
+    first_held = total - len(conversation)
+    watermark = session.get("summary_watermark", 0)
+    summary = session.get("summary", "")
+    new_messages = conversation[max(watermark, first_held) - first_held:]
+
+    position = max(watermark, first_held)
+    for chunk in _chunks(new_messages):
+        summary = generate_summary(chunk, summary)
+        position += len(chunk)
+        saved = sessions.update_one(
+            {"_id": session["_id"], "summary_watermark": {"$in": [watermark, None]}},
+            {"$set": {
+                "summary": summary,
+                "summary_watermark": position,
+                "context": summary,
+                "summarized_at": datetime.utcnow(),
+            }}
+        )
+        if not saved.matched_count:
+            # Another worker moved the watermark; its summary wins
+            return sessions.find_one({"_id": session["_id"]}, {"summary": 1}).get("summary")
+        watermark = position
+    return summary
+
+
+def summarize_student_conversation(job: Dict[str, Any]) -> Optional[str]:
+    """
+    Default job handler: update a student's rolling summary and store it as context.
+
+    Args:
+        job: Job document with 'student_id' and optionally 'session_id'
+
+    Returns:
+        The stored summary, or None if there was nothing to summarize
+    """
+    sessions = get_database()['exam_buddy_session']
+    query = {"student_id": ObjectId(job["student_id"])} if ObjectId.is_valid(job["student_id"]) \
+        else {"session_id": job.get("session_id")}
+    return update_rolling_summary(sessions, query)
+
+
+class SummaryWorker:
+    """
+    Mongo-backed job queue for conversation summaries.
+
+    A job is unique per student while it is pending or running (enforced by
+    the summary_jobs_active_student index, which the first enqueue creates
+    if db_migrations has not). Enqueueing again while a job is
+    running marks it dirty, so it runs once more after finishing and picks
+    up the newer messages. Jobs left running by a crashed process are
+    requeued after ``stale_after`` seconds.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Any] = summarize_student_conversation,
+        max_workers: int = 2,
+        max_attempts: int = 3,
+        base_backoff: float = 5.0,
+        poll_interval: float = 30.0,
+        stale_after: float = 600.0,
+        collection=None,
+    ):
+        """
+        Args:
+            handler: Function run for each job
+            max_workers: Threads running jobs
+            max_attempts: Attempts before a job is marked failed
+            base_backoff: Seconds before the first retry, doubled each attempt
+            poll_interval: Seconds between scans for due retries
+            stale_after: Seconds after which a running job counts as abandoned
+            collection: Jobs collection (defaults to summary_jobs)
+        """
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._collection = collection
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._index_ready = False
+        self._enqueued = 0
+        self._deduplicated = 0
+        self._completed = 0
+        self._retried = 0
+        self._failed = 0
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_database()['summary_jobs']
+        return self._collection
+
+    def _ensure_index(self):
+        """
+        Create the one-active-job-per-student index unless it exists.
+
+        Without it two concurrent upserts could both insert a job. A no-op
+        when db_migrations already built it; raises OperationFailure if an
+        index with other options is in the way.
+        """
+        if self._index_ready:
+            return
+        self.collection.create_index(
+            ACTIVE_JOB_INDEX["keys"], name=ACTIVE_JOB_INDEX["name"], **ACTIVE_JOB_INDEX["options"]
+        )
+        self._index_ready = True
+
+    def enqueue(self, student_id: str, session_id: Optional[str] = None) -> bool:
+        """
+        Queue a summary for a student, unless one is already queued.
+
+        Args:
+            student_id: Student whose conversation to summarize
+            session_id: Session the conversation belongs to
+
+        Returns:
+            bool: True if the job was recorded (new or merged into an
+            active one), False if the queue could not be reached
+        """
+        now = datetime.utcnow()
+        update = {
+            "$set": {"session_id": session_id, "requested_at": now, "dirty": True},
+            "$setOnInsert": {
+                "student_id": str(student_id),
+                "status": PENDING,
+                "active": True,
+                "attempts": 0,
+                "created_at": now,
+                "next_attempt_at": now,
+            },
+        }
+        try:
+            self._ensure_index()
+        except PyMongoError as e:
+            print(f"Error enqueueing summary job: {ACTIVE_JOB_INDEX['name']} index is missing "
+                  f"and could not be created ({e}); run python db_migrations.py --drop-conflicting")
+            return False
+        for _ in range(2):
+            try:
+                before = self.collection.find_one_and_update(
+                    {"student_id": str(student_id), "active": True},
+                    update,
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE,
+                )
+                break
+            except DuplicateKeyError:
+                # Lost an upsert race with another enqueue; merge into its job
+                continue
+            except PyMongoError as e:
+                print(f"Error enqueueing summary job: {e}")
+                return False
+        else:
+            return False
+
+        with self._lock:
+            if before is None:
+                self._enqueued += 1
+            else:
+                self._deduplicated += 1
+        self._ensure_started()
+        self._executor.submit(self.drain)
+        return True
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"$set": {"status": RUNNING, "dirty": False, "started_at": now}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _run_job(self, job: Dict[str, Any]):
+        try:
+            self.handler(job)
+        except Exception as e:
+            print(f"Summary job for student {job['student_id']} failed: {e}")
+            if job["attempts"] >= self.max_attempts:
+                self.collection.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"status": FAILED, "error": str(e), "finished_at": datetime.utcnow()},
+                     "$unset": {"active": ""}}
+                )
+                with self._lock:
+                    self._failed += 1
+            else:
+                delay = self.base_backoff * 2 ** (job["attempts"] - 1)
+                self.collection.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"status": PENDING, "error": str(e),
+                              "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)}}
+                )
+                with self._lock:
+                    self._retried += 1
+            return
+
+        finished = self.collection.update_one(
+            {"_id": job["_id"], "dirty": False},
+            {"$set": {"status": DONE, "finished_at": datetime.utcnow()}, "$unset": {"active": "", "error": ""}}
+        )
+        if not finished.matched_count:
+            # Enqueued again while running: summarize the newer messages too
+            self.collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": PENDING, "attempts": 0, "next_attempt_at": datetime.utcnow()}}
+            )
+            self._executor.submit(self.drain)
+        with self._lock:
+            self._completed += 1
+
+    def drain(self) -> int:
+        """
+        Run due jobs until none are left.
+
+        Returns:
+            int: Number of jobs run
+        """
+        ran = 0
+        try:
+            while True:
+                job = self._claim()
+                if job is None:
+                    return ran
+                self._run_job(job)
+                ran += 1
+        except PyMongoError as e:
+            print(f"Error processing summary jobs: {e}")
+            return ran
+
+    def requeue_stale(self) -> int:
+        """Return jobs stuck in running (e.g. after a crash) to the queue."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        try:
+            result = self.collection.update_many(
+                {"status": RUNNING, "started_at": {"$lt": cutoff}},
+                {"$set": {"status": PENDING, "next_attempt_at": datetime.utcnow()}}
+            )
+            return result.modified_count
+        except PyMongoError as e:
+            print(f"Error requeueing summary jobs: {e}")
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        """Job counters for monitoring."""
+        with self._lock:
+            return {
+                "enqueued": self._enqueued,
+                "deduplicated": self._deduplicated,
+                "completed": self._completed,
+                "retried": self._retried,
+                "failed": self._failed,
+            }
+
+    def stop(self, wait: bool = True):
+        """Stop polling and, optionally, wait for running jobs to finish."""
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._wakeup.clear()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="exam-buddy-summary"
+                )
+                self._thread = threading.Thread(
+                    target=self._run, name="exam-buddy-summary-poller", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        # Picks up retries whose backoff has passed and jobs from crashed runs
+        while not self._wakeup.wait(self.poll_interval):
+            try:
+                due = self.requeue_stale() or self.collection.count_documents(
+                    {"status": PENDING, "next_attempt_at": {"$lte": datetime.utcnow()}}, limit=1
+                )
+            except PyMongoError as e:
+                print(f"Error polling summary jobs: {e}")
+                continue
+            if due:
+                self._executor.submit(self.drain)
+
+
+# Global worker shared by app and auth
+summary_worker = SummaryWorker(
+    max_workers=int(os.getenv("EXAM_BUDDY_SUMMARY_WORKERS", "2")),
+    max_attempts=int(os.getenv("EXAM_BUDDY_SUMMARY_MAX_ATTEMPTS", "3")),
+)
+atexit.register(summary_worker.stop)
@@ -0,0 +1,140 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("dotenv")
+
+from api_key_rotator import (  # noqa: E402
+    APIKeyPool,
+    _parse_duration,
+    get_retry_after,
+    is_rate_limit_error,
+    is_transient_error,
+    load_api_keys,
+)
+
+
+def headers(remaining_requests, remaining_tokens, limit_requests=100, limit_tokens=10000):
+    return {
+        "x-ratelimit-limit-requests": str(limit_requests),
+        "x-ratelimit-limit-tokens": str(limit_tokens),
+        "x-ratelimit-remaining-requests": str(remaining_requests),
+        "x-ratelimit-remaining-tokens": str(remaining_tokens),
+        "x-ratelimit-reset-requests": "1m",
+        "x-ratelimit-reset-tokens": "1m",
+    }
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+class APITimeoutError(Exception):
+    """Named like the OpenAI client's error, which is matched by class name."""
+
+
+def test_key_with_most_headroom_is_chosen():
+    pool = APIKeyPool(["key-a", "key-b", "key-c"])
+    for key, remaining in (("key-a", 20), ("key-b", 90), ("key-c", 50)):
+        pool.release(key, headers(remaining, 10000))
+
+    assert pool.best_key() == "key-b"
+    # Each call in flight counts against its key's request headroom
+    assert [pool.acquire() for _ in range(3)] == ["key-b", "key-b", "key-b"]
+    pool.release("key-b", headers(40, 10000))
+    assert pool.acquire() == "key-c"
+
+
+def test_token_headroom_counts_as_well():
+    pool = APIKeyPool(["key-a", "key-b"])
+    pool.release("key-a", headers(90, 500))
+    pool.release("key-b", headers(60, 9000))
+
+    # key-a has more requests left but only 5% of its tokens
+    assert pool.best_key() == "key-b"
+
+
+def test_calls_in_flight_spread_over_fresh_keys():
+    pool = APIKeyPool(["key-a", "key-b", "key-c"])
+
+    assert sorted(pool.acquire() for _ in range(3)) == ["key-a", "key-b", "key-c"]
+
+
+def test_rate_limited_key_is_benched():
+    pool = APIKeyPool(["key-a", "key-b"], base_cooldown=60)
+    pool.release("key-a", headers(99, 9900))
+    pool.release("key-b", headers(10, 1000))
+
+    key = pool.acquire()
+    assert key == "key-a"
+    pool.report_rate_limited(key)
+
+    assert pool.acquire() == "key-b"
+    assert [s["rate_limited"] for s in pool.stats()] == [1, 0]
+    assert pool.stats()[0]["benched_for"] > 0
+
+
+def test_cooldown_doubles_and_respects_retry_after():
+    pool = APIKeyPool(["key-a"], base_cooldown=1, max_cooldown=8)
+
+    benched = []
+    for _ in range(5):
+        pool.report_rate_limited(pool.acquire())
+        benched.append(pool.stats()[0]["benched_for"])
+    assert benched == pytest.approx([1, 2, 4, 8, 8], abs=0.2)
+
+    pool.report_rate_limited(pool.acquire(), retry_after=30)
+    assert pool.stats()[0]["benched_for"] == pytest.approx(30, abs=0.2)
+
+    # A successful call resets the strikes
+    pool.release(pool.acquire())
+    pool.report_rate_limited(pool.acquire())
+    assert pool.stats()[0]["benched_for"] == pytest.approx(1, abs=0.2)
+
+
+def test_all_benched_uses_the_first_to_recover():
+    pool = APIKeyPool(["key-a", "key-b"], base_cooldown=10)
+    pool.report_rate_limited("key-a", retry_after=50)
+    pool.report_rate_limited("key-b", retry_after=20)
+
+    assert pool.acquire() == "key-b"
+
+
+def test_error_classification():
+    assert is_rate_limit_error(StatusError(429))
+    assert not is_rate_limit_error(StatusError(500))
+
+    for error in (StatusError(500), StatusError(503), StatusError(408), StatusError(409),
+                  APITimeoutError(), TimeoutError(), ConnectionError()):
+        assert is_transient_error(error), error
+    for error in (StatusError(400), StatusError(401), StatusError(404), ValueError("bad")):
+        assert not is_transient_error(error), error
+
+    assert get_retry_after(StatusError(429, retry_after="2.5")) == 2.5
+    assert get_retry_after(StatusError(429)) is None
+
+
+def test_parse_duration():
+    assert _parse_duration("20ms") == pytest.approx(0.02)
+    assert _parse_duration("6m0s") == 360
+    assert _parse_duration("1h2m3.5s") == pytest.approx(3723.5)
+    assert _parse_duration("7") == 7
+    assert _parse_duration("") is None
+    assert _parse_duration("soon") is None
+
+
+def test_load_api_keys_deduplicates(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEYS", "k1, k2,,k1")
+    monkeypatch.setenv("OPENAI_API_KEY", "k2")
+    monkeypatch.setenv("OPENAI_API_KEY_1", "k3")
+    monkeypatch.setenv("OPENAI_API_KEY_2", "k1")
+    monkeypatch.delenv("OPENAI_API_KEY_3", raising=False)
+
+    assert load_api_keys() == ["k1", "k2", "k3"]
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_builder import ContextBuilder, count_tokens  # noqa: E402
+
+
+def conversation(count):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * 20}
+        for i in range(count)
+    ]
+
+
+def window(builder, messages, offset=0, budget=600):
+    kept = builder._fit_messages(messages, budget, offset=offset, block=builder.history_block)[0]
+    return len(messages) + offset - len(kept)
+
+
+def test_window_start_only_moves_by_whole_blocks():
+    builder = ContextBuilder(history_block=10)
+    starts = [window(builder, conversation(n)) for n in range(20, 60, 2)]
+
+    assert all(start % 10 == 0 for start in starts)
+    # It holds for several turns at a time instead of sliding every turn
+    assert len(set(starts)) < len(starts) / 2
+    assert starts == sorted(starts)
+
+
+def test_aligned_window_still_fits_and_opens_on_a_question():
+    builder = ContextBuilder(history_block=10)
+    messages = conversation(47)
+    kept, used = builder._fit_messages(messages, 300, block=10)
+
+    assert kept and kept[0]["role"] == "user"
+    assert used == sum(count_tokens(m["content"]) + builder.MESSAGE_OVERHEAD for m in kept) <= 300
+
+
+def test_blocks_count_messages_sliced_off_by_the_store():
+    builder = ContextBuilder(history_block=10)
+    full = conversation(50)
+
+    # The store holds only the last 30 of 50 messages
+    assert window(builder, full[20:], offset=20) == window(builder, full)
+
+
+def test_window_is_not_emptied_to_reach_a_boundary():
+    builder = ContextBuilder(history_block=10)
+    messages = conversation(5)
+    # Only the newest message fits; the next boundary is past the end
+    budget = count_tokens(messages[-1]["content"]) + builder.MESSAGE_OVERHEAD
+
+    assert builder._fit_messages(messages, budget, offset=7, block=10)[0] == messages[-1:]
+
+
+@pytest.mark.parametrize("block", [1, 10])
+def test_build_keeps_the_system_and_history_prefix_stable(block):
+    builder = ContextBuilder(max_prompt_tokens=1200, history_block=block)
+    histories = [
+        builder.build(f"question {n}", system_tokens=300, summary=f"summary {n}",
+                      history=conversation(n))["history"]
+        for n in range(30, 40, 2)
+    ]
+    firsts = {history[0]["content"] for history in histories}
+
+    if block == 1:
+        # Without blocks the window slides every turn
+        assert len(firsts) == len(histories)
+    else:
+        assert len(firsts) < len(histories)
@@ -0,0 +1,118 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from db_migrations import INDEX_SPECS, migrate_indexes, plan_index_changes  # noqa: E402
+
+
+class FakeCollection:
+    """index_information/create_indexes/drop_index over a dict, like pymongo reports them."""
+
+    def __init__(self):
+        self.indexes = {"_id_": {"v": 2, "key": [("_id", 1)]}}
+        self.created = []
+        self.dropped = []
+
+    def index_information(self):
+        return {name: dict(info) for name, info in self.indexes.items()}
+
+    def create_indexes(self, models):
+        for model in models:
+            document = dict(model.document)
+            name = document.pop("name")
+            self.indexes[name] = {"v": 2, "key": list(document.pop("key").items()), **document}
+            self.created.append(name)
+
+    def drop_index(self, name):
+        del self.indexes[name]
+        self.dropped.append(name)
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+def all_spec_names():
+    return {spec["name"] for specs in INDEX_SPECS.values() for spec in specs}
+
+
+def test_empty_database_plans_every_index():
+    actions = plan_index_changes(FakeDatabase())
+
+    assert {a["action"] for a in actions} == {"create"}
+    assert {a["name"] for a in actions} == all_spec_names()
+
+
+def test_second_run_is_a_no_op():
+    db = FakeDatabase()
+    migrate_indexes(db)
+
+    assert plan_index_changes(db) == []
+    assert migrate_indexes(db) == []
+
+
+def test_equivalent_index_under_another_name_is_kept():
+    db = FakeDatabase()
+    # Built by older code: same keys and options, default name, extra options
+    db["exam_buddy_session"].indexes["session_id_1"] = {
+        "v": 2, "key": [("session_id", 1)], "unique": True, "background": True
+    }
+
+    names = {a["name"] for a in plan_index_changes(db) if a["collection"] == "exam_buddy_session"}
+    assert "session_id_unique" not in names
+    assert names == {"expires_at_ttl", "student_id_unique_sparse"}
+
+
+def test_partial_filter_must_match():
+    db = FakeDatabase()
+    db["summary_jobs"].indexes["summary_jobs_active_student"] = {
+        "v": 2, "key": [("student_id", 1)], "unique": True,
+        "partialFilterExpression": {"status": "pending"}
+    }
+
+    conflicts = [a for a in plan_index_changes(db) if a["action"] == "conflict"]
+    assert [(c["name"], c["existing"]) for c in conflicts] == [
+        ("summary_jobs_active_student", "summary_jobs_active_student")
+    ]
+
+
+def test_conflict_is_left_alone_without_drop_conflicting():
+    db = FakeDatabase()
+    sessions = db["exam_buddy_session"]
+    # Same keys as session_id_unique but not unique
+    sessions.indexes["session_id_1"] = {"v": 2, "key": [("session_id", 1)]}
+
+    migrate_indexes(db)
+
+    assert sessions.dropped == []
+    assert "session_id_unique" not in sessions.indexes
+    assert sessions.indexes["session_id_1"] == {"v": 2, "key": [("session_id", 1)]}
+    assert [a["existing"] for a in plan_index_changes(db) if a["action"] == "conflict"] == ["session_id_1"]
+
+
+def test_drop_conflicting_replaces_the_index():
+    db = FakeDatabase()
+    sessions = db["exam_buddy_session"]
+    sessions.indexes["session_id_1"] = {"v": 2, "key": [("session_id", 1)]}
+
+    migrate_indexes(db, drop_conflicting=True)
+
+    assert sessions.dropped == ["session_id_1"]
+    assert sessions.indexes["session_id_unique"]["unique"] is True
+    assert plan_index_changes(db) == []
+
+
+def test_dry_run_changes_nothing():
+    db = FakeDatabase()
+    actions = migrate_indexes(db, dry_run=True)
+
+    assert actions
+    assert all(coll.created == [] for coll in db.values())
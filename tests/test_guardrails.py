@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.join(REPO, "benchmarks"))
+
+from guardrails import REFUSAL_MESSAGE, GuardrailEngine  # noqa: E402
+from guardrails_bench import legacy_filter, legacy_should_respond, make_input  # noqa: E402
+
+# Inputs where the removal passes overlap, so their order decides the result
+OVERLAPPING = [
+    "```see http://x.com```",
+    "http://x`y`",
+    "read `www.a.com` and `b`",
+    "```a `b` c``` `d`",
+    "`unclosed ``` block\nhttp://x.com ``` tail",
+    "``` one\n`two`\n``` three ```",
+    "`a\nb` c",
+    "wwwxy `code` http",
+    "``````",
+    "`http://a.com`b`",
+    "see ```py\nprint('hack')\n``` then the exam paper",
+]
+
+
+@pytest.fixture
+def engine():
+    return GuardrailEngine()
+
+
+@pytest.mark.parametrize("text", OVERLAPPING + [
+    make_input(size, case) for size in (50, 1000, 2000) for case in ("plain", "markup", "blocked")
+])
+def test_matches_the_legacy_filter(engine, text):
+    result = engine.check(text)
+
+    assert result.text == legacy_filter(text)
+    assert result.allowed == legacy_should_respond(legacy_filter(text))
+
+
+def test_removals_and_truncation_are_reported(engine):
+    result = engine.check("see www.example.com and `code` " + "x" * 2000)
+
+    assert result.removed == 2
+    assert result.truncated
+    assert result.text.endswith("... [truncated]")
+    assert engine.check("How do I revise optics?").removed == 0
+
+
+def test_blocked_terms_in_order_of_appearance(engine):
+    result = engine.check("Is there an exam paper LEAK or a way to cheat?")
+
+    assert not result.allowed
+    assert result.blocked_terms == ["exam paper", "leak", "cheat"]
+    assert result.reason == "blocked topic: exam paper, leak, cheat"
+    assert engine.is_allowed("How do I revise optics?")
+
+
+def test_blocked_term_inside_removed_code_is_ignored(engine):
+    assert engine.check("`hack` how do I revise optics?").allowed
+
+
+def test_screen_counts_blocked_messages(engine):
+    engine.screen("How do I revise optics?")
+    engine.screen("give me the exam paper")
+
+    stats = engine.stats()
+    assert (stats["screened"], stats["blocked"]) == (2, 1)
+    assert stats["blocked_terms"] == {"exam paper": 1}
+    assert REFUSAL_MESSAGE
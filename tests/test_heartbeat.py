@@ -0,0 +1,94 @@
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from pymongo import UpdateOne  # noqa: E402
+from pymongo.errors import PyMongoError  # noqa: E402
+
+from db_connection import session_filter  # noqa: E402
+from heartbeat import ActivityHeartbeat  # noqa: E402
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class FakeSessions:
+    """Records bulk_write calls; fails the next ``fail`` of them."""
+
+    def __init__(self, fail=0):
+        self.calls = []
+        self.fail = fail
+
+    def bulk_write(self, requests, ordered=True):
+        if self.fail:
+            self.fail -= 1
+            raise PyMongoError("down")
+        self.calls.append((list(requests), ordered))
+        return SimpleNamespace(matched_count=len(requests))
+
+
+@pytest.fixture
+def beat():
+    # Long interval: the tests flush by hand
+    heartbeat = ActivityHeartbeat(flush_interval=3600, collection=FakeSessions())
+    yield heartbeat
+    heartbeat.stop()
+
+
+def test_touches_coalesce_into_one_write_per_session(beat):
+    for seconds in range(5):
+        beat.touch_session("s-1", at=T0 + timedelta(seconds=seconds))
+    beat.touch_session("s-2", at=T0)
+
+    assert beat.flush() == 2
+    (requests, ordered), = beat.collection.calls
+    assert ordered is False
+    assert requests == [
+        UpdateOne(session_filter("s-1"), {"$max": {"last_activity": T0 + timedelta(seconds=4)}}),
+        UpdateOne(session_filter("s-2"), {"$max": {"last_activity": T0}}),
+    ]
+    assert beat.stats() == {"touches": 6, "pending": 0, "flushes": 1, "writes": 2}
+
+
+def test_older_touch_does_not_replace_a_newer_one(beat):
+    beat.touch_session("s-1", at=T0 + timedelta(minutes=1))
+    beat.touch_session("s-1", at=T0)
+    beat.flush()
+
+    (requests, _), = beat.collection.calls
+    assert requests == [UpdateOne(session_filter("s-1"), {"$max": {"last_activity": T0 + timedelta(minutes=1)}})]
+
+
+def test_empty_flush_writes_nothing(beat):
+    assert beat.flush() == 0
+    beat.touch_session("")
+    assert beat.flush() == 0
+    assert beat.collection.calls == []
+
+
+def test_discarded_session_is_not_written(beat):
+    beat.touch_session("s-1", at=T0)
+    beat.discard_session("s-1")
+
+    assert beat.flush() == 0
+
+
+def test_failed_flush_keeps_the_newest_touch(beat):
+    beat.collection.fail = 1
+    beat.touch_session("s-1", at=T0)
+    assert beat.flush() == 0
+
+    # A newer touch arrived while the write was failing
+    beat.touch_session("s-1", at=T0 + timedelta(seconds=30))
+    beat.touch_session("s-2", at=T0)
+    assert beat.flush() == 2
+
+    (requests, _), = beat.collection.calls
+    assert UpdateOne(session_filter("s-1"), {"$max": {"last_activity": T0 + timedelta(seconds=30)}}) in requests
@@ -0,0 +1,110 @@
+import os
+import string
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from language_detect import (  # noqa: E402
+    SCRIPT_RANGES,
+    detect_language,
+    normalize_language,
+    script_histogram,
+)
+
+SAMPLES = {
+    "English": "How should I revise organic chemistry for NEET?",
+    "Hindi": "मुझे भौतिकी कैसे पढ़नी चाहिए?",
+    "Tamil": "நான் இயற்பியலை எப்படி படிக்க வேண்டும்?",
+    "Telugu": "నేను భౌతిక శాస్త్రం ఎలా చదవాలి?",
+    "Kannada": "ನಾನು ಭೌತಶಾಸ್ತ್ರವನ್ನು ಹೇಗೆ ಓದಬೇಕು?",
+    "Malayalam": "ഞാൻ ഭൗതികശാസ്ത്രം എങ്ങനെ പഠിക്കണം?",
+}
+
+
+def reference_histogram(text):
+    """Per-character count, the way the byte tables are meant to behave."""
+    histogram = Counter()
+    for char in text:
+        if char in string.ascii_letters:
+            histogram["English"] += 1
+        for language, (first, last) in SCRIPT_RANGES.items():
+            if first <= ord(char) <= last:
+                histogram[language] += 1
+    return histogram
+
+
+@pytest.mark.parametrize("text", [
+    *SAMPLES.values(),
+    "",
+    "12345 ?!",
+    "NEET के लिए physics में 45 marks",
+    "café naïve — 日本語 😀 ঁ ૐ ෴",  # Latin-1, CJK, emoji and neighbouring Indic blocks
+    "ऀॿ஀௿ఀ౿ಀ೿ഀൿ",  # first and last code point of every block
+])
+def test_histogram_matches_a_per_character_count(text):
+    assert script_histogram(text) == reference_histogram(text)
+
+
+@pytest.mark.parametrize("language", SAMPLES)
+def test_each_sidebar_language_is_detected(language):
+    result = detect_language(SAMPLES[language])
+
+    assert result.language == language
+    assert result.confidence == pytest.approx(1.0)
+    assert not result.romanized
+
+
+def test_mixed_script_picks_the_majority():
+    result = detect_language("NEET के लिए भौतिकी की तैयारी कैसे करूं")
+
+    assert result.language == "Hindi"
+    assert 0.5 < result.confidence < 1.0
+    assert result.scores["Hindi"] + result.scores["English"] == pytest.approx(1.0)
+
+
+def test_romanized_hindi():
+    result = detect_language("mujhe physics kaise padhna hai")
+
+    assert result.language == "Hindi"
+    assert result.romanized
+    assert result.prompt_language == "Hindi (in Latin script)"
+    assert sum(result.scores.values()) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("text", [
+    "How should I revise organic chemistry for NEET?",
+    # One Hindi-looking word is not enough
+    "What is the ka value of acetic acid?",
+    # Hindi words past the sampled prefix are ignored
+    "Explain thermodynamics. " * 20 + "mujhe kaise padhna hai",
+])
+def test_english_is_not_taken_for_romanized_hindi(text):
+    result = detect_language(text)
+
+    assert result.language == "English"
+    assert not result.romanized
+
+
+def test_no_letters_falls_back_to_the_default():
+    result = detect_language("12 + 7 = ?", default="Tamil")
+
+    assert (result.language, result.confidence, result.scores) == ("Tamil", 0.0, {})
+
+
+@pytest.mark.parametrize("selection, expected", [
+    ("Tamil", "Tamil"),
+    (" hindi ", "Hindi"),
+    ("தமிழ் (Tamil)", "Tamil"),
+    ("हिंदी (Hindi)", "Hindi"),
+    ("Hindi (in Latin script)", "Hindi (in Latin script)"),
+    ("Auto (match my question)", None),
+    ("Klingon (in Latin script)", None),
+    ("French", None),
+    ("", None),
+    (None, None),
+])
+def test_normalize_language(selection, expected):
+    assert normalize_language(selection) == expected
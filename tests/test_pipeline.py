@@ -0,0 +1,305 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("dotenv")
+
+from langchain_core.chat_history import InMemoryChatMessageHistory  # noqa: E402
+from langchain_core.messages import AIMessageChunk  # noqa: E402
+
+import pipeline as pipeline_module  # noqa: E402
+from api_key_rotator import APIKeyPool  # noqa: E402
+from guardrails import REFUSAL_MESSAGE  # noqa: E402
+from pipeline import ERROR_RESPONSE, FALLBACK_RESPONSE, ExamBuddyPipeline  # noqa: E402
+from prompt_cache import PromptCache  # noqa: E402
+from rate_limiter import RateLimiter  # noqa: E402
+from response_cache import SemanticResponseCache  # noqa: E402
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedModel:
+    """
+    Stands in for the chat model. Each call takes the next outcome from
+    ``script``: an exception to raise, or text to stream word by word
+    (an exception after the text fails the call midway).
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = []
+
+    def factory(self, key):
+        self.calls.append(key)
+        outcome = self.script.pop(0)
+        return _Call(outcome if isinstance(outcome, tuple) else (outcome,))
+
+
+class _Call:
+    def __init__(self, steps):
+        self.steps = steps
+
+    def stream(self, prompt):
+        for step in self.steps:
+            if isinstance(step, Exception):
+                raise step
+            for word in step.split(" "):
+                yield AIMessageChunk(content=word + " ")
+
+    async def astream(self, prompt):
+        for chunk in self.stream(prompt):
+            yield chunk
+
+
+class Histories(dict):
+    def __missing__(self, session_id):
+        self[session_id] = InMemoryChatMessageHistory()
+        return self[session_id]
+
+
+def make_pipeline(script, keys=("key-a", "key-b", "key-c"), **overrides):
+    model = ScriptedModel(script)
+    histories = Histories()
+    options = dict(
+        llm_factory=model.factory,
+        key_pool=APIKeyPool(list(keys), base_cooldown=60),
+        rate_limiter=RateLimiter(requests_per_minute=10_000, tokens_per_minute=10_000_000),
+        response_cache=None,
+        prompt_cache=None,
+    )
+    options.update(overrides)
+    return ExamBuddyPipeline(histories.__getitem__, **options), model, histories
+
+
+def ask(chain, question="How should I revise organic chemistry for NEET?", session_id="s-1", **inputs):
+    return chain.invoke({"question": question, "exam_type": "NEET", "language": "English", **inputs},
+                        session_id=session_id)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(pipeline_module.time, "sleep", delays.append)
+    return delays
+
+
+def test_rate_limited_call_moves_to_the_next_key(no_backoff):
+    chain, model, histories = make_pipeline([StatusError(429), "Start with named reactions.", "Revise daily."])
+
+    assert ask(chain).strip() == "Start with named reactions."
+    assert model.calls[0] != model.calls[1]
+    # Retried at once, and the benched key is not picked again
+    assert no_backoff == [0.0]
+    assert ask(chain, question="How should I revise physics for NEET?") and model.calls[2] != model.calls[0]
+    assert [m.type for m in histories["s-1"].messages] == ["human", "ai", "human", "ai"]
+
+
+def test_server_error_is_retried_after_a_backoff(no_backoff):
+    chain, model, _ = make_pipeline([StatusError(503), StatusError(500), "Revise daily."])
+
+    assert ask(chain).strip() == "Revise daily."
+    assert len(model.calls) == 3
+    assert no_backoff == [0.5, 1.0]
+
+
+def test_transient_errors_give_up_after_three_calls(no_backoff):
+    chain, model, histories = make_pipeline([StatusError(503)] * 5)
+
+    with pytest.raises(StatusError):
+        ask(chain)
+    assert len(model.calls) == pipeline_module.TRANSIENT_ATTEMPTS
+    # The question and the error reply the student sees are both recorded
+    assert [m.content for m in histories["s-1"].messages][1] == ERROR_RESPONSE
+
+
+def test_client_errors_are_not_retried():
+    chain, model, _ = make_pipeline([StatusError(400), "unused"])
+
+    with pytest.raises(StatusError):
+        ask(chain)
+    assert len(model.calls) == 1
+
+
+def test_no_retry_once_text_was_streamed():
+    chain, model, histories = make_pipeline([("Start with", StatusError(503)), "unused"])
+
+    with pytest.raises(StatusError):
+        ask(chain)
+    assert len(model.calls) == 1
+    assert histories["s-1"].messages[-1].content == "Start with "
+
+
+def test_single_key_leaves_retries_to_the_client():
+    chain, model, _ = make_pipeline([StatusError(429), "unused"], keys=("only-key",))
+
+    with pytest.raises(StatusError):
+        ask(chain)
+    assert len(model.calls) == 1
+
+
+def test_async_path_retries_too(monkeypatch):
+    async def no_sleep(delay):
+        pass
+    monkeypatch.setattr(pipeline_module.asyncio, "sleep", no_sleep)
+    chain, model, _ = make_pipeline([StatusError(429), StatusError(502), "Revise daily."])
+
+    response = asyncio.run(chain.ainvoke(
+        {"question": "How should I revise organic chemistry for NEET?", "exam_type": "NEET", "language": "English"},
+        session_id="s-1"
+    ))
+    assert response.strip() == "Revise daily."
+    assert len(model.calls) == 3
+
+
+def student(name, marks, **inputs):
+    return {
+        "context": f"Student: {name}\nExam: NEET\nSubjects: Physics, Chemistry, Biology",
+        "marks": f"Student's Performance:\n- Physics: {marks}",
+        "subjects": ["Physics", "Chemistry", "Biology"],
+        "student_name": name,
+        **inputs,
+    }
+
+
+def test_second_student_gets_the_cached_answer():
+    cache = SemanticResponseCache()
+    chain, model, histories = make_pipeline(["Start with the named reactions."], response_cache=cache)
+
+    first = ask(chain, session_id="ravi", **student("Ravi", 45))
+    # Asha is mid-conversation, asks in other words and has other marks
+    histories["asha"].add_user_message("Hi")
+    histories["asha"].add_ai_message("Hello Asha!")
+    second = ask(chain, question="how do I revise NEET organic chemistry", session_id="asha",
+                 **student("Asha", 88, recent_turns=[{"role": "user", "content": "Hi"}]))
+
+    assert second == first
+    assert len(model.calls) == 1
+    assert chain.stats()["response_cache"] == 1
+    assert [m.content for m in histories["asha"].messages][-2:] == ["how do I revise NEET organic chemistry", first]
+
+
+def test_answer_naming_the_student_is_not_shared():
+    cache = SemanticResponseCache()
+    chain, model, _ = make_pipeline(
+        ["Ravi, with 45 in Physics start with mechanics.", "Start with mechanics."], response_cache=cache
+    )
+
+    ask(chain, session_id="ravi", **student("Ravi", 45))
+    ask(chain, session_id="asha", **student("Asha", 88))
+
+    assert len(model.calls) == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_other_subjects_and_follow_ups_miss():
+    cache = SemanticResponseCache()
+    chain, model, _ = make_pipeline(["Start with named reactions.", "For JEE ...", "Next, ..."], response_cache=cache)
+
+    ask(chain, session_id="ravi", **student("Ravi", 45))
+    ask(chain, session_id="kiran", **student("Kiran", 70, subjects=["Physics", "Chemistry", "Mathematics"]))
+    ask(chain, question="what should I do next after organic chemistry?", session_id="asha", **student("Asha", 88))
+
+    assert len(model.calls) == 3
+
+
+def test_prompt_cache_hits_reported_by_openai_are_counted():
+    class UsageCall:
+        def stream(self, prompt):
+            yield AIMessageChunk(content="Revise daily.")
+            # With stream_usage the last chunk carries the usage, cache hits included
+            yield AIMessageChunk(content="", usage_metadata={
+                "input_tokens": 1500, "output_tokens": 3, "total_tokens": 1503,
+                "input_token_details": {"cache_read": 1024},
+            })
+
+    chain, _, _ = make_pipeline([], llm_factory=lambda key: UsageCall())
+    ask(chain)
+
+    assert chain.stats()["prompt_tokens"] == 1500
+    assert chain.stats()["cached_prompt_tokens"] == 1024
+
+
+def contents(history):
+    return [(m.type, m.content.strip()) for m in history.messages]
+
+
+def test_question_is_saved_before_the_model_call():
+    seen = []
+
+    class RecordingCall(_Call):
+        def stream(self, prompt):
+            seen.append(contents(histories["s-1"]))
+            yield from super().stream(prompt)
+
+    chain, _, histories = make_pipeline([], llm_factory=lambda key: RecordingCall(("Revise daily.",)))
+    ask(chain)
+
+    question = ("human", "How should I revise organic chemistry for NEET?")
+    assert seen == [[question]]
+    assert contents(histories["s-1"]) == [question, ("ai", "Revise daily.")]
+
+
+def test_interrupted_stream_keeps_the_question():
+    chain, _, histories = make_pipeline(["Start with named reactions and revise them daily."])
+    stream = chain.stream({"question": "How do I revise?", "exam_type": "NEET", "language": "English"},
+                          session_id="s-1")
+    assert next(stream)
+    # The student navigated away mid-answer
+    stream.close()
+
+    assert contents(histories["s-1"]) == [("human", "How do I revise?")]
+
+
+def test_interrupted_async_stream_keeps_the_question():
+    chain, _, histories = make_pipeline(["Start with named reactions and revise them daily."])
+
+    async def run():
+        stream = chain.astream({"question": "How do I revise?", "exam_type": "NEET", "language": "English"},
+                               session_id="s-1")
+        assert await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert contents(histories["s-1"]) == [("human", "How do I revise?")]
+
+
+def test_prompt_cache_hit_saves_the_question_and_answer(tmp_path):
+    cache = PromptCache(str(tmp_path / "prompt_cache.sqlite3"))
+    chain, model, histories = make_pipeline(["Revise daily."], prompt_cache=cache)
+
+    ask(chain, session_id="s-1")
+    # Same rendered prompt from a fresh session: served without the model
+    assert ask(chain, session_id="s-2").strip() == "Revise daily."
+
+    assert len(model.calls) == 1
+    assert chain.stats()["prompt_cache"] == 1
+    assert contents(histories["s-2"]) == contents(histories["s-1"])
+    assert len(histories["s-2"].messages) == 2
+    cache.close()
+
+
+def test_refused_question_saves_nothing():
+    chain, model, histories = make_pipeline(["unused"])
+
+    assert ask(chain, question="Can you get me the leaked exam paper?") == REFUSAL_MESSAGE
+    assert model.calls == []
+    # The history is never even loaded
+    assert dict(histories) == {}
+    assert chain.stats()["refused"] == 1
+
+
+def test_empty_model_reply_saves_the_fallback():
+    # An empty script step streams no chunks at all
+    chain, _, histories = make_pipeline([()])
+
+    assert ask(chain) == FALLBACK_RESPONSE
+    assert contents(histories["s-1"])[-1] == ("ai", FALLBACK_RESPONSE)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage  # noqa: E402
+
+from prompt_cache import PromptCache  # noqa: E402
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = [
+    SystemMessage(content="You are Exam Buddy."),
+    HumanMessage(content="Hi"),
+    AIMessage(content="Hello!"),
+    HumanMessage(content="मुझे physics कैसे पढ़ना चाहिए?"),
+]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PromptCache(str(tmp_path / "prompt_cache.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def test_key_is_the_documented_hash(cache):
+    payload = json.dumps(
+        {
+            "messages": [[m.type, m.content] for m in MESSAGES],
+            "model": "gpt-4o-mini",
+            "params": {"temperature": 0.7},
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    assert cache.make_key("gpt-4o-mini", {"temperature": 0.7}, MESSAGES) == \
+        hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def test_key_is_stable_across_processes(cache):
+    # Hash randomization differs per process, so a key that depended on it
+    # would not survive a restart
+    script = (
+        "import sys; sys.path.insert(0, {repo!r})\n"
+        "from langchain_core.messages import AIMessage, HumanMessage, SystemMessage\n"
+        "from prompt_cache import PromptCache\n"
+        "messages = [SystemMessage(content='You are Exam Buddy.'), HumanMessage(content='Hi'),\n"
+        "            AIMessage(content='Hello!'), HumanMessage(content='मुझे physics कैसे पढ़ना चाहिए?')]\n"
+        "print(PromptCache(':memory:').make_key('gpt-4o-mini', {{'temperature': 0.7, 'top_p': 1}}, messages))\n"
+    ).format(repo=REPO)
+    keys = {
+        subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True,
+            env={**os.environ, "PYTHONHASHSEED": seed, "PYTHONIOENCODING": "utf-8"}
+        ).stdout.strip()
+        for seed in ("1", "2")
+    }
+    assert keys == {cache.make_key("gpt-4o-mini", {"top_p": 1, "temperature": 0.7}, MESSAGES)}
+
+
+def test_key_changes_with_any_part_of_the_prompt(cache):
+    base = cache.make_key("gpt-4o-mini", {"temperature": 0.7}, MESSAGES)
+    variants = [
+        cache.make_key("gpt-4o", {"temperature": 0.7}, MESSAGES),
+        cache.make_key("gpt-4o-mini", {"temperature": 0.2}, MESSAGES),
+        cache.make_key("gpt-4o-mini", {"temperature": 0.7}, MESSAGES[:-1]),
+        cache.make_key("gpt-4o-mini", {"temperature": 0.7}, MESSAGES[:1] + [AIMessage(content="Hi")] + MESSAGES[2:]),
+        cache.make_key("gpt-4o-mini", {"temperature": 0.7}, MESSAGES[:-1] + [HumanMessage(content="physics?")]),
+    ]
+    assert len({base, *variants}) == len(variants) + 1
+
+
+def test_rendering_the_same_turn_twice_gives_the_same_key(cache):
+    from prompts import registry
+
+    def render():
+        return registry.render_chat(
+            "mentor", "English", context="Student: Ravi\nExam: NEET",
+            history=MESSAGES[1:3], question="How do I revise organic chemistry?"
+        ).to_messages()
+
+    assert cache.make_key("gpt-4o-mini", {"temperature": 0.7}, render()) == \
+        cache.make_key("gpt-4o-mini", {"temperature": 0.7}, render())
+
+
+def test_responses_survive_a_restart(tmp_path):
+    path = str(tmp_path / "prompt_cache.sqlite3")
+    first = PromptCache(path)
+    key = first.make_key("gpt-4o-mini", {"temperature": 0.7}, MESSAGES)
+    first.put(key, "Start with NCERT.")
+    first.close()
+
+    second = PromptCache(path)
+    assert second.get(key) == "Start with NCERT."
+    assert second.stats()["hits"] == 1
+    second.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    import itertools
+    import prompt_cache
+    # A clock that always moves, so last_used never ties
+    ticks = itertools.count(1)
+    monkeypatch.setattr(prompt_cache.time, "time", lambda: float(next(ticks)))
+    cache = PromptCache(str(tmp_path / "lru.sqlite3"), max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    cache.close()
+
+
+def test_byte_limit_is_enforced(tmp_path):
+    cache = PromptCache(str(tmp_path / "bytes.sqlite3"), max_bytes=10)
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 6
+    cache.close()
+
+
+def test_sampled_calls_can_bypass_the_cache(tmp_path):
+    cache = PromptCache(str(tmp_path / "bypass.sqlite3"), bypass_sampled=True)
+
+    assert cache.make_key("gpt-4o-mini", {"temperature": 0.7}, MESSAGES) is None
+    assert cache.make_key("gpt-4o-mini", {"temperature": 0}, MESSAGES) is not None
+    assert cache.stats()["bypassed"] == 1
+    cache.close()
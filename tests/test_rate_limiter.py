@@ -0,0 +1,131 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_limiter as rate_limiter_module  # noqa: E402
+from rate_limiter import RateLimiter, estimate_tokens  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock)
+    return clock
+
+
+def empty_limiter(requests_per_minute=60, tokens_per_minute=60_000):
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    limiter._requests = 0.0
+    limiter._tokens = 0.0
+    return limiter
+
+
+def queue(limiter, key, tokens, granted):
+    limiter._enqueue(key, tokens, lambda: granted.append(key))
+
+
+def dispatch(limiter):
+    with limiter._lock:
+        return limiter._dispatch_locked()
+
+
+def test_waiting_students_are_served_round_robin(clock):
+    limiter = empty_limiter()
+    granted = []
+    # One busy student queues five calls before two others queue theirs
+    for _ in range(5):
+        queue(limiter, "busy", 10, granted)
+    queue(limiter, "second", 10, granted)
+    queue(limiter, "second", 10, granted)
+    queue(limiter, "third", 10, granted)
+
+    # 60 requests/min refills one request per second
+    for _ in range(8):
+        clock.now += 1
+        dispatch(limiter)
+
+    assert granted == ["busy", "second", "third", "busy", "second", "busy", "busy", "busy"]
+    assert limiter.queue_depth() == 0
+
+
+def test_quota_is_never_exceeded(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=60_000)
+    granted = []
+    for i in range(200):
+        queue(limiter, f"student-{i % 7}", 10, granted)
+
+    dispatch(limiter)
+    # The bucket starts full
+    assert len(granted) == 60
+    for _ in range(30):
+        clock.now += 1
+        dispatch(limiter)
+    assert len(granted) == 90
+    assert limiter.stats()["requests_available"] == 0
+
+
+def test_token_bucket_holds_back_large_calls(clock):
+    limiter = empty_limiter(requests_per_minute=600, tokens_per_minute=6000)
+    granted = []
+    queue(limiter, "a", 1000, granted)
+
+    # 6000 tokens/min refills 100 per second, so 1000 tokens take 10 seconds
+    clock.now += 1
+    assert dispatch(limiter) == pytest.approx(9.0)
+    assert granted == []
+    clock.now += 9
+    assert dispatch(limiter) == 0.0
+    assert granted == ["a"]
+
+
+def test_call_larger_than_the_quota_is_capped(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000)
+    granted = []
+    queue(limiter, "a", 50_000, granted)
+
+    dispatch(limiter)
+    assert granted == ["a"]
+
+
+def test_cancelled_acquire_leaves_the_queue():
+    limiter = empty_limiter(requests_per_minute=1, tokens_per_minute=1000)
+
+    async def run():
+        task = asyncio.create_task(limiter.acquire("a", 10))
+        await asyncio.sleep(0.05)
+        assert limiter.queue_depth() == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert limiter.queue_depth() == 0
+
+
+def test_acquire_returns_at_once_with_quota():
+    limiter = RateLimiter(requests_per_minute=10, tokens_per_minute=10_000)
+
+    asyncio.run(limiter.acquire("a", 100))
+    limiter.acquire_blocking("b", 100)
+
+    stats = limiter.stats()
+    assert stats["granted"] == 2
+    assert stats["requests_available"] == 8
+    assert stats["queue_depth"] == 0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("x" * 400) == 101 + 400
+    assert estimate_tokens("", completion_tokens=0) == 1
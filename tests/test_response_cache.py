@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import (  # noqa: E402
+    SemanticResponseCache,
+    context_scope,
+    is_cacheable,
+    mentions_any,
+    normalize_question,
+)
+
+PCB = context_scope("Physics", "Chemistry", "Biology")
+PCM = context_scope("Physics", "Chemistry", "Mathematics")
+
+
+def test_answers_are_scoped_by_subjects():
+    cache = SemanticResponseCache()
+    question = "How should I revise Physics mechanics for NEET?"
+    cache.put(question, "Start with NCERT examples.", "NEET", "English", PCB)
+
+    assert cache.get(question, "NEET", "English", context_scope("Biology", "physics", "Chemistry")) == "Start with NCERT examples."
+    assert cache.get(question, "NEET", "English", PCM) is None
+    assert cache.get(question, "NEET", "Hindi", PCB) is None
+    assert cache.get(question, "JEE Mains", "English", PCB) is None
+
+
+def test_follow_up_questions_are_never_cached():
+    cache = SemanticResponseCache()
+    cache.put("What should I do next?", "Ravi, with 45 in Physics ...", "NEET", "English")
+    cache.put("Can you explain that again?", "As I said about your marks ...", "NEET", "English")
+
+    assert cache.get("what next", "NEET", "English") is None
+    assert cache.get("explain that again", "NEET", "English") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_generic_question_is_shared_without_context():
+    cache = SemanticResponseCache()
+    cache.put("How to prepare organic chemistry for NEET", "Start with named reactions.", "NEET", "English")
+
+    assert cache.get("how do I prepare for NEET organic chemistry?", "NEET", "English") == "Start with named reactions."
+
+
+def test_is_cacheable():
+    assert is_cacheable(normalize_question("How should I revise organic chemistry for NEET?"))
+    assert not is_cacheable(normalize_question("What should I do next?"))
+    assert not is_cacheable(normalize_question("explain it"))
+    assert not is_cacheable(normalize_question("physics tips"))
+
+
+def test_context_scope():
+    assert context_scope("", " ", None) == ""
+    assert PCB != PCM
+    assert PCB == context_scope("biology", "Chemistry", "Physics", "Physics")
+
+
+def test_mentions_any():
+    answer = "Ravi, with 45 in Physics you should revise mechanics."
+    assert mentions_any(answer, ["Ravi"])
+    assert mentions_any(answer, ["45"])
+    assert not mentions_any(answer, ["Asha", "88", ""])
+    # Whole words only
+    assert not mentions_any("Revise daily", ["Ravi"])
+    assert not mentions_any("Solve 145 problems", ["45"])
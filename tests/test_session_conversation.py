@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from bson import ObjectId  # noqa: E402
+
+from db_utils import MongoDBManager  # noqa: E402
+
+
+class FakeSessions:
+    """Just enough of a collection for find_one with an $or filter and $slice."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find_one(self, query, projection=None):
+        clauses = query.get("$or", [query])
+        for doc in self.docs:
+            if any(all(doc.get(k) == v for k, v in clause.items()) for clause in clauses):
+                limit = (projection or {}).get("conversation", {}).get("$slice")
+                return {**doc, "conversation": doc["conversation"][limit:]} if limit else doc
+        return None
+
+
+def make_manager(docs):
+    manager = MongoDBManager.__new__(MongoDBManager)
+    manager.sessions = FakeSessions(docs)
+    return manager
+
+
+def test_recent_turns_found_by_session_id():
+    oid = ObjectId()
+    conversation = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(10)]
+    manager = make_manager([{"_id": oid, "session_id": "s-1", "student_id": ObjectId(), "conversation": conversation}])
+
+    # The app keys sessions by str(_id); older code passes the session_id field
+    assert manager.get_session_conversation(str(oid)) == conversation
+    assert manager.get_session_conversation("s-1", limit=6) == conversation[-6:]
+    # Querying by student_id with a session id finds nothing, which was the bug
+    assert manager.get_conversation(str(oid)) == []
+
+
+def test_unknown_session_has_no_turns():
+    assert make_manager([]).get_session_conversation(str(ObjectId())) == []
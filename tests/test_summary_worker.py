@@ -0,0 +1,271 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("dotenv")
+mongomock = pytest.importorskip("mongomock")
+
+from summary_worker import ACTIVE_JOB_INDEX, DONE, FAILED, SummaryWorker  # noqa: E402
+
+
+@pytest.fixture
+def jobs():
+    # A fresh collection, without the indexes db_migrations would build
+    return mongomock.MongoClient().db.summary_jobs
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class BlockingHandler:
+    """Records jobs; the first one waits until release() is called."""
+
+    def __init__(self):
+        self.sessions = []
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self, job):
+        self.sessions.append(job["session_id"])
+        if len(self.sessions) == 1:
+            self.started.set()
+            self._release.wait(5)
+
+    def release(self):
+        self._release.set()
+
+
+def test_first_enqueue_creates_the_active_job_index(jobs):
+    worker = SummaryWorker(handler=lambda job: None, collection=jobs)
+    try:
+        assert worker.enqueue("student-1", "s-1")
+    finally:
+        worker.stop()
+
+    index = jobs.index_information()[ACTIVE_JOB_INDEX["name"]]
+    assert index["unique"] is True
+    assert index["partialFilterExpression"] == {"active": True}
+
+
+def test_conflicting_index_fails_the_enqueue(jobs):
+    jobs.create_index([("student_id", 1)], name=ACTIVE_JOB_INDEX["name"], unique=True)
+    worker = SummaryWorker(handler=lambda job: None, collection=jobs)
+
+    assert worker.enqueue("student-1", "s-1") is False
+    assert jobs.count_documents({}) == 0
+    worker.stop()
+
+
+def test_repeated_enqueues_share_one_active_job(jobs):
+    handler = BlockingHandler()
+    worker = SummaryWorker(handler=handler, collection=jobs)
+    try:
+        assert worker.enqueue("student-1", "s-1")
+        assert handler.started.wait(5)
+        for _ in range(3):
+            assert worker.enqueue("student-1", "s-1")
+        worker.enqueue("student-2", "s-9")
+
+        assert jobs.count_documents({"student_id": "student-1", "active": True}) == 1
+        assert worker.stats()["enqueued"] == 2
+        assert worker.stats()["deduplicated"] == 3
+    finally:
+        handler.release()
+        wait_for(lambda: jobs.count_documents({"active": True}) == 0)
+        worker.stop()
+
+
+def test_concurrent_enqueues_without_migrations_stay_deduplicated(jobs):
+    handler = BlockingHandler()
+    worker = SummaryWorker(handler=handler, collection=jobs)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def enqueue():
+        barrier.wait()
+        results.append(worker.enqueue("student-1", "s-1"))
+
+    threads = [threading.Thread(target=enqueue) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [True] * 8
+        assert jobs.count_documents({"student_id": "student-1"}) == 1
+    finally:
+        handler.release()
+        worker.stop()
+
+
+def test_enqueue_while_running_runs_the_job_again(jobs):
+    handler = BlockingHandler()
+    worker = SummaryWorker(handler=handler, collection=jobs)
+    try:
+        worker.enqueue("student-1", "s-1")
+        assert handler.started.wait(5)
+        # New messages arrived in another session while summarizing
+        worker.enqueue("student-1", "s-2")
+        handler.release()
+
+        wait_for(lambda: jobs.count_documents({"status": DONE}) == 1)
+    finally:
+        worker.stop()
+
+    assert handler.sessions == ["s-1", "s-2"]
+    job = jobs.find_one({"student_id": "student-1"})
+    assert "active" not in job
+    assert job["dirty"] is False
+    assert worker.stats()["completed"] == 2
+
+
+def test_failed_job_is_retried_then_marked_failed(jobs):
+    calls = []
+
+    def handler(job):
+        calls.append(job["attempts"])
+        raise RuntimeError("LLM down")
+
+    worker = SummaryWorker(handler=handler, collection=jobs, max_attempts=2, base_backoff=0)
+    try:
+        worker.enqueue("student-1", "s-1")
+        # No backoff, so the same drain picks the retry up at once
+        wait_for(lambda: jobs.count_documents({"status": FAILED}) == 1)
+    finally:
+        worker.stop()
+
+    assert calls == [1, 2]
+    job = jobs.find_one({"student_id": "student-1"})
+    assert job["error"] == "LLM down"
+    assert "active" not in job
+    assert worker.stats()["retried"] == 1 and worker.stats()["failed"] == 1
+
+
+class FakeSummarizer:
+    """Stands in for exam_buddy.generate_summary and records each chunk."""
+
+    def __init__(self, on_call=None):
+        self.chunks = []
+        self.on_call = on_call
+
+    def __call__(self, messages, previous_summary=""):
+        self.chunks.append([m["content"] for m in messages])
+        if self.on_call:
+            self.on_call(len(self.chunks))
+        return previous_summary + "".join(m["content"] for m in messages)
+
+
+@pytest.fixture
+def summarize(monkeypatch):
+    import exam_buddy
+    summarizer = FakeSummarizer()
+    monkeypatch.setattr(exam_buddy, "generate_summary", summarizer)
+    return summarizer
+
+
+@pytest.fixture
+def sessions():
+    return mongomock.MongoClient().db.exam_buddy_session
+
+
+def conversation(*contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": c} for i, c in enumerate(contents)]
+
+
+def test_only_new_messages_are_summarized(sessions, summarize):
+    from summary_worker import update_rolling_summary
+    sessions.insert_one({"session_id": "s-1", "conversation": conversation("a", "b"), "message_count": 2})
+
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) == "ab"
+    sessions.update_one(
+        {"session_id": "s-1"},
+        {"$push": {"conversation": {"$each": conversation("c", "d")}}, "$inc": {"message_count": 2}}
+    )
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) == "abcd"
+    # Nothing new: the stored summary comes back without an LLM call
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) == "abcd"
+
+    assert summarize.chunks == [["a", "b"], ["c", "d"]]
+    session = sessions.find_one({"session_id": "s-1"})
+    assert session["summary_watermark"] == 4
+    assert session["context"] == "abcd"
+
+
+def test_watermark_counts_messages_sliced_off_the_conversation(sessions, summarize):
+    from summary_worker import update_rolling_summary
+    # 30 messages were written, only the last 10 are still held
+    held = conversation(*"klmnopqrst")
+    sessions.insert_one({"session_id": "s-1", "conversation": held, "message_count": 30,
+                         "summary": "old", "summary_watermark": 25})
+
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) == "oldpqrst"
+    assert sessions.find_one({"session_id": "s-1"})["summary_watermark"] == 30
+
+    # A watermark behind the slice folds in everything still held
+    sessions.update_one({"session_id": "s-1"}, {"$set": {"summary_watermark": 12, "summary": ""}})
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) == "klmnopqrst"
+
+
+def test_sessions_without_message_count_count_what_they_hold(sessions, summarize):
+    from summary_worker import update_rolling_summary
+    sessions.insert_one({"session_id": "s-1", "conversation": conversation("a", "b", "c")})
+
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) == "abc"
+    assert sessions.find_one({"session_id": "s-1"})["summary_watermark"] == 3
+
+
+def test_empty_session_has_no_summary(sessions, summarize):
+    from summary_worker import update_rolling_summary
+    sessions.insert_one({"session_id": "s-1", "conversation": []})
+
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) is None
+    assert update_rolling_summary(sessions, {"session_id": "missing"}) is None
+    assert summarize.chunks == []
+
+
+def test_chunks_are_bounded_and_progress_is_saved(sessions, summarize, monkeypatch):
+    import summary_worker
+    monkeypatch.setattr(summary_worker, "SUMMARY_CHUNK_MESSAGES", 4)
+    monkeypatch.setattr(summary_worker, "SUMMARY_CHUNK_CHARS", 6)
+    sessions.insert_one({"session_id": "s-1", "conversation": conversation(*"abcdefghij", "xxxxx"),
+                         "message_count": 11})
+
+    def fail_third(calls):
+        if calls == 3:
+            raise RuntimeError("LLM down")
+    summarize.on_call = fail_third
+
+    with pytest.raises(RuntimeError):
+        summary_worker.update_rolling_summary(sessions, {"session_id": "s-1"})
+    # The first two chunks stay folded in; the retry starts after them
+    assert sessions.find_one({"session_id": "s-1"})["summary_watermark"] == 8
+    summarize.on_call = None
+    assert summary_worker.update_rolling_summary(sessions, {"session_id": "s-1"}) == "abcdefghijxxxxx"
+
+    assert summarize.chunks == [list("abcd"), list("efgh"), list("ij"), list("ij"), ["xxxxx"]]
+
+
+def test_losing_the_watermark_race_returns_the_winners_summary(sessions, summarize):
+    from summary_worker import update_rolling_summary
+    sessions.insert_one({"session_id": "s-1", "conversation": conversation("a", "b"), "message_count": 2,
+                         "summary": "", "summary_watermark": 0})
+
+    def other_worker_saves(calls):
+        # A second worker folds the same messages in while this one waits on the LLM
+        sessions.update_one({"session_id": "s-1"}, {"$set": {"summary": "theirs", "summary_watermark": 2}})
+    summarize.on_call = other_worker_saves
+
+    assert update_rolling_summary(sessions, {"session_id": "s-1"}) == "theirs"
+    session = sessions.find_one({"session_id": "s-1"})
+    assert (session["summary"], session["summary_watermark"]) == ("theirs", 2)